@@ -1,5 +1,5 @@
 """
-Simple HTTP multithreaded server.
+Simple HTTP multithreaded / event-driven server.
 
 Serves static files in specified document root. Accepts GET and HEAD
 HTTP methods.
@@ -13,7 +13,9 @@ import sys
 from argparse import ArgumentParser
 from pathlib import Path
 
-from . import httpd
+from . import autoindex, httpd
+from .accesslog import AccessLog
+from .cache import FileCache, PathCache
 from .httpd import logging
 
 
@@ -42,6 +44,123 @@ def parse_args():
         default=8080,
         type=int,
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help=(
+            "Connection handling engine: a thread per connection "
+            "or a single epoll event loop [Default: threads]."
+        ),
+        choices=httpd.ENGINES,
+        default="threads",
+    )
+    parser.add_argument(
+        "--processes",
+        help=(
+            "Number of worker processes sharing the port, each one runs "
+            "the engine [Default: 1]."
+        ),
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--reuse-port",
+        help=(
+            "Every worker process listens on its own SO_REUSEPORT socket "
+            "instead of a shared one, connections queued on a stopped "
+            "worker are reset on reload."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-connections",
+        help=(
+            "Max number of connections served by a process at once, "
+            "connections over it are answered with 503 "
+            "[Default: unlimited]."
+        ),
+        type=int,
+    )
+    parser.add_argument(
+        "--grace-period",
+        help=(
+            "Time in seconds to finish in-flight requests on SIGINT / "
+            f"SIGTERM [Default: {httpd.STOP_TIMEOUT}]."
+        ),
+        default=httpd.STOP_TIMEOUT,
+        type=float,
+    )
+    parser.add_argument(
+        "--metrics-path",
+        help=(
+            "Reserved path to report request metrics on in Prometheus "
+            "text format, e.g. /metrics [Default: disabled]."
+        ),
+    )
+    parser.add_argument(
+        "--cache-size",
+        help="Memory for cached files in bytes, 0 to disable [Default: 0].",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache-max-file-size",
+        help="Max size of a cached file in bytes [Default: 262144].",
+        default=256 * 1024,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache-revalidate",
+        help=(
+            "Interval in seconds to check cached files for changes "
+            "[Default: 1]."
+        ),
+        default=1.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--compression-cache-size",
+        help=(
+            "Memory for files compressed on the fly in bytes, "
+            "0 to disable compression on the fly [Default: 0]."
+        ),
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--compression-max-file-size",
+        help=(
+            "Max size of a file to compress on the fly in bytes "
+            "[Default: 1048576]."
+        ),
+        default=1024 * 1024,
+        type=int,
+    )
+    parser.add_argument(
+        "--path-cache-size",
+        help=(
+            "Number of resolved request paths to remember, 0 to disable "
+            "[Default: 10000]."
+        ),
+        default=10000,
+        type=int,
+    )
+    parser.add_argument(
+        "--autoindex",
+        help=(
+            "List directories without index.html instead of answering "
+            "with 404."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--access-log",
+        help=(
+            "File to write access log to in Combined Log Format by "
+            "a background thread, requests are not logged to stderr then."
+        ),
+        type=Path,
+    )
 
     return parser.parse_args()
 
@@ -63,4 +182,59 @@ if port < 1:
     logging.error("Ivalid port to listen.")
     sys.exit()
 
-httpd.serve_forever(args.address, port, document_root.resolve(), n_workers)
+if args.processes < 1:
+    logging.error("Invalid number of processes.")
+    sys.exit()
+
+if args.max_connections is not None and args.max_connections < 1:
+    logging.error("Invalid max number of connections.")
+    sys.exit()
+
+if args.grace_period < 0:
+    logging.error("Invalid grace period.")
+    sys.exit()
+
+cache = None
+if args.cache_size > 0:
+    cache = FileCache(
+        args.cache_size, args.cache_max_file_size, args.cache_revalidate
+    )
+
+compression_cache = None
+if args.compression_cache_size > 0:
+    compression_cache = FileCache(
+        args.compression_cache_size,
+        args.compression_max_file_size,
+        args.cache_revalidate,
+    )
+
+paths = None
+if args.path_cache_size > 0:
+    paths = PathCache(args.path_cache_size)
+
+listings = None
+if args.autoindex:
+    listings = FileCache(autoindex.CACHE_SIZE, autoindex.CACHE_SIZE, 0)
+
+access_log = None
+if args.access_log is not None:
+    access_log = AccessLog(args.access_log.resolve())
+
+httpd.serve_forever(
+    args.address,
+    port,
+    document_root.resolve(),
+    n_workers,
+    args.engine,
+    cache=cache,
+    compression_cache=compression_cache,
+    paths=paths,
+    autoindex=args.autoindex,
+    listings=listings,
+    n_processes=args.processes,
+    reuse_port=args.reuse_port,
+    metrics_path=args.metrics_path,
+    access_log=access_log,
+    max_connections=args.max_connections,
+    grace_period=args.grace_period,
+)
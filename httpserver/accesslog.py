@@ -0,0 +1,154 @@
+"""
+Access log in Combined Log Format written by a background thread.
+
+Request workers only append a tuple to an in-memory queue, lines are
+formatted and written to the file by a writer thread in batches once
+per `FLUSH_INTERVAL`. Workers never wait for the disk: when the queue
+is more than half full only every `SAMPLE_EVERY`-th record is kept,
+when it is full records are dropped. Numbers of skipped records are
+reported to the error log.
+
+Every process writes with its own thread to the same file opened with
+`O_APPEND`, so batches of worker processes don't overwrite each other.
+
+"""
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+from pathlib import Path
+from typing import Deque, Optional, Tuple
+
+from .types import HTTPRequest, HTTPResponse, HTTPStatus
+
+
+QUEUE_SIZE = 10000
+SAMPLE_EVERY = 10
+FLUSH_INTERVAL = 0.5
+
+# Time, client address, request (None if it is malformed),
+# status and size of a response body
+Record = Tuple[float, str, Optional[HTTPRequest], HTTPStatus, int]
+
+
+class AccessLog:
+    """Queue of access log records and their writer.
+
+    `start` must be called in a process which records requests
+    (after it has been forked), `stop` writes the remaining records.
+    """
+
+    def __init__(self, path: Path, queue_size: int = QUEUE_SIZE):
+        self.path = path
+        self.queue_size = queue_size
+        # `deque.append` and `popleft` are thread-safe without locks
+        self.records: Deque[Record] = deque()
+        self.n_offered = 0
+        self.n_skipped = 0
+        self.fd: Optional[int] = None
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.formatted_at = 0
+        self.formatted_time = ""
+
+    def start(self) -> None:
+        self.fd = os.open(
+            self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return None
+
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        os.close(self.fd)
+        self.fd = None
+
+    def record(
+        self,
+        addr: Tuple,
+        request: Optional[HTTPRequest],
+        response: HTTPResponse,
+    ) -> None:
+        """Queue a record of a response sent, skip it if the queue is busy.
+        """
+        backlog = len(self.records)
+        if backlog >= self.queue_size // 2:
+            self.n_offered += 1
+            if backlog >= self.queue_size or self.n_offered % SAMPLE_EVERY:
+                self.n_skipped += 1
+                return None
+
+        size = len(response.body) + sum(
+            len(prefix) + count for prefix, _, count in response.file_parts
+        )
+        self.records.append(
+            (time.time(), addr[0], request, response.status, size)
+        )
+
+    def run(self) -> None:
+        while not self.stopping.wait(FLUSH_INTERVAL):
+            self.flush()
+        self.flush()
+
+    def flush(self) -> None:
+        """Write all queued records in one go.
+        """
+        lines = []
+        for _ in range(len(self.records)):
+            lines.append(self.format(self.records.popleft()))
+
+        data = "".join(lines).encode("utf-8", "backslashreplace")
+        try:
+            while data:
+                data = data[os.write(self.fd, data) :]
+        except OSError:
+            logging.exception(f"Can't write access log {self.path}.")
+
+        if self.n_skipped:
+            n_skipped, self.n_skipped = self.n_skipped, 0
+            logging.warning(f"{n_skipped} access log records skipped.")
+
+    def format(self, record: Record) -> str:
+        timestamp, host, request, status, size = record
+
+        # Time is formatted once per second
+        second = int(timestamp)
+        if second != self.formatted_at:
+            self.formatted_at = second
+            self.formatted_time = time.strftime(
+                "%d/%b/%Y:%H:%M:%S %z", time.localtime(second)
+            )
+
+        if request is None:
+            request_line = referer = user_agent = "-"
+        else:
+            request_line = escape(
+                f"{request.method} {request.target} {request.version}"
+            )
+            referer = escape(request.headers.get("referer", "-"))
+            user_agent = escape(request.headers.get("user-agent", "-"))
+
+        return (
+            f"{host} - - [{self.formatted_time}] "
+            f'"{request_line}" {status.value[0]} {size or "-"} '
+            f'"{referer}" "{user_agent}"\n'
+        )
+
+
+def escape(value: str) -> str:
+    """Escape a value to be put in double quotes.
+    """
+    if value.isprintable():
+        value = value.replace("\\", "\\\\")
+    else:
+        # Backslashes are escaped too
+        value = value.encode("unicode_escape").decode("ascii")
+    return value.replace('"', '\\"')
@@ -0,0 +1,104 @@
+import html
+import os
+import time
+import urllib.parse
+
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+
+# Entries of a directory listed on a page
+PAGE_SIZE = 1000
+# Memory for rendered listings, they are cached by directory and page
+CACHE_SIZE = 16 * 1024 * 1024
+CONTENT_TYPE = "text/html; charset=utf-8"
+
+
+class DirEntry(NamedTuple):
+    name: str
+    is_dir: bool
+    size: int
+    mtime: float
+
+
+def list_directory(directory: Path) -> List[DirEntry]:
+    """Entries of a directory, subdirectories first, hidden ones skipped.
+    """
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+                is_dir = entry.is_dir()
+            except OSError:
+                # Broken symlink or removed meanwhile
+                continue
+            entries.append(
+                DirEntry(entry.name, is_dir, stat.st_size, stat.st_mtime)
+            )
+
+    entries.sort(key=lambda entry: (not entry.is_dir, entry.name))
+    return entries
+
+
+def n_pages(n_entries: int) -> int:
+    return max(1, -(-n_entries // PAGE_SIZE))
+
+
+def parse_page(query: str) -> Optional[int]:
+    """Number of a page requested in a query string, None if it's invalid.
+    """
+    values = urllib.parse.parse_qs(query).get("page", ["1"])
+    if not values[-1].isdigit() or int(values[-1]) < 1:
+        return None
+    return int(values[-1])
+
+
+def render_listing(path: str, entries: List[DirEntry], page: int) -> bytes:
+    """Render a page of a directory listing.
+
+    `path` is the requested path of the directory ending with a slash.
+    """
+    title = html.escape(f"Index of {path}")
+    quoted = urllib.parse.quote(path)
+    lines = [
+        "<!DOCTYPE html>",
+        "<html>",
+        f"<head><meta charset=\"utf-8\"><title>{title}</title></head>",
+        "<body>",
+        f"<h1>{title}</h1>",
+        "<table>",
+        "<tr><th>Name</th><th>Last modified</th><th>Size</th></tr>",
+    ]
+    if path != "/":
+        parent = urllib.parse.quote(path[:-1].rpartition("/")[0] + "/")
+        lines.append(
+            f'<tr><td><a href="{parent}">../</a></td><td></td><td></td></tr>'
+        )
+
+    start = (page - 1) * PAGE_SIZE
+    for entry in entries[start : start + PAGE_SIZE]:
+        name = entry.name + "/" if entry.is_dir else entry.name
+        href = quoted + urllib.parse.quote(name)
+        mtime = time.strftime("%Y-%m-%d %H:%M", time.gmtime(entry.mtime))
+        size = "-" if entry.is_dir else str(entry.size)
+        lines.append(
+            f'<tr><td><a href="{href}">{html.escape(name)}</a></td>'
+            f"<td>{mtime}</td><td>{size}</td></tr>"
+        )
+    lines.append("</table>")
+
+    total = n_pages(len(entries))
+    if total > 1:
+        links = []
+        if page > 1:
+            links.append(f'<a href="{quoted}?page={page - 1}">Previous</a>')
+        links.append(f"Page {page} of {total}")
+        if page < total:
+            links.append(f'<a href="{quoted}?page={page + 1}">Next</a>')
+        lines.append(f"<p>{' | '.join(links)}</p>")
+
+    lines.extend(("</body>", "</html>", ""))
+    return "\n".join(lines).encode("utf-8")
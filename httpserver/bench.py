@@ -0,0 +1,429 @@
+"""
+Load generator and benchmark for the HTTP server.
+
+Starts the server on localhost for every combination of engines, numbers
+of workers and processes given, requests files of a document tree with
+concurrent clients and reports throughput and latency percentiles.
+With --port an already running local server is benchmarked instead.
+Clients are threads of --client-processes processes, a single Python
+process may saturate before a multi-process server does.
+
+"""
+import itertools
+import logging
+import multiprocessing as mp
+import socket
+import threading
+import time
+import urllib.parse
+
+from argparse import ArgumentParser
+from http.client import HTTPConnection
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from . import httpd
+
+
+HOST = "127.0.0.1"
+DEFAULT_ROOT = Path(__file__).parent / "tests"
+DEFAULT_TREE = "httptest"
+SERVER_START_TIMEOUT = 5
+REQUEST_TIMEOUT = 10
+
+
+class RunResult(NamedTuple):
+    label: str
+    requests: int
+    errors: int
+    elapsed: float
+    # Sorted latencies of successful requests in seconds
+    latencies: List[float]
+
+    @property
+    def rps(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Latency percentile (nearest rank) in seconds.
+        """
+        if not self.latencies:
+            return float("nan")
+        rank = max(1, round(p / 100 * len(self.latencies)))
+        return self.latencies[min(rank, len(self.latencies)) - 1]
+
+
+def collect_targets(root: Path, tree: str) -> List[str]:
+    """URL paths of files with allowed content types in a document tree.
+    """
+    targets = []
+    for path in sorted(Path(root, tree).rglob("*")):
+        if path.is_file() and path.suffix in httpd.ALLOWED_CONTENT_TYPES:
+            relative = path.relative_to(root).as_posix()
+            targets.append("/" + urllib.parse.quote(relative))
+    return targets
+
+
+def client(
+    port: int,
+    targets: List[str],
+    method: str,
+    keep_alive: bool,
+    deadline: float,
+    latencies: List[float],
+    errors: List[int],
+) -> None:
+    """Send requests one after another until the deadline.
+    """
+    conn: Optional[HTTPConnection] = None
+    headers = {} if keep_alive else {"Connection": "close"}
+    n_errors = 0
+
+    for target in itertools.cycle(targets):
+        if time.monotonic() >= deadline:
+            break
+
+        if conn is None:
+            conn = HTTPConnection(HOST, port, timeout=REQUEST_TIMEOUT)
+
+        started = time.perf_counter()
+        try:
+            conn.request(method, target, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, ValueError):
+            n_errors += 1
+            conn.close()
+            conn = None
+            continue
+
+        latency = time.perf_counter() - started
+        if response.status >= 400:
+            n_errors += 1
+        else:
+            latencies.append(latency)
+
+        if response.will_close:
+            conn.close()
+            conn = None
+
+    if conn is not None:
+        conn.close()
+    errors.append(n_errors)
+
+
+def run_clients(
+    port: int,
+    targets: List[str],
+    clients: range,
+    concurrency: int,
+    duration: float,
+    method: str,
+    keep_alive: bool,
+) -> Tuple[List[float], int]:
+    """Run some of `concurrency` clients in threads for `duration` seconds.
+
+    Returns latencies of successful requests and the number of errors.
+    """
+    latencies: List[float] = []
+    errors: List[int] = []
+    deadline = time.monotonic() + duration
+
+    threads = []
+    for n in clients:
+        # Every client starts from its own file to spread the load
+        shift = n * len(targets) // concurrency
+        threads.append(
+            threading.Thread(
+                target=client,
+                args=(
+                    port,
+                    targets[shift:] + targets[:shift],
+                    method,
+                    keep_alive,
+                    deadline,
+                    latencies,
+                    errors,
+                ),
+            )
+        )
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors)
+
+
+def run_load(
+    port: int,
+    targets: List[str],
+    concurrency: int,
+    duration: float,
+    method: str = "GET",
+    keep_alive: bool = True,
+    label: str = "",
+    n_processes: int = 1,
+) -> RunResult:
+    """Load a server with `concurrency` clients for `duration` seconds.
+
+    Clients are spread over `n_processes` processes, so the load is not
+    bound by the GIL of a single one.
+    """
+    n_processes = max(1, min(n_processes, concurrency))
+    shares = [range(n, concurrency, n_processes) for n in range(n_processes)]
+    args = [
+        (port, targets, clients, concurrency, duration, method, keep_alive)
+        for clients in shares
+    ]
+
+    if n_processes == 1:
+        started = time.monotonic()
+        parts = [run_clients(*args[0])]
+        elapsed = time.monotonic() - started
+    else:
+        with mp.Pool(n_processes) as pool:
+            started = time.monotonic()
+            parts = pool.starmap(run_clients, args)
+            elapsed = time.monotonic() - started
+
+    latencies = [latency for part, _ in parts for latency in part]
+    errors = sum(n_errors for _, n_errors in parts)
+    return RunResult(
+        label=label,
+        requests=len(latencies) + errors,
+        errors=errors,
+        elapsed=elapsed,
+        latencies=sorted(latencies),
+    )
+
+
+def wait_for_port(port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((HOST, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def run_server(
+    port: int, root: Path, engine: str, n_workers: int, n_processes: int
+) -> None:
+    """Entry point of a benchmarked server process.
+    """
+    # Access log would dominate the measurements
+    logging.disable(logging.INFO)
+    httpd.serve_forever(
+        HOST, port, root, n_workers, engine, n_processes=n_processes
+    )
+
+
+def benchmark_server(
+    root: Path,
+    targets: List[str],
+    engine: str,
+    n_workers: int,
+    n_processes: int,
+    args,
+) -> Optional[RunResult]:
+    """Start a local server with given settings and load it.
+    """
+    label = f"{engine:<8}{n_workers:>8}{n_processes:>10}"
+    port = find_free_port()
+    server = mp.Process(
+        target=run_server, args=(port, root, engine, n_workers, n_processes)
+    )
+    server.start()
+
+    try:
+        if not wait_for_port(port, SERVER_START_TIMEOUT):
+            logging.error(f"Server {label.split()} has not started.")
+            return None
+
+        if args.warmup:
+            run_load(
+                port,
+                targets,
+                args.concurrency,
+                args.warmup,
+                n_processes=args.client_processes,
+            )
+
+        return run_load(
+            port,
+            targets,
+            args.concurrency,
+            args.duration,
+            args.method,
+            not args.no_keep_alive,
+            label,
+            args.client_processes,
+        )
+    finally:
+        server.terminate()
+        server.join()
+
+
+def print_results(results: List[RunResult], header: str) -> None:
+    print(
+        f"{header}{'requests':>10}{'errors':>8}{'req/s':>10}"
+        f"{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}"
+    )
+    for result in results:
+        print(
+            f"{result.label}{result.requests:>10}{result.errors:>8}"
+            f"{result.rps:>10.1f}"
+            f"{result.percentile(50) * 1000:>10.2f}"
+            f"{result.percentile(95) * 1000:>10.2f}"
+            f"{result.percentile(99) * 1000:>10.2f}"
+        )
+
+
+def parse_args():
+    """Parse command line arguments.
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-r",
+        "--root",
+        help=f"Document root [Default: {DEFAULT_ROOT}].",
+        default=DEFAULT_ROOT,
+        type=Path,
+    )
+    parser.add_argument(
+        "-t",
+        "--tree",
+        help=(
+            f"Directory inside the root to request files from "
+            f"[Default: {DEFAULT_TREE}]."
+        ),
+        default=DEFAULT_TREE,
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="Engines to compare [Default: threads].",
+        nargs="+",
+        choices=httpd.ENGINES,
+        default=["threads"],
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Numbers of workers to compare [Default: 4].",
+        nargs="+",
+        default=[4],
+        type=int,
+    )
+    parser.add_argument(
+        "--processes",
+        help="Numbers of server processes to compare [Default: 1].",
+        nargs="+",
+        default=[1],
+        type=int,
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        help="Benchmark a server already running on this local port.",
+        type=int,
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        help="Number of concurrent clients [Default: 10].",
+        default=10,
+        type=int,
+    )
+    parser.add_argument(
+        "--client-processes",
+        help="Number of processes running the clients [Default: 1].",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        help="Duration of every run in seconds [Default: 10].",
+        default=10.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--warmup",
+        help="Warm up duration before every run in seconds [Default: 1].",
+        default=1.0,
+        type=float,
+    )
+    parser.add_argument(
+        "-m",
+        "--method",
+        help="HTTP method [Default: GET].",
+        choices=("GET", "HEAD"),
+        default="GET",
+    )
+    parser.add_argument(
+        "--no-keep-alive",
+        help="Open a new connection for every request.",
+        action="store_true",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    root = args.root.resolve()
+    targets = collect_targets(root, args.tree)
+    if not targets:
+        logging.error(f"No files to request in {root / args.tree}.")
+        return None
+
+    print(
+        f"{len(targets)} files, {args.concurrency} clients, "
+        f"{args.duration} s per run, {args.method}, "
+        f"keep-alive: {'off' if args.no_keep_alive else 'on'}"
+    )
+
+    if args.port is not None:
+        result = run_load(
+            args.port,
+            targets,
+            args.concurrency,
+            args.duration,
+            args.method,
+            not args.no_keep_alive,
+            label=f"{HOST}:{args.port}",
+            n_processes=args.client_processes,
+        )
+        print_results([result], f"{'server':<16}")
+        return None
+
+    results = []
+    for engine, n_workers, n_processes in itertools.product(
+        args.engine, args.workers, args.processes
+    ):
+        if engine == "epoll" and n_workers != args.workers[0]:
+            # Number of workers doesn't matter for the event loop
+            continue
+
+        result = benchmark_server(
+            root, targets, engine, n_workers, n_processes, args
+        )
+        if result is not None:
+            results.append(result)
+
+    print_results(results, f"{'engine':<8}{'workers':>8}{'processes':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, Iterable, NamedTuple, Optional, Tuple
+
+from .types import HTTPStatus
+
+
+# Timestamps of files are taken from a coarse clock: a directory changed
+# again within this interval may keep its mtime, so it can't be trusted
+MTIME_GRANULARITY = 0.1
+
+# inode, size, mtime in nanoseconds
+FileKey = Tuple[int, int, int]
+# Directories with their mtimes in nanoseconds, None if one is missing
+DirKey = Tuple[Tuple[str, Optional[int]], ...]
+
+
+def stat_key(stat: os.stat_result) -> FileKey:
+    """Fingerprint of a file used to detect its changes.
+    """
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def dir_key(dirs: Iterable[str]) -> DirKey:
+    """Fingerprint of directories used to detect their entries changes.
+    """
+    key = []
+    for path in dirs:
+        try:
+            mtime: Optional[int] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        key.append((path, mtime))
+    return tuple(key)
+
+
+class CacheEntry(NamedTuple):
+    path: Path
+    index: bool
+    content_type: str
+    headers: bytes
+    body: bytes
+    key: FileKey
+
+    @property
+    def size(self) -> int:
+        return len(self.headers) + len(self.body)
+
+
+class ResolvedPath(NamedTuple):
+    # OK or an error to respond with
+    status: HTTPStatus
+    # File to serve, `index.html` for directories
+    path: Path
+    # Resolved request target, files are cached by it
+    cache_key: Path
+    index: bool
+    content_type: str
+    key: DirKey
+
+
+class FileCache:
+    """LRU cache of small static files kept in memory.
+
+    Entries are keyed by a resolved request path (and an encoding, if
+    contents are compressed) and hold file contents along with
+    pre-rendered headers. A cached file is checked for changes
+    (inode / size / mtime) at most once per `revalidate_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        max_file_size: int,
+        revalidate_interval: float,
+    ):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.revalidate_interval = revalidate_interval
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, Tuple[CacheEntry, float]]"
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Return a fresh cache entry or None.
+        """
+        with self._lock:
+            try:
+                entry, checked_at = self._entries[key]
+            except KeyError:
+                return None
+            self._entries.move_to_end(key)
+
+        now = time.monotonic()
+        if now - checked_at < self.revalidate_interval:
+            return entry
+
+        try:
+            fresh = stat_key(entry.path.stat()) == entry.key
+        except OSError:
+            fresh = False
+
+        with self._lock:
+            if self._entries.get(key, (None,))[0] is not entry:
+                return entry if fresh else None
+            if fresh:
+                self._entries[key] = entry, now
+            else:
+                self._pop(key)
+
+        return entry if fresh else None
+
+    def put(self, key: Hashable, entry: CacheEntry) -> bool:
+        """Store an entry evicting least recently used ones if needed.
+
+        Returns False if the entry is too large to be cached.
+        """
+        if len(entry.body) > self.max_file_size or entry.size > self.max_size:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+            self._entries[key] = entry, time.monotonic()
+            self.size += entry.size
+
+            while self.size > self.max_size:
+                self._pop(next(iter(self._entries)))
+
+        return True
+
+    def _pop(self, key: Hashable) -> None:
+        entry, _ = self._entries.pop(key)
+        self.size -= entry.size
+
+
+class PathCache:
+    """LRU memo of request targets resolved to files under document root.
+
+    Entries are keyed by a cleaned request target and hold the result of
+    resolving and checking it along with mtimes of directories it has
+    been resolved through. An entry is dropped once any of them changes,
+    so a hit costs a few `stat` calls instead of resolving the path.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ResolvedPath]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, target: str) -> Optional[ResolvedPath]:
+        """Return a fresh resolved path or None.
+        """
+        with self._lock:
+            try:
+                resolved = self._entries[target]
+            except KeyError:
+                return None
+            self._entries.move_to_end(target)
+
+        if dir_key(path for path, _ in resolved.key) == resolved.key:
+            return resolved
+
+        with self._lock:
+            if self._entries.get(target) is resolved:
+                del self._entries[target]
+        return None
+
+    def put(self, target: str, resolved: ResolvedPath) -> bool:
+        """Remember a resolved path unless its directories are changing.
+
+        Returns False if the path has not been remembered.
+        """
+        # time.time_ns() needs Python 3.7
+        recent = int((time.time() - MTIME_GRANULARITY) * 1e9)
+        for _, mtime in resolved.key:
+            if mtime is not None and mtime > recent:
+                return False
+
+        with self._lock:
+            self._entries[target] = resolved
+            self._entries.move_to_end(target)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return True
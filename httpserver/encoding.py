@@ -0,0 +1,55 @@
+import zlib
+
+from typing import List
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Server preference order, the first one is used if a client accepts both
+ENCODINGS = ("br", "gzip")
+# Suffixes of precompressed files lying next to the original ones
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+GZIP_LEVEL = 6
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Supported encodings acceptable for a client, most preferred first.
+
+    `header` is a value of `Accept-Encoding` request header.
+    """
+    weights = {}
+    for item in header.split(","):
+        token, _, params = item.partition(";")
+        weight = 1.0
+        param, _, value = params.partition("=")
+        if param.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        weights[token.strip().lower()] = weight
+
+    default = weights.get("*", 0.0)
+    accepted = [
+        (-weights.get(encoding, default), n, encoding)
+        for n, encoding in enumerate(ENCODINGS)
+    ]
+    return [encoding for weight, _, encoding in sorted(accepted) if weight]
+
+
+def can_compress(encoding: str) -> bool:
+    """Whether `encoding` can be applied on the fly.
+    """
+    return encoding == "gzip" or (encoding == "br" and brotli is not None)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data)
+
+    # wbits=31 makes zlib write gzip header and trailer
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
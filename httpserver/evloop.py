@@ -0,0 +1,404 @@
+"""
+Single threaded engine multiplexing client connections with `selectors`
+(epoll on Linux). Request parsing and processing are shared with
+the `threads` engine.
+
+"""
+import logging
+import os
+import selectors
+import socket
+import time
+
+from collections import deque
+from typing import BinaryIO, Deque, List, Optional, Tuple
+
+from .httpd import (
+    FILE_CHUNK_SIZE,
+    HEADER_TIMEOUT,
+    KEEP_ALIVE_MAX_REQUESTS,
+    KEEP_ALIVE_TIMEOUT,
+    MSG_MORE,
+    REQUEST_CHUNK_SIZE,
+    SEND_TIMEOUT,
+    STOP_TIMEOUT,
+    Handler,
+    HTTPException,
+    can_sendfile,
+    error_response,
+    log_response,
+    process_request,
+    reject_connection,
+    render_response,
+    skip_sent,
+)
+from .accesslog import AccessLog
+from .metrics import Metrics
+from .parser import RequestParser
+from .types import HTTPRequest, HTTPResponse, HTTPStatus
+
+
+SELECT_TIMEOUT = 1
+
+
+class Connection:
+    """State of a non-blocking (possibly persistent) client connection.
+    """
+
+    def __init__(
+        self,
+        conn: socket.socket,
+        addr: Tuple,
+        metrics: Optional[Metrics] = None,
+        access_log: Optional[AccessLog] = None,
+    ):
+        self.conn = conn
+        self.addr = addr
+        self.metrics = metrics
+        self.access_log = access_log
+        self.parser = RequestParser()
+        self.outgoing: List[memoryview] = []
+        self.file: Optional[BinaryIO] = None
+        self.file_parts: Deque[Tuple[bytes, int, int]] = deque()
+        self.file_offset = 0
+        self.file_remaining = 0
+        self.sendfile = False
+        self.keep_alive = False
+        self.idle = False
+        # Set when the server is stopping, no more requests are read
+        self.closing = False
+        self.n_requests = 0
+        # Reading a request head, sending a response or waiting for
+        # the next request has its own deadline
+        self.deadline = time.monotonic() + HEADER_TIMEOUT
+        # Request being answered (None if it is malformed), its response,
+        # size of the response and time since the request has been received
+        self.request: Optional[HTTPRequest] = None
+        self.response: Optional[HTTPResponse] = None
+        self.response_size = 0
+        self.started = 0.0
+
+        if metrics is not None:
+            metrics.connection_opened()
+
+    @property
+    def sending(self) -> bool:
+        return bool(self.outgoing) or self.file is not None
+
+    def expired(self, now: float) -> bool:
+        return now > self.deadline
+
+    def respond(self, handler: Handler, eof: bool = False) -> bool:
+        """Prepare a response if a whole request has been received.
+        """
+        try:
+            request = self.parser.parse(eof)
+        except HTTPException as exc:
+            self.request = None
+            self.started = time.perf_counter()
+            response, keep_alive = error_response(exc, self.addr), False
+        else:
+            if request is None:
+                return False
+            self.request = request
+            self.started = time.perf_counter()
+            response, keep_alive = process_request(
+                request, self.addr, handler
+            )
+
+        self.n_requests += 1
+        self.keep_alive = (
+            keep_alive
+            and not self.closing
+            and self.n_requests < KEEP_ALIVE_MAX_REQUESTS
+        )
+        self.outgoing = [
+            memoryview(buffer)
+            for buffer in render_response(response, self.keep_alive)
+        ]
+        self.deadline = time.monotonic() + SEND_TIMEOUT
+        self.response = response
+        self.response_size = sum(len(buffer) for buffer in self.outgoing)
+        self.response_size += sum(
+            len(prefix) + count for prefix, _, count in response.file_parts
+        )
+
+        if response.file is not None:
+            self.file = response.file
+            self.file_parts = deque(response.file_parts)
+            self.file_remaining = 0
+            self.sendfile = can_sendfile(self.file)
+            # Head goes along with the first prefix
+            self.next_file_part()
+
+        return True
+
+    def on_readable(self, handler: Handler) -> bool:
+        """Read available bytes, return True if reading is over.
+
+        Reading is over when a response is ready to be sent or
+        when a client has closed the connection between requests.
+        """
+        chunk = self.conn.recv(REQUEST_CHUNK_SIZE)
+        if not chunk and not self.parser.pending:
+            self.keep_alive = False
+            return True
+
+        if self.idle:
+            self.idle = False
+            self.deadline = time.monotonic() + HEADER_TIMEOUT
+
+        self.parser.feed(chunk)
+        return self.respond(handler, eof=not chunk)
+
+    def on_writable(self) -> bool:
+        """Send as much as possible, return True if the response is sent.
+        """
+        if not self.outgoing and not self.file_remaining:
+            self.next_file_part()
+
+        if self.outgoing:
+            flags = MSG_MORE if self.file_remaining else 0
+            sent = self.conn.sendmsg(self.outgoing, (), flags)
+            self.outgoing = skip_sent(self.outgoing, sent)
+        elif self.file_remaining:
+            self.send_file_chunk()
+
+        self.deadline = time.monotonic() + SEND_TIMEOUT
+        if self.sending:
+            return False
+
+        log_response(self.addr, self.request, self.response, self.access_log)
+        if self.metrics is not None:
+            self.metrics.observe(
+                self.request and self.request.method,
+                self.response.status,
+                time.perf_counter() - self.started,
+                self.response_size,
+            )
+        self.response = None
+        return True
+
+    def next_file_part(self) -> None:
+        """Start sending the next slice of the response file.
+        """
+        if not self.file_parts:
+            self.close_file()
+            return None
+
+        prefix, self.file_offset, self.file_remaining = (
+            self.file_parts.popleft()
+        )
+        self.outgoing.append(memoryview(prefix))
+
+        if not self.sendfile and self.file_remaining and self.file_offset:
+            self.file.seek(self.file_offset)
+
+    def send_file_chunk(self) -> None:
+        """Send the next part of the response file.
+
+        Without `sendfile` the part is read to the outgoing buffer.
+        """
+        if self.sendfile:
+            sent = os.sendfile(
+                self.conn.fileno(),
+                self.file.fileno(),
+                self.file_offset,
+                self.file_remaining,
+            )
+        else:
+            chunk = self.file.read(min(FILE_CHUNK_SIZE, self.file_remaining))
+            self.outgoing = [memoryview(chunk)]
+            sent = len(chunk)
+
+        if not sent:
+            raise OSError(f"File is truncated: {self.file_remaining} left.")
+
+        self.file_offset += sent
+        self.file_remaining -= sent
+
+    def close_file(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def next_request(self, handler: Handler) -> None:
+        """Prepare a persistent connection for the next request.
+
+        A pipelined request which has already been received is processed
+        immediately, so a new response may be ready to be sent.
+        """
+        if not self.keep_alive:
+            return None
+
+        if self.respond(handler):
+            return None
+
+        if self.closing:
+            self.keep_alive = False
+            return None
+
+        self.idle = not self.parser.pending
+        timeout = KEEP_ALIVE_TIMEOUT if self.idle else HEADER_TIMEOUT
+        self.deadline = time.monotonic() + timeout
+
+    def on_timeout(self) -> None:
+        """Try to notify the client that it is too slow.
+        """
+        if self.idle or self.sending:
+            return None
+
+        exc = HTTPException(HTTPStatus.REQUEST_TIMEOUT)
+        response = error_response(exc, self.addr)
+        try:
+            self.conn.sendmsg(render_response(response))
+        except OSError:
+            return None
+        log_response(self.addr, None, response, self.access_log)
+
+    def close(self) -> None:
+        self.close_file()
+        self.conn.close()
+        if self.metrics is not None:
+            self.metrics.connection_closed()
+        logging.debug(f"{self.addr}: connection closed.")
+
+
+def accept(
+    selector: selectors.BaseSelector,
+    sock: socket.socket,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+    max_connections: Optional[int] = None,
+) -> None:
+    """Accept all pending connections on a listening socket.
+
+    Connections over `max_connections` are answered with 503 at once.
+    """
+    while True:
+        try:
+            conn, addr = sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return None
+
+        logging.debug(f"Connected by: {addr}.")
+        # The listening socket is registered too
+        if max_connections and len(selector.get_map()) > max_connections:
+            reject_connection(conn, addr, metrics, access_log)
+            continue
+
+        conn.setblocking(False)
+        connection = Connection(conn, addr, metrics, access_log)
+        selector.register(conn, selectors.EVENT_READ, connection)
+
+
+def run_loop(
+    selector: selectors.BaseSelector,
+    handler: Handler,
+    sock: Optional[socket.socket],
+    deadline: Optional[float] = None,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+    max_connections: Optional[int] = None,
+) -> None:
+    """Process events of registered sockets.
+
+    Runs forever while a listening socket is given. Without it remaining
+    connections are only finished until there are none left or
+    `deadline` has passed.
+    """
+    next_sweep = time.monotonic() + SELECT_TIMEOUT
+
+    while sock is not None or (
+        selector.get_map() and time.monotonic() < deadline
+    ):
+        for key, mask in selector.select(SELECT_TIMEOUT):
+            if key.data is None:
+                accept(selector, sock, metrics, access_log, max_connections)
+                continue
+
+            connection: Connection = key.data
+            try:
+                if mask & selectors.EVENT_READ:
+                    if not connection.on_readable(handler):
+                        continue
+                elif connection.on_writable():
+                    connection.next_request(handler)
+                else:
+                    continue
+
+                if connection.sending:
+                    events = selectors.EVENT_WRITE
+                elif connection.keep_alive:
+                    events = selectors.EVENT_READ
+                else:
+                    selector.unregister(key.fileobj)
+                    connection.close()
+                    continue
+
+                if key.events != events:
+                    selector.modify(key.fileobj, events, connection)
+
+            except (BlockingIOError, InterruptedError):
+                continue
+
+            except Exception:
+                logging.exception(f"{connection.addr}: Connection error.")
+                selector.unregister(key.fileobj)
+                connection.close()
+
+        now = time.monotonic()
+        if now < next_sweep:
+            continue
+
+        next_sweep = now + SELECT_TIMEOUT
+        for key in list(selector.get_map().values()):
+            connection = key.data
+            if connection is not None and connection.expired(now):
+                selector.unregister(key.fileobj)
+                connection.on_timeout()
+                connection.close()
+
+
+def serve_events(
+    sock: socket.socket,
+    handler: Handler,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+    max_connections: Optional[int] = None,
+    grace_period: float = STOP_TIMEOUT,
+) -> None:
+    """Serve connections on a listening socket in an event loop.
+
+    Connections over `max_connections` are answered with 503 at once.
+    When interrupted, the loop stops accepting connections, closes idle
+    ones and finishes requests in progress within `grace_period` seconds.
+    """
+    sock.setblocking(False)
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+
+        try:
+            run_loop(
+                selector,
+                handler,
+                sock,
+                None,
+                metrics,
+                access_log,
+                max_connections,
+            )
+        except KeyboardInterrupt:
+            selector.unregister(sock)
+            for key in list(selector.get_map().values()):
+                if key.data.idle:
+                    selector.unregister(key.fileobj)
+                    key.data.close()
+                else:
+                    key.data.closing = True
+
+            run_loop(
+                selector, handler, None, time.monotonic() + grace_period
+            )
+            raise
@@ -1,14 +1,46 @@
 import datetime as dt
+import email.utils
 import logging
+import os
+import queue
+import signal
 import socket
+import stat
 import threading
 import time
-import urllib.parse
 
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Tuple
+from typing import BinaryIO, Callable, List, Optional, Tuple
 
-from .types import HTTPMethod, HTTPRequest, HTTPResponse, HTTPStatus
+from . import autoindex as listing
+from .accesslog import AccessLog
+from .cache import (
+    MTIME_GRANULARITY,
+    CacheEntry,
+    FileCache,
+    FileKey,
+    PathCache,
+    ResolvedPath,
+    dir_key,
+    stat_key,
+)
+from .encoding import (
+    PRECOMPRESSED_SUFFIXES,
+    accepted_encodings,
+    can_compress,
+    compress,
+)
+from .metrics import Metrics, serve_metrics
+from .parser import RequestParser
+from .ranges import ByteRange, content_range, multipart, parse_ranges
+from .types import (
+    HTTPException,
+    HTTPMethod,
+    HTTPRequest,
+    HTTPResponse,
+    HTTPStatus,
+)
 
 
 ALLOWED_CONTENT_TYPES = {
@@ -22,10 +54,45 @@ ALLOWED_CONTENT_TYPES = {
     ".swf": "application/x-shockwave-flash",
     ".txt": "text/plain",
 }
+COMPRESSIBLE_CONTENT_TYPES = {
+    "text/html",
+    "application/javascript",
+    "text/css",
+    "text/plain",
+}
 BACKLOG = 10
-REQUEST_SOCKET_TIMEOUT = 10
 REQUEST_CHUNK_SIZE = 1024
-REQUEST_MAX_SIZE = 8 * 1024
+FILE_CHUNK_SIZE = 64 * 1024
+# Time to receive a whole request head, however slowly bytes are trickling
+HEADER_TIMEOUT = 10
+# Time a response may be sent without any progress
+SEND_TIMEOUT = 10
+# Time a persistent connection may be idle between requests
+KEEP_ALIVE_TIMEOUT = 5
+# Period of checking whether accepted connections wait for a worker
+# thread held by an idle persistent connection
+KEEP_ALIVE_POLL_INTERVAL = 0.1
+KEEP_ALIVE_MAX_REQUESTS = 100
+# Period of checking whether a server is stopping while waiting for clients
+ACCEPT_TIMEOUT = 1
+# Default time to finish in-flight requests after a server has been
+# interrupted
+STOP_TIMEOUT = 5
+ENGINES = ("threads", "epoll")
+# Tells the kernel that more data follows, so a response head is not sent
+# in a separate segment stalled by Nagle's algorithm and delayed ACKs
+MSG_MORE = getattr(socket, "MSG_MORE", 0)
+
+STATUS_LINES = {
+    status: f"HTTP/1.1 {status}\r\n".encode("utf-8") for status in HTTPStatus
+}
+GENERAL_HEADERS = {
+    keep_alive: (
+        "Server: Fancy-Python-HTTP-Server\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    ).encode("utf-8")
+    for keep_alive in (False, True)
+}
 
 
 logging.basicConfig(
@@ -35,114 +102,699 @@ logging.basicConfig(
 )
 
 
-class HTTPException(Exception):
-    pass
+Handler = Callable[[HTTPRequest], HTTPResponse]
 
 
-def receive(conn: socket.socket) -> bytearray:
-    """Read raw bytes from a client socket.
+def interrupt(signum, frame):
+    """Stop a server gracefully on a signal, as on CTRL+C.
     """
-    conn.settimeout(REQUEST_SOCKET_TIMEOUT)
+    raise KeyboardInterrupt
 
-    try:
-        received = bytearray()
 
+def receive(
+    conn: socket.socket, parser: RequestParser
+) -> Optional[HTTPRequest]:
+    """Read one request from a client socket.
+
+    Returns None if the client has closed the connection before sending
+    anything. The whole head must be received within `HEADER_TIMEOUT`.
+    """
+    deadline = time.monotonic() + HEADER_TIMEOUT
+
+    try:
         while True:
-            if len(received) > REQUEST_MAX_SIZE:
-                break
+            request = parser.parse()
+            if request is not None:
+                return request
 
-            if b"\r\n\r\n" in received:
-                break
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise socket.timeout
 
+            conn.settimeout(timeout)
             chunk = conn.recv(REQUEST_CHUNK_SIZE)
             if not chunk:
-                break
+                return parser.parse(eof=True)
 
-            received += chunk
+            parser.feed(chunk)
 
     except socket.timeout:
         raise HTTPException(HTTPStatus.REQUEST_TIMEOUT)
 
-    return received
 
+def wait_request(
+    conn: socket.socket,
+    parser: RequestParser,
+    queued: Optional[Callable[[], bool]] = None,
+) -> bool:
+    """Wait for the next request on a persistent connection.
 
-def parse_request(received: bytearray) -> HTTPRequest:
-    """Parse request from raw bytes received from a client.
+    Returns False if the client closed the connection or has been idle
+    for `KEEP_ALIVE_TIMEOUT` seconds. If `queued` is given, the wait is
+    also given up once it tells that other connections are waiting.
     """
-    raw_request_line, *_ = received.partition(b"\r\n")
-    request_line = str(raw_request_line, "iso-8859-1")
+    if parser.pending:
+        return True
+
+    deadline = time.monotonic() + KEEP_ALIVE_TIMEOUT
+    while True:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return False
+        if queued is not None:
+            timeout = min(timeout, KEEP_ALIVE_POLL_INTERVAL)
+
+        conn.settimeout(timeout)
+        try:
+            chunk = conn.recv(REQUEST_CHUNK_SIZE)
+        except socket.timeout:
+            if queued is not None and queued():
+                return False
+            continue
+        except OSError:
+            return False
+
+        parser.feed(chunk)
+        return bool(chunk)
+
+
+def make_etag(key: FileKey) -> str:
+    """Weak entity tag of a file.
+    """
+    ino, size, mtime_ns = key
+    return f'W/"{ino:x}-{size:x}-{mtime_ns:x}"'
+
+
+def last_modified(key: FileKey) -> str:
+    return email.utils.formatdate(key[2] // 10 ** 9, usegmt=True)
+
+
+def validator_headers(key: FileKey) -> bytes:
+    """Render headers used by clients to revalidate a cached file.
+    """
+    return (
+        f"ETag: {make_etag(key)}\r\n"
+        f"Last-Modified: {last_modified(key)}\r\n"
+    ).encode("utf-8")
+
+
+def vary_header(content_type: str) -> bytes:
+    """Tell caches that compressible files depend on `Accept-Encoding`.
+    """
+    if content_type in COMPRESSIBLE_CONTENT_TYPES:
+        return b"Vary: Accept-Encoding\r\n"
+    return b""
+
+
+@lru_cache(maxsize=64)
+def content_headers(content_type: str, file: bool) -> bytes:
+    """Render entity headers which depend only on a content type.
+    """
+    headers = f"Content-Type: {content_type}\r\n".encode("utf-8")
+    if file:
+        headers += b"Accept-Ranges: bytes\r\n" + vary_header(content_type)
+    return headers
+
+
+def entity_headers(
+    content_type: str,
+    content_length: int,
+    key: Optional[FileKey] = None,
+    encoding: Optional[str] = None,
+) -> bytes:
+    """Render headers describing a response body.
+
+    Headers specific to static files are added if `key` of the file
+    is given.
+    """
+    headers = content_headers(content_type, key is not None)
+    headers += b"Content-Length: %d\r\n" % content_length
+
+    if encoding is not None:
+        headers += f"Content-Encoding: {encoding}\r\n".encode("utf-8")
+
+    if key is not None:
+        headers += validator_headers(key)
+    return headers
+
+
+def is_not_modified(request: HTTPRequest, key: FileKey) -> bool:
+    """Evaluate conditional headers of a request against a file.
+
+    `If-None-Match` takes precedence over `If-Modified-Since`.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison ignores `W/` prefixes
+        opaque_tag = make_etag(key)[2:]
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag in ("*", opaque_tag):
+                return True
+        return False
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
 
     try:
-        raw_method, raw_target, version = request_line.split()
-    except ValueError:
-        raise HTTPException(HTTPStatus.BAD_REQUEST)
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+    # Dates with `-0000` zone are parsed as naive ones, they are in UTC too
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=dt.timezone.utc)
+    # A date in the future is invalid and must be ignored
+    timestamp = since.timestamp()
+    if timestamp > time.time():
+        return False
+
+    return key[2] // 10 ** 9 <= timestamp
+
+
+def not_modified_response(key: FileKey, content_type: str) -> HTTPResponse:
+    return HTTPResponse(
+        status=HTTPStatus.NOT_MODIFIED,
+        body=b"",
+        content_type="",
+        content_length=0,
+        headers=validator_headers(key) + vary_header(content_type),
+    )
+
+
+def requested_ranges(
+    request: HTTPRequest, key: FileKey
+) -> Optional[List[ByteRange]]:
+    """Byte ranges of a file requested by a client.
+
+    Returns None if the whole file has to be sent.
+    """
+    header = request.headers.get("range")
+    if header is None or request.method is not HTTPMethod.GET:
+        return None
+
+    # Our entity tags are weak, so only a date can match `If-Range`
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != last_modified(key):
+        return None
+
+    return parse_ranges(header, key[1])
+
+
+def range_not_satisfiable_response(size: int) -> HTTPResponse:
+    response = HTTPResponse.error(HTTPStatus.RANGE_NOT_SATISFIABLE)
+    headers = entity_headers(response.content_type, response.content_length)
+    headers += f"Content-Range: bytes */{size}\r\n".encode("utf-8")
+    return response._replace(headers=headers)
+
+
+def partial_response(
+    content_type: str,
+    key: FileKey,
+    ranges: List[ByteRange],
+    body: Optional[bytes] = None,
+    file: Optional[BinaryIO] = None,
+) -> HTTPResponse:
+    """Build response with byte ranges of a file.
+
+    File contents are taken either from memory (`body`) or from an open
+    `file`, which is streamed and never read as a whole.
+    """
+    size = key[1]
+
+    if not ranges:
+        if file is not None:
+            file.close()
+        return range_not_satisfiable_response(size)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        parts = [(b"", start, end - start + 1)]
+        closing = b""
+        header = f"Content-Range: {content_range(ranges[0], size)}\r\n"
+        extra_headers = header.encode("utf-8")
+    else:
+        # Vary depends on the type of the file, not of the multipart body
+        extra_headers = vary_header(content_type)
+        content_type, parts, closing = multipart(ranges, size, content_type)
+
+    content_length = len(closing) + sum(
+        len(prefix) + length for prefix, _, length in parts
+    )
+    headers = entity_headers(content_type, content_length, key)
+    headers += extra_headers
 
+    if body is not None:
+        chunks = [
+            prefix + body[offset : offset + length]
+            for prefix, offset, length in parts
+        ]
+        body = b"".join(chunks) + closing
+        file_parts = ()
+    else:
+        body = b""
+        file_parts = (*parts, (closing, 0, 0))
+
+    return HTTPResponse(
+        status=HTTPStatus.PARTIAL_CONTENT,
+        body=body,
+        content_type=content_type,
+        content_length=content_length,
+        file=file,
+        file_parts=file_parts,
+        headers=headers,
+    )
+
+
+def cached_response(entry: CacheEntry, method: HTTPMethod) -> HTTPResponse:
+    """Build response from a file cached in memory.
+    """
+    return HTTPResponse(
+        status=HTTPStatus.OK,
+        body=b"" if method is HTTPMethod.HEAD else entry.body,
+        content_type=entry.content_type,
+        content_length=len(entry.body),
+        headers=entry.headers,
+    )
+
+
+def precompressed_response(
+    method: HTTPMethod,
+    path: Path,
+    content_type: str,
+    key: FileKey,
+    encoding: str,
+) -> Optional[HTTPResponse]:
+    """Build response from a compressed copy lying next to a file.
+
+    Copies older than the file itself are ignored.
+    """
+    copy = path.with_name(path.name + PRECOMPRESSED_SUFFIXES[encoding])
     try:
-        method = HTTPMethod[raw_method]
-    except KeyError:
-        raise HTTPException(HTTPStatus.METHOD_NOT_ALLOWED)
+        file = copy.open("rb")
+    except OSError:
+        return None
 
-    return HTTPRequest(method=method, target=urllib.parse.unquote(raw_target))
+    copy_stat = os.fstat(file.fileno())
+    size = copy_stat.st_size
+    if not stat.S_ISREG(copy_stat.st_mode) or copy_stat.st_mtime_ns < key[2]:
+        file.close()
+        return None
 
+    if method is HTTPMethod.HEAD:
+        file.close()
+        file = None
 
-def handle_request(request: HTTPRequest, document_root: Path) -> HTTPResponse:
-    """Process request.
+    return HTTPResponse(
+        status=HTTPStatus.OK,
+        body=b"",
+        content_type=content_type,
+        content_length=size,
+        file=file,
+        file_parts=((b"", 0, size),) if file is not None else (),
+        headers=entity_headers(content_type, size, key, encoding),
+    )
+
+
+def encoded_response(
+    request: HTTPRequest,
+    path: Path,
+    index: bool,
+    content_type: str,
+    key: FileKey,
+    compression_cache: Optional[FileCache],
+    cache_key: Path,
+    body: Optional[bytes] = None,
+    file: Optional[BinaryIO] = None,
+) -> Optional[HTTPResponse]:
+    """Build response with compressed file contents if a client accepts it.
+
+    A compressed copy is taken from `compression_cache`, from a file
+    lying next to the original one or made on the fly (and cached).
+    Original contents are taken from `body` or read from an open `file`.
     """
-    method = request.method
-    target = request.clean_target()
+    header = request.headers.get("accept-encoding")
+    if not header or content_type not in COMPRESSIBLE_CONTENT_TYPES:
+        return None
+
+    for encoding in accepted_encodings(header):
+        variant_key = (cache_key, encoding)
+
+        if compression_cache is not None:
+            entry = compression_cache.get(variant_key)
+            if entry is not None:
+                return cached_response(entry, request.method)
+
+        response = precompressed_response(
+            request.method, path, content_type, key, encoding
+        )
+        if response is not None:
+            return response
+
+        if (
+            compression_cache is None
+            or not can_compress(encoding)
+            or key[1] > compression_cache.max_file_size
+        ):
+            continue
+
+        if body is None:
+            body = file.read()
+
+        compressed = compress(body, encoding)
+        entry = CacheEntry(
+            path=path,
+            index=index,
+            content_type=content_type,
+            headers=entity_headers(
+                content_type, len(compressed), key, encoding
+            ),
+            body=compressed,
+            key=key,
+        )
+        compression_cache.put(variant_key, entry)
+        return cached_response(entry, request.method)
+
+    return None
+
 
-    path = Path(document_root, target).resolve()
+def resolve_target(document_root: Path, target: str) -> ResolvedPath:
+    """Find a file to serve for a cleaned request target.
+
+    Also checks that the file is allowed to be served.
+    """
+    # Entries of directories along the target (symlinks including)
+    # determine the result, they are fingerprinted before resolving
+    dirs = [str(document_root)]
+    for part in target.split("/"):
+        if part and part != ".":
+            dirs.append(os.path.join(dirs[-1], part))
+    key = dir_key(dirs)
+
+    path = cache_key = Path(document_root, target).resolve()
+    resolved = ResolvedPath(HTTPStatus.OK, path, cache_key, False, "", key)
 
     # Probably it's a pointless part due to pathlib removes trailing slashes
     if path.is_file() and target.endswith("/"):
-        return HTTPResponse.error(HTTPStatus.NOT_FOUND)
+        return resolved._replace(status=HTTPStatus.NOT_FOUND)
 
-    if path.is_dir():
+    index = path.is_dir()
+    if index:
         path /= "index.html"
 
+    # Directory of a file reached by symlinks is not among `dirs`
+    extra = str(path.parent)
+    if extra not in dirs:
+        key += dir_key([extra])
+    resolved = resolved._replace(path=path, index=index, key=key)
+
     # Prevent access to parents of the root directory
     if document_root not in path.parents:
-        return HTTPResponse.error(HTTPStatus.FORBIDDEN)
+        return resolved._replace(status=HTTPStatus.FORBIDDEN)
 
     if not path.is_file():
-        return HTTPResponse.error(HTTPStatus.NOT_FOUND)
+        return resolved._replace(status=HTTPStatus.NOT_FOUND)
 
     if path.suffix not in ALLOWED_CONTENT_TYPES:
-        return HTTPResponse.error(HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+        return resolved._replace(status=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
 
-    stat = path.stat()
-    content_length = stat.st_size
-    body = b"" if method is HTTPMethod.HEAD else path.read_bytes()
+    return resolved._replace(content_type=ALLOWED_CONTENT_TYPES[path.suffix])
 
-    return HTTPResponse(
-        status=HTTPStatus.OK,
+
+def listing_response(
+    request: HTTPRequest, directory: Path, listings: Optional[FileCache]
+) -> HTTPResponse:
+    """Build response with a page of a directory listing.
+
+    Rendered pages are kept in `listings` until the directory changes.
+    """
+    page = listing.parse_page(request.target.partition("?")[2])
+    if page is None:
+        return HTTPResponse.error(HTTPStatus.NOT_FOUND)
+
+    path = "/" + request.clean_target()
+    if not path.endswith("/"):
+        path += "/"
+
+    # Links depend on the requested path, not only on the directory
+    cache_key = (path, page)
+    entry = listings.get(cache_key) if listings is not None else None
+    if entry is not None:
+        return cached_response(entry, request.method)
+
+    # The directory is fingerprinted before it's listed
+    try:
+        stat = directory.stat()
+        entries = listing.list_directory(directory)
+    except OSError:
+        return HTTPResponse.error(HTTPStatus.NOT_FOUND)
+
+    if page > listing.n_pages(len(entries)):
+        return HTTPResponse.error(HTTPStatus.NOT_FOUND)
+
+    body = listing.render_listing(path, entries, page)
+    entry = CacheEntry(
+        path=directory,
+        index=True,
+        content_type=listing.CONTENT_TYPE,
+        headers=entity_headers(listing.CONTENT_TYPE, len(body)),
         body=body,
-        content_type=ALLOWED_CONTENT_TYPES[path.suffix],
-        content_length=content_length,
+        key=stat_key(stat),
     )
 
+    # A directory changed again within the same tick may keep its mtime,
+    # time.time_ns() needs Python 3.7
+    recent = int((time.time() - MTIME_GRANULARITY) * 1e9)
+    if listings is not None and stat.st_mtime_ns <= recent:
+        listings.put(cache_key, entry)
+
+    return cached_response(entry, request.method)
 
-def send_response(conn: socket.socket, response: HTTPResponse) -> None:
-    """Send HTTP response.
+
+def handle_request(
+    request: HTTPRequest,
+    document_root: Path,
+    cache: Optional[FileCache] = None,
+    compression_cache: Optional[FileCache] = None,
+    paths: Optional[PathCache] = None,
+    autoindex: bool = False,
+    listings: Optional[FileCache] = None,
+) -> HTTPResponse:
+    """Process request.
+
+    With `autoindex` directories without index file are listed.
     """
-    now = dt.datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
+    method = request.method
+    target = request.clean_target()
+
+    resolved = paths.get(target) if paths is not None else None
+    if resolved is None:
+        resolved = resolve_target(document_root, target)
+        if paths is not None:
+            paths.put(target, resolved)
+
+    if resolved.status is not HTTPStatus.OK:
+        # Directory without index file
+        if (
+            autoindex
+            and resolved.index
+            and resolved.status is HTTPStatus.NOT_FOUND
+        ):
+            return listing_response(request, resolved.cache_key, listings)
+        return HTTPResponse.error(resolved.status)
+
+    path, cache_key = resolved.path, resolved.cache_key
+    index, content_type = resolved.index, resolved.content_type
+
+    entry = cache.get(cache_key) if cache is not None else None
+    if entry is not None:
+        if is_not_modified(request, entry.key):
+            return not_modified_response(entry.key, entry.content_type)
+        ranges = requested_ranges(request, entry.key)
+        if ranges is not None:
+            return partial_response(
+                entry.content_type, entry.key, ranges, body=entry.body
+            )
+        response = encoded_response(
+            request,
+            entry.path,
+            entry.index,
+            entry.content_type,
+            entry.key,
+            compression_cache,
+            cache_key,
+            body=entry.body,
+        )
+        return response or cached_response(entry, method)
+
+    file = path.open("rb")
+    stat = os.fstat(file.fileno())
+    key = stat_key(stat)
 
-    headers = (
-        f"HTTP/1.1 {response.status}",
-        f"Date: {now}",
-        f"Content-Type: {response.content_type}",
-        f"Content-Length: {response.content_length}",
-        f"Server: Fancy-Python-HTTP-Server",
-        f"Connection: close",
-        f"",
+    if is_not_modified(request, key):
+        file.close()
+        return not_modified_response(key, content_type)
+
+    ranges = requested_ranges(request, key)
+    if ranges is not None:
+        return partial_response(content_type, key, ranges, file=file)
+
+    response = encoded_response(
+        request,
+        path,
+        index,
+        content_type,
+        key,
+        compression_cache,
+        cache_key,
+        file=file,
+    )
+    if response is not None:
+        file.close()
+        return response
+
+    if cache is not None and stat.st_size <= cache.max_file_size:
+        with file:
+            body = file.read()
+
+        entry = CacheEntry(
+            path=path,
+            index=index,
+            content_type=content_type,
+            headers=entity_headers(content_type, len(body), key),
+            body=body,
+            key=key,
+        )
+        cache.put(cache_key, entry)
+        return cached_response(entry, method)
+
+    if method is HTTPMethod.HEAD:
+        file.close()
+        file = None
+
+    return HTTPResponse(
+        status=HTTPStatus.OK,
+        body=b"",
+        content_type=content_type,
+        content_length=stat.st_size,
+        file=file,
+        file_parts=((b"", 0, stat.st_size),) if file is not None else (),
+        headers=entity_headers(content_type, stat.st_size, key),
     )
 
+
+@lru_cache(maxsize=1)
+def date_header(second: int) -> bytes:
+    """Render `Date` header, it changes once per second.
+    """
+    date = email.utils.formatdate(second, usegmt=True)
+    return f"Date: {date}\r\n".encode("utf-8")
+
+
+def render_response(
+    response: HTTPResponse, keep_alive: bool = False
+) -> List[bytes]:
+    """Serialize HTTP response to buffers to be sent one after another.
+
+    Only the date is rendered, other headers are pre-encoded.
+    """
+    return [
+        STATUS_LINES[response.status],
+        date_header(int(time.time())),
+        GENERAL_HEADERS[keep_alive],
+        response.headers
+        or entity_headers(response.content_type, response.content_length),
+        b"\r\n",
+        response.body,
+    ]
+
+
+def skip_sent(buffers: List[memoryview], sent: int) -> List[memoryview]:
+    """Drop `sent` bytes from the beginning of buffers.
+    """
+    for n, buffer in enumerate(buffers):
+        if sent < len(buffer):
+            return [buffer[sent:], *buffers[n + 1 :]]
+        sent -= len(buffer)
+    return []
+
+
+def send_buffers(
+    conn: socket.socket, buffers: List[bytes], more: bool = False
+) -> None:
+    """Send buffers one after another with scatter-gather writes.
+
+    With `more` the kernel waits for the data following them.
+    """
+    views = [memoryview(buffer) for buffer in buffers if buffer]
+    while views:
+        sent = conn.sendmsg(views, (), MSG_MORE if more else 0)
+        views = skip_sent(views, sent)
+
+
+def can_sendfile(file: BinaryIO) -> bool:
+    """Whether a file can be sent with zero-copy `os.sendfile`.
+    """
+    if not hasattr(os, "sendfile"):
+        return False
+    return stat.S_ISREG(os.fstat(file.fileno()).st_mode)
+
+
+def send_file(
+    conn: socket.socket, file: BinaryIO, offset: int, count: int
+) -> None:
+    """Stream `count` bytes of a file starting from `offset` to a client.
+
+    Regular files are sent by the kernel without copying them to user
+    space, other ones are read and sent chunk by chunk.
+    """
+    if not count:
+        return None
+
+    if can_sendfile(file):
+        sent = conn.sendfile(file, offset, count)
+    else:
+        if offset:
+            file.seek(offset)
+        sent = 0
+        while sent < count:
+            chunk = file.read(min(FILE_CHUNK_SIZE, count - sent))
+            if not chunk:
+                break
+            conn.sendall(chunk)
+            sent += len(chunk)
+
+    if sent < count:
+        raise OSError(f"File is truncated: {sent} of {count} bytes sent.")
+
+
+def send_response(
+    conn: socket.socket, response: HTTPResponse, keep_alive: bool = False
+) -> int:
+    """Send HTTP response, return number of bytes sent.
+
+    Returns 0 if the client is too slow.
+    """
+    conn.settimeout(SEND_TIMEOUT)
+    buffers = render_response(response, keep_alive)
+    n_bytes = sum(len(buffer) for buffer in buffers)
     try:
-        raw_response: bytes = "\r\n".join(headers).encode("utf-8")
-        raw_response += b"\r\n" + response.body
-        conn.sendall(raw_response)
+        for prefix, offset, count in response.file_parts:
+            # Head goes along with the first prefix
+            send_buffers(conn, [*buffers, prefix], more=count > 0)
+            buffers = []
+            send_file(conn, response.file, offset, count)
+            n_bytes += len(prefix) + count
+        send_buffers(conn, buffers)
     except socket.timeout:
-        pass
+        return 0
+    finally:
+        response.close()
+
+    return n_bytes
 
 
 def send_error(conn: socket.socket, status: HTTPStatus) -> None:
@@ -152,85 +804,450 @@ def send_error(conn: socket.socket, status: HTTPStatus) -> None:
     send_response(conn, response)
 
 
+def error_response(exc: Exception, addr: Tuple) -> HTTPResponse:
+    """Build HTTP response for an exception raised during processing.
+    """
+    if isinstance(exc, HTTPException):
+        status = exc.args[0]
+    else:
+        logging.error(f"{addr}: Unexpected error.", exc_info=exc)
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+
+    return HTTPResponse.error(status)
+
+
+def process_request(
+    request: HTTPRequest, addr: Tuple, handler: Handler
+) -> Tuple[HTTPResponse, bool]:
+    """Turn a request received from a client into HTTP response.
+
+    Also returns whether the connection may be kept open afterwards.
+    """
+    try:
+        response = handler(request)
+    except Exception as exc:
+        return error_response(exc, addr), False
+
+    return response, request.keep_alive
+
+
+def log_response(
+    addr: Tuple,
+    request: Optional[HTTPRequest],
+    response: HTTPResponse,
+    access_log: Optional[AccessLog] = None,
+) -> None:
+    """Log a response sent to the access log or, without it, to stderr.
+    """
+    if access_log is not None:
+        access_log.record(addr, request, response)
+    elif request is None or response.status.value[0] >= 400:
+        logging.info(f'{addr}: HTTP exception "{response.status}".')
+    else:
+        logging.info(f"{addr}: {request.method} {request.target}")
+
+
+def reject_connection(
+    conn: socket.socket,
+    addr: Tuple,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+) -> None:
+    """Answer a connection over the limit with 503 and close it.
+
+    The response fits into an empty socket buffer, so it's sent without
+    waiting for the client and without reading its request.
+    """
+    response = HTTPResponse.error(HTTPStatus.SERVICE_UNAVAILABLE)
+    buffers = render_response(response)
+    if metrics is not None:
+        metrics.connection_opened()
+
+    sent = 0
+    with conn:
+        conn.setblocking(False)
+        try:
+            sent = conn.sendmsg(buffers)
+            # Unread request bytes would make the kernel reset
+            # the connection, dropping the response
+            conn.recv(REQUEST_CHUNK_SIZE)
+        except OSError:
+            pass
+
+    if metrics is not None:
+        metrics.connection_closed()
+        metrics.observe(None, response.status, 0.0, sent)
+    log_response(addr, None, response, access_log)
+
+
 def handle_client_connection(
-    conn: socket.socket, addr: Tuple, document_root: Path
+    conn: socket.socket,
+    addr: Tuple,
+    handler: Handler,
+    stopping: Optional[threading.Event] = None,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+    queued: Optional[Callable[[], bool]] = None,
 ) -> None:
     """Handle an accepted client connection.
+
+    Requests are served one by one until the client asks to close the
+    connection, goes idle, reaches `KEEP_ALIVE_MAX_REQUESTS` or
+    the server is `stopping`. An idle connection is closed at once
+    when `queued` tells that other connections wait to be served.
     """
-    logging.debug(f"Connected by: {addr}.")
+    if metrics is not None:
+        metrics.connection_opened()
 
     with conn:
-        try:
-            raw_bytes = receive(conn)
-            request = parse_request(raw_bytes)
-            response = handle_request(request, document_root)
-            logging.info(f"{addr}: {request.method} {request.target}")
-        except HTTPException as exc:
-            status = exc.args[0]
-            response = HTTPResponse.error(status)
-            logging.info(f'{addr}: HTTP exception "{response.status}".')
-        except Exception:
-            logging.exception(f"{addr}: Unexpected error.")
-            status = HTTPStatus.INTERNAL_SERVER_ERROR
-            response = HTTPResponse.error(status)
+        parser = RequestParser()
 
-        try:
-            send_response(conn, response)
-        except Exception:
-            logging.exception(f"{addr}: Can't send a response.")
+        for n_request in range(1, KEEP_ALIVE_MAX_REQUESTS + 1):
+            if n_request > 1 and not wait_request(conn, parser, queued):
+                break
 
+            try:
+                request = receive(conn, parser)
+            except Exception as exc:
+                request = None
+                response, keep_alive = error_response(exc, addr), False
+            else:
+                if request is None:
+                    break
+
+            started = time.perf_counter()
+            if request is not None:
+                response, keep_alive = process_request(
+                    request, addr, handler
+                )
+
+            keep_alive = (
+                keep_alive
+                and n_request < KEEP_ALIVE_MAX_REQUESTS
+                and not (stopping and stopping.is_set())
+            )
+
+            try:
+                sent = send_response(conn, response, keep_alive)
+            except Exception:
+                logging.exception(f"{addr}: Can't send a response.")
+                break
+
+            if sent:
+                log_response(addr, request, response, access_log)
+
+            if metrics is not None and sent:
+                metrics.observe(
+                    request and request.method,
+                    response.status,
+                    time.perf_counter() - started,
+                    sent,
+                )
+
+            if not (sent and keep_alive):
+                break
+
+    if metrics is not None:
+        metrics.connection_closed()
     logging.debug(f"{addr}: connection closed.")
 
 
+def accept_connections(
+    listening_socket: socket.socket,
+    connections: "queue.Queue[Optional[Tuple[socket.socket, Tuple]]]",
+    n_workers: int,
+    stopping: threading.Event,
+    limit: Optional[threading.BoundedSemaphore] = None,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+) -> None:
+    """Accept connections until stopping and hand them to workers.
+
+    Connections over `limit` are rejected. After the last connection
+    every worker gets None to stop.
+    """
+    # Connections are accepted with a timeout to notice stopping
+    listening_socket.settimeout(ACCEPT_TIMEOUT)
+
+    while not stopping.is_set():
+        try:
+            conn, addr = listening_socket.accept()
+        except socket.timeout:
+            continue
+
+        logging.debug(f"Connected by: {addr}.")
+        if limit is not None and not limit.acquire(blocking=False):
+            reject_connection(conn, addr, metrics, access_log)
+            continue
+        connections.put((conn, addr))
+
+    for _ in range(n_workers):
+        connections.put(None)
+
+
 def wait_connection(
-    listening_socket: socket.socket, thread_id: int, document_root: Path
+    connections: "queue.Queue[Optional[Tuple[socket.socket, Tuple]]]",
+    thread_id: int,
+    handler: Handler,
+    stopping: threading.Event,
+    limit: Optional[threading.BoundedSemaphore] = None,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
 ) -> None:
-    """Forever serve incoming connections on a listening socket.
+    """Serve accepted connections one by one until None is received.
     """
     logging.debug(f"Worker-{thread_id} has been started.")
 
     while True:
-        conn, addr = listening_socket.accept()
-        handle_client_connection(conn, addr, document_root)
+        accepted = connections.get()
+        if accepted is None:
+            break
+
+        conn, addr = accepted
+        try:
+            # Idle keep-alive connections must not starve new ones
+            handle_client_connection(
+                conn,
+                addr,
+                handler,
+                stopping,
+                metrics,
+                access_log,
+                queued=lambda: not connections.empty(),
+            )
+        finally:
+            if limit is not None:
+                limit.release()
 
     logging.debug(f"Worker-{thread_id} has been stopped.")
     return None
 
 
-def serve_forever(
-    address: str, port: int, document_root: Path, n_workers: int
+def serve_threads(
+    sock: socket.socket,
+    handler: Handler,
+    n_workers: int,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+    max_connections: Optional[int] = None,
+    grace_period: float = STOP_TIMEOUT,
 ) -> None:
-    """Open a listener socket and start workers in separate threads.
+    """Accept connections in a thread and hand them to worker threads.
+
+    Connections served and waiting for a free worker are limited by
+    `max_connections`, the ones over it are answered with 503 at once.
+    When interrupted, the server stops accepting connections and workers
+    are given `grace_period` seconds to finish accepted ones.
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    stopping = threading.Event()
+    connections: "queue.Queue[Optional[Tuple[socket.socket, Tuple]]]"
+    connections = queue.Queue()
+    limit = None
+    if max_connections:
+        limit = threading.BoundedSemaphore(max_connections)
 
-        try:
-            sock.bind((address, port))
-        except PermissionError:
-            logging.error(f"Permission denied: {address}:{port}")
-            return None
-        except OSError:
-            logging.error(f"Invalid address / port: {address}:{port}")
-            return None
+    threads = []
+    for i in range(1, n_workers + 1):
+        thread = threading.Thread(
+            target=wait_connection,
+            args=(
+                connections, i, handler, stopping, limit, metrics, access_log
+            ),
+        )
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    # Accepting is kept out of the main thread: KeyboardInterrupt raised
+    # right after `accept` would lose the connection
+    acceptor = threading.Thread(
+        target=accept_connections,
+        args=(
+            sock, connections, n_workers, stopping, limit, metrics, access_log
+        ),
+    )
+    acceptor.daemon = True
+    acceptor.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    finally:
+        stopping.set()
+        deadline = time.monotonic() + grace_period
+        for thread in (acceptor, *threads):
+            thread.join(max(0, deadline - time.monotonic()))
 
-        sock.listen(BACKLOG)
 
-        for i in range(1, n_workers + 1):
-            thread = threading.Thread(
-                target=wait_connection, args=(sock, i, document_root)
+def bind_socket(
+    address: str, port: int, reuse_port: bool = False
+) -> Optional[socket.socket]:
+    """Open a socket bound to the address, None if it is not possible.
+
+    With `reuse_port` several processes may listen on the same port and
+    the kernel balances incoming connections between them.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    try:
+        sock.bind((address, port))
+    except PermissionError:
+        logging.error(f"Permission denied: {address}:{port}")
+        sock.close()
+        return None
+    except OSError:
+        logging.error(f"Invalid address / port: {address}:{port}")
+        sock.close()
+        return None
+
+    return sock
+
+
+def serve(
+    sock: socket.socket,
+    slot: int,
+    handler: Handler,
+    n_workers: int,
+    engine: str,
+    metrics: Optional[Metrics] = None,
+    access_log: Optional[AccessLog] = None,
+    max_connections: Optional[int] = None,
+    grace_period: float = STOP_TIMEOUT,
+) -> None:
+    """Serve a listening socket with the chosen engine until interrupted.
+
+    `slot` is an index of the process among worker processes running
+    at the same time.
+    """
+    if metrics is not None:
+        metrics.use_slot(slot)
+    if access_log is not None:
+        access_log.start()
+
+    try:
+        if engine == "epoll":
+            # Imported here because `evloop` itself depends on `httpd`
+            from .evloop import serve_events
+
+            serve_events(
+                sock,
+                handler,
+                metrics,
+                access_log,
+                max_connections,
+                grace_period,
+            )
+        else:
+            serve_threads(
+                sock,
+                handler,
+                n_workers,
+                metrics,
+                access_log,
+                max_connections,
+                grace_period,
             )
-            thread.daemon = True
-            thread.start()
 
-        logging.info(
-            f"Running on http://{address}:{port}/ (Press CTRL+C to quit)"
+    except KeyboardInterrupt:
+        logging.info("Server is stopping.")
+        return None
+
+    finally:
+        if access_log is not None:
+            access_log.stop()
+
+
+def serve_forever(
+    address: str,
+    port: int,
+    document_root: Path,
+    n_workers: int,
+    engine: str = "threads",
+    cache: Optional[FileCache] = None,
+    compression_cache: Optional[FileCache] = None,
+    paths: Optional[PathCache] = None,
+    autoindex: bool = False,
+    listings: Optional[FileCache] = None,
+    n_processes: int = 1,
+    reuse_port: bool = False,
+    metrics_path: Optional[str] = None,
+    access_log: Optional[AccessLog] = None,
+    max_connections: Optional[int] = None,
+    grace_period: float = STOP_TIMEOUT,
+) -> None:
+    """Open a listener socket and serve it with the chosen engine.
+
+    `threads` engine starts `n_workers` threads handling one connection
+    at a time, `epoll` engine multiplexes all connections in a single
+    thread with non-blocking sockets (`n_workers` is ignored).
+    Small files are kept in memory if `cache` is given, compressed
+    copies of them if `compression_cache` is given. Resolved request
+    targets are remembered in `paths` if it is given.
+    With `autoindex` directories without index file are listed, rendered
+    listings are kept in `listings` if it is given.
+    With `n_processes` > 1 the engine runs in supervised worker processes
+    sharing a listening socket or, with `reuse_port`, each one with its
+    own `SO_REUSEPORT` socket.
+    Metrics of all processes are reported on `metrics_path` if it is given.
+    Responses are logged to `access_log` if it is given, otherwise
+    to the error log.
+    Every process answers connections over `max_connections` with 503.
+    On SIGINT / SIGTERM the server stops accepting connections and
+    finishes accepted ones within `grace_period` seconds.
+    """
+    if engine not in ENGINES:
+        logging.error(f"Unknown engine: {engine}")
+        return None
+
+    handler = partial(
+        handle_request,
+        document_root=document_root,
+        cache=cache,
+        compression_cache=compression_cache,
+        paths=paths,
+        autoindex=autoindex,
+        listings=listings,
+    )
+
+    metrics = None
+    if metrics_path is not None:
+        # Reloaded workers run alongside old ones for a while
+        metrics = Metrics(n_slots=2 * n_processes if n_processes > 1 else 1)
+        handler = partial(
+            serve_metrics, handler=handler, metrics=metrics, path=metrics_path
         )
 
-        try:
-            while True:
-                time.sleep(1)
+    worker = partial(
+        serve,
+        handler=handler,
+        n_workers=n_workers,
+        engine=engine,
+        metrics=metrics,
+        access_log=access_log,
+        max_connections=max_connections,
+        grace_period=grace_period,
+    )
 
-        except KeyboardInterrupt:
-            logging.info("Server is stopping.")
-            return None
+    if n_processes > 1:
+        # Imported here because `prefork` itself depends on `httpd`
+        from .prefork import serve_processes
+
+        serve_processes(
+            address, port, n_processes, worker, reuse_port, grace_period
+        )
+        return None
+
+    sock = bind_socket(address, port)
+    if sock is None:
+        return None
+
+    with sock:
+        sock.listen(BACKLOG)
+        logging.info(
+            f"Running on http://{address}:{port}/ (Press CTRL+C to quit)"
+        )
+        signal.signal(signal.SIGTERM, interrupt)
+        worker(sock, 0)
@@ -0,0 +1,200 @@
+"""
+Request metrics exposed in Prometheus text format on a reserved path.
+
+Values are kept in a flat array of doubles allocated before worker
+processes are forked, so any worker can report totals of all of them.
+Each process writes only to its own slot of the array, so processes
+never wait for each other. Threads of a process share its slot and
+record values under a lock of the process.
+
+"""
+import bisect
+import itertools
+import multiprocessing as mp
+import threading
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .types import HTTPMethod, HTTPRequest, HTTPResponse, HTTPStatus
+
+
+# Upper bounds of request duration histogram buckets in seconds
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "httpserver"
+
+# Requests rejected before their method is known have method None
+METHODS: Tuple[Optional[HTTPMethod], ...] = (None, *HTTPMethod)
+
+# Layout of a block of values for a method and a status,
+# the last bucket is +Inf
+COUNT, DURATION_SUM, BYTES, BUCKETS = range(4)
+BLOCK_SIZE = BUCKETS + len(DURATION_BUCKETS) + 1
+
+Handler = Callable[[HTTPRequest], HTTPResponse]
+
+
+class Metrics:
+    """Counters and request duration histograms of worker processes.
+
+    `n_slots` is the number of processes writing concurrently,
+    a process selects its slot with `use_slot` after it has been forked.
+    """
+
+    def __init__(self, n_slots: int = 1):
+        labels = itertools.product(METHODS, HTTPStatus)
+        self.blocks: Dict[Tuple[Optional[HTTPMethod], HTTPStatus], int] = {
+            label: n * BLOCK_SIZE for n, label in enumerate(labels)
+        }
+        # Blocks are followed by connection counters
+        self.connections = len(self.blocks) * BLOCK_SIZE
+        self.open_connections = self.connections + 1
+        self.slot_size = self.connections + 2
+
+        self.n_slots = n_slots
+        # Indexing a memoryview is faster than a ctypes array
+        shared = mp.RawArray("d", n_slots * self.slot_size)
+        self.values = memoryview(shared).cast("B").cast("d")
+        self.offset = 0
+        # `+=` on an item is not atomic, threads of the threads engine
+        # would lose updates
+        self.lock = threading.Lock()
+
+    def use_slot(self, slot: int) -> None:
+        """Record values of the current process to `slot`.
+        """
+        self.offset = slot * self.slot_size
+        self.lock = threading.Lock()
+        # Connections of a dead process which used the slot are gone
+        self.values[self.offset + self.open_connections] = 0
+
+    def connection_opened(self) -> None:
+        with self.lock:
+            self.values[self.offset + self.connections] += 1
+            self.values[self.offset + self.open_connections] += 1
+
+    def connection_closed(self) -> None:
+        with self.lock:
+            self.values[self.offset + self.open_connections] -= 1
+
+    def observe(
+        self,
+        method: Optional[HTTPMethod],
+        status: HTTPStatus,
+        duration: float,
+        n_bytes: int,
+    ) -> None:
+        """Record a response sent in `duration` seconds.
+        """
+        values = self.values
+        base = self.offset + self.blocks[method, status]
+        bucket = bisect.bisect_left(DURATION_BUCKETS, duration)
+        with self.lock:
+            values[base + COUNT] += 1
+            values[base + DURATION_SUM] += duration
+            values[base + BYTES] += n_bytes
+            values[base + BUCKETS + bucket] += 1
+
+    def totals(self) -> List[float]:
+        """Values summed over all slots.
+        """
+        totals = [0.0] * self.slot_size
+        for offset in range(0, len(self.values), self.slot_size):
+            chunk = self.values[offset : offset + self.slot_size]
+            totals = [x + y for x, y in zip(totals, chunk)]
+        return totals
+
+    def render(self) -> str:
+        """Render metrics in Prometheus text exposition format.
+        """
+        return "".join(f"{line}\n" for line in self.lines(self.totals()))
+
+    def lines(self, totals: List[float]) -> Iterator[str]:
+        blocks = [
+            (method_label(method), status.value[0], base)
+            for (method, status), base in self.blocks.items()
+            if totals[base + COUNT]
+        ]
+
+        name = f"{PREFIX}_requests_total"
+        yield f"# HELP {name} Responses sent."
+        yield f"# TYPE {name} counter"
+        for method, code, base in blocks:
+            value = format_value(totals[base + COUNT])
+            yield f'{name}{{method="{method}",code="{code}"}} {value}'
+
+        name = f"{PREFIX}_response_bytes_total"
+        yield f"# HELP {name} Bytes of responses sent, including headers."
+        yield f"# TYPE {name} counter"
+        for method, code, base in blocks:
+            value = format_value(totals[base + BYTES])
+            yield f'{name}{{method="{method}",code="{code}"}} {value}'
+
+        name = f"{PREFIX}_request_duration_seconds"
+        yield (
+            f"# HELP {name} Time from a parsed request to its response sent."
+        )
+        yield f"# TYPE {name} histogram"
+        for method, code, base in blocks:
+            labels = f'method="{method}",code="{code}"'
+            cumulative = 0.0
+            for n, bound in enumerate((*DURATION_BUCKETS, "+Inf")):
+                cumulative += totals[base + BUCKETS + n]
+                yield (
+                    f'{name}_bucket{{{labels},le="{bound}"}} '
+                    f"{format_value(cumulative)}"
+                )
+            value = format_value(totals[base + DURATION_SUM])
+            yield f"{name}_sum{{{labels}}} {value}"
+            value = format_value(totals[base + COUNT])
+            yield f"{name}_count{{{labels}}} {value}"
+
+        name = f"{PREFIX}_connections_total"
+        yield f"# HELP {name} Accepted client connections."
+        yield f"# TYPE {name} counter"
+        yield f"{name} {format_value(totals[self.connections])}"
+
+        name = f"{PREFIX}_open_connections"
+        yield f"# HELP {name} Client connections currently open."
+        yield f"# TYPE {name} gauge"
+        yield f"{name} {format_value(totals[self.open_connections])}"
+
+
+def method_label(method: Optional[HTTPMethod]) -> str:
+    return "unknown" if method is None else str(method)
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def serve_metrics(
+    request: HTTPRequest, handler: Handler, metrics: Metrics, path: str
+) -> HTTPResponse:
+    """Answer requests for `path` with metrics, pass others to `handler`.
+    """
+    if request.target.partition("?")[0] != path:
+        return handler(request)
+
+    body = metrics.render().encode("utf-8")
+    return HTTPResponse(
+        status=HTTPStatus.OK,
+        body=b"" if request.method is HTTPMethod.HEAD else body,
+        content_type=CONTENT_TYPE,
+        content_length=len(body),
+    )
@@ -0,0 +1,159 @@
+import enum
+import re
+import urllib.parse
+
+from typing import Dict, Optional
+
+from .types import HTTPException, HTTPMethod, HTTPRequest, HTTPStatus
+
+
+MAX_REQUEST_LINE_SIZE = 4 * 1024
+MAX_HEADER_LINE_SIZE = 4 * 1024
+MAX_HEADERS = 64
+# Whole request head: request line and headers
+MAX_HEAD_SIZE = 8 * 1024
+
+VERSION_RE = re.compile(r"HTTP/(\d)\.\d")
+
+
+class State(enum.Enum):
+    REQUEST_LINE = enum.auto()
+    HEADERS = enum.auto()
+
+
+class RequestParser:
+    """Incremental parser of request heads.
+
+    Bytes are fed as they are received from a (blocking or non-blocking)
+    socket and each of them is scanned for a line end only once, complete
+    lines are parsed right away. Bytes following a parsed head (pipelined
+    requests) stay in the buffer for the next call of `parse`.
+
+    Malformed requests are rejected with `400 Bad Request`, too long
+    request line with `414 URI Too Long`, too long or too many header
+    lines with `431 Request Header Fields Too Large` and a head larger
+    than `MAX_HEAD_SIZE` with `413 Entity Too Large`.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.reset()
+
+    def reset(self) -> None:
+        """Prepare for the next request head.
+        """
+        self.state = State.REQUEST_LINE
+        # Start of the current line and position up to which
+        # the buffer is known to have no line end
+        self.line_start = 0
+        self.scanned = 0
+        self.method: Optional[HTTPMethod] = None
+        self.target = ""
+        self.version = ""
+        self.headers: Dict[str, str] = {}
+        self.n_headers = 0
+
+    @property
+    def pending(self) -> bool:
+        """Whether a part of the next request has been received.
+        """
+        return bool(self.buffer)
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+
+    def parse(self, eof: bool = False) -> Optional[HTTPRequest]:
+        """Return the next request or None if more bytes are needed.
+
+        With `eof` no more bytes will be received, so an incomplete head
+        is an error.
+        """
+        while True:
+            end = self.buffer.find(b"\n", self.scanned)
+            if end < 0:
+                self.scanned = len(self.buffer)
+                self.check_size(self.scanned)
+                if eof and self.buffer:
+                    raise HTTPException(HTTPStatus.BAD_REQUEST)
+                return None
+
+            self.check_size(end)
+            line = bytes(self.buffer[self.line_start : end])
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            self.line_start = self.scanned = end + 1
+
+            if self.state is State.REQUEST_LINE:
+                if not line:
+                    # Empty lines preceding a request line are ignored
+                    del self.buffer[: self.line_start]
+                    self.line_start = self.scanned = 0
+                    continue
+                self.parse_request_line(line)
+                self.state = State.HEADERS
+
+            elif line:
+                self.parse_header(line)
+
+            else:
+                request = HTTPRequest(
+                    method=self.method,
+                    target=self.target,
+                    version=self.version,
+                    headers=self.headers,
+                )
+                del self.buffer[: self.line_start]
+                self.reset()
+                return request
+
+    def check_size(self, end: int) -> None:
+        """Check limits for a line ending (or not ended yet) at `end`.
+        """
+        if end - self.line_start > MAX_REQUEST_LINE_SIZE and (
+            self.state is State.REQUEST_LINE
+        ):
+            raise HTTPException(HTTPStatus.URI_TOO_LONG)
+        if end - self.line_start > MAX_HEADER_LINE_SIZE:
+            raise HTTPException(HTTPStatus.HEADER_FIELDS_TOO_LARGE)
+        if end > MAX_HEAD_SIZE:
+            raise HTTPException(HTTPStatus.ENTITY_TOO_LARGE)
+
+    def parse_request_line(self, line: bytes) -> None:
+        try:
+            raw_method, raw_target, version = str(line, "iso-8859-1").split()
+        except ValueError:
+            raise HTTPException(HTTPStatus.BAD_REQUEST)
+
+        match = VERSION_RE.fullmatch(version)
+        if match is None:
+            raise HTTPException(HTTPStatus.BAD_REQUEST)
+        if match.group(1) != "1":
+            raise HTTPException(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED)
+
+        try:
+            self.method = HTTPMethod[raw_method]
+        except KeyError:
+            raise HTTPException(HTTPStatus.METHOD_NOT_ALLOWED)
+
+        self.target = urllib.parse.unquote(raw_target)
+        self.version = version
+
+    def parse_header(self, line: bytes) -> None:
+        if line[:1] in (b" ", b"\t"):
+            # Obsolete line folding
+            raise HTTPException(HTTPStatus.BAD_REQUEST)
+
+        self.n_headers += 1
+        if self.n_headers > MAX_HEADERS:
+            raise HTTPException(HTTPStatus.HEADER_FIELDS_TOO_LARGE)
+
+        name, sep, value = str(line, "iso-8859-1").partition(":")
+        if not sep or not name or name != name.rstrip():
+            raise HTTPException(HTTPStatus.BAD_REQUEST)
+
+        name, value = name.lower(), value.strip()
+        if name in self.headers:
+            # Repeated fields are equivalent to a comma separated list
+            self.headers[name] += ", " + value
+        else:
+            self.headers[name] = value
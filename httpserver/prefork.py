@@ -0,0 +1,215 @@
+"""
+Pre-fork mode: several worker processes serve the same port, so request
+processing is not limited by a single GIL.
+
+Workers accept connections from a listening socket inherited from the
+supervisor, so connections queued on it survive restarts and reloads.
+With `reuse_port` every worker listens on its own `SO_REUSEPORT` socket
+instead: the kernel balances connections between them, but connections
+still queued on a socket of a stopped worker are reset. The supervisor
+restarts workers which have died. SIGTERM / SIGINT stop workers and the
+server, SIGHUP replaces workers with fresh ones.
+
+"""
+import logging
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import signal
+import socket
+import time
+
+from typing import Callable, Dict, List, Optional
+
+from .httpd import BACKLOG, STOP_TIMEOUT, bind_socket, interrupt
+
+
+RESTART_DELAY = 1
+# Time for a worker process to exit after its grace period is over
+SHUTDOWN_TIMEOUT = 5
+SUPERVISE_INTERVAL = 0.5
+
+# Called with a listening socket and a slot of the process: slots of
+# processes running at the same time (during reload too) are different
+Worker = Callable[[socket.socket, int], None]
+
+
+def run_worker(
+    address: str,
+    port: int,
+    worker: Worker,
+    slot: int,
+    sock: Optional[socket.socket] = None,
+) -> None:
+    """Entry point of a worker process.
+    """
+    # Handlers are inherited from the supervisor on fork
+    signal.signal(signal.SIGTERM, interrupt)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    if sock is None:
+        sock = bind_socket(address, port, reuse_port=True)
+        if sock is None:
+            return None
+        sock.listen(BACKLOG)
+
+    with sock:
+        worker(sock, slot)
+
+
+class Supervisor:
+    """Keep `n_processes` worker processes running.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        port: int,
+        n_processes: int,
+        worker: Worker,
+        sock: Optional[socket.socket] = None,
+        grace_period: float = STOP_TIMEOUT,
+    ):
+        self.address = address
+        self.port = port
+        self.n_processes = n_processes
+        self.worker = worker
+        self.sock = sock
+        self.grace_period = grace_period
+        self.processes: List[mp.Process] = []
+        self.started_at: Dict[int, float] = {}
+        # Reloads alternate between two sets of slots
+        self.generation = 0
+        self.stopping = False
+        self.reloading = False
+
+    def start_process(self, n: int) -> mp.Process:
+        """Start `n`-th worker process of the current generation.
+        """
+        slot = n + self.generation * self.n_processes
+        process = mp.Process(
+            target=run_worker,
+            args=(self.address, self.port, self.worker, slot, self.sock),
+        )
+        process.daemon = True
+        process.start()
+        self.started_at[process.pid] = time.monotonic()
+        logging.info(f"Worker process {process.pid} has been started.")
+        return process
+
+    def stop_processes(self, processes: List[mp.Process]) -> None:
+        """Ask processes to stop and wait for them, kill if they are stuck.
+        """
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.grace_period + SHUTDOWN_TIMEOUT
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.error(f"Worker process {process.pid} is killed.")
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+            self.started_at.pop(process.pid, None)
+
+    def reload(self) -> None:
+        """Replace all workers, new ones are started before old ones stop.
+        """
+        logging.info("Reloading worker processes.")
+        old_processes = self.processes
+        self.generation = 1 - self.generation
+        self.processes = [
+            self.start_process(n) for n in range(self.n_processes)
+        ]
+        self.stop_processes(old_processes)
+
+    def restart_dead(self) -> None:
+        now = time.monotonic()
+        for n, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+
+            # Don't spin if a worker can't start at all
+            if now - self.started_at.get(process.pid, 0) < RESTART_DELAY:
+                continue
+
+            logging.error(
+                f"Worker process {process.pid} has died "
+                f"(exit code {process.exitcode}), restarting."
+            )
+            self.started_at.pop(process.pid, None)
+            self.processes[n] = self.start_process(n)
+
+    def run(self) -> None:
+        self.processes = [
+            self.start_process(n) for n in range(self.n_processes)
+        ]
+
+        while not self.stopping:
+            mp.connection.wait(
+                [p.sentinel for p in self.processes if p.is_alive()],
+                SUPERVISE_INTERVAL,
+            )
+            if self.reloading:
+                self.reloading = False
+                self.reload()
+            elif not self.stopping:
+                self.restart_dead()
+
+        logging.info("Server is stopping.")
+        self.stop_processes(self.processes)
+
+
+def serve_processes(
+    address: str,
+    port: int,
+    n_processes: int,
+    worker: Worker,
+    reuse_port: bool = False,
+    grace_period: float = STOP_TIMEOUT,
+) -> None:
+    """Run `worker` for a listening socket in supervised processes.
+
+    Stopped workers are given `grace_period` seconds to finish accepted
+    connections before they are killed.
+    """
+    if reuse_port and not hasattr(socket, "SO_REUSEPORT"):
+        logging.warning("SO_REUSEPORT is not supported, sharing a socket.")
+        reuse_port = False
+
+    # The socket is never listened to with `SO_REUSEPORT`, it just checks
+    # the address and holds the port while workers are restarted
+    sock = bind_socket(address, port, reuse_port=reuse_port)
+    if sock is None:
+        return None
+
+    with sock:
+        if not reuse_port:
+            sock.listen(BACKLOG)
+
+        supervisor = Supervisor(
+            address,
+            port,
+            n_processes,
+            worker,
+            sock=None if reuse_port else sock,
+            grace_period=grace_period,
+        )
+
+        def stop(signum, frame):
+            supervisor.stopping = True
+
+        def reload(signum, frame):
+            supervisor.reloading = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, reload)
+
+        logging.info(
+            f"Running {n_processes} processes on http://{address}:{port}/ "
+            f"(Press CTRL+C to quit)"
+        )
+        supervisor.run()
@@ -0,0 +1,95 @@
+import re
+import uuid
+
+from typing import List, Optional, Tuple
+
+
+MAX_RANGES = 16
+# str.isdigit() accepts non-ASCII digits int() can't parse
+DIGITS_RE = re.compile(r"[0-9]+")
+
+# Inclusive positions of the first and the last byte
+ByteRange = Tuple[int, int]
+# Bytes sent before a slice of a file, slice offset and length
+FilePart = Tuple[bytes, int, int]
+
+
+def parse_ranges(header: str, size: int) -> Optional[List[ByteRange]]:
+    """Parse `Range` header value for a file of `size` bytes.
+
+    Returns None if the header is malformed and must be ignored, an empty
+    list if none of the ranges is satisfiable. Overlapping and adjacent
+    ranges are coalesced.
+    """
+    unit, _, raw_ranges = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    for raw_range in raw_ranges.split(","):
+        raw_start, sep, raw_end = raw_range.strip().partition("-")
+        raw_start, raw_end = raw_start.strip(), raw_end.strip()
+
+        if not sep or not (raw_start or raw_end):
+            return None
+        if not all(DIGITS_RE.fullmatch(x) for x in (raw_start, raw_end) if x):
+            return None
+
+        if not raw_start:
+            # Suffix range: last N bytes
+            suffix = int(raw_end)
+            if suffix and size:
+                ranges.append((max(0, size - suffix), size - 1))
+            continue
+
+        start = int(raw_start)
+        end = int(raw_end) if raw_end else size - 1
+        if raw_end and end < start:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    coalesced: List[ByteRange] = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = coalesced[-1][0], max(end, coalesced[-1][1])
+        else:
+            coalesced.append((start, end))
+
+    return coalesced
+
+
+def content_range(byte_range: ByteRange, size: int) -> str:
+    start, end = byte_range
+    return f"bytes {start}-{end}/{size}"
+
+
+def multipart(
+    ranges: List[ByteRange], size: int, content_type: str
+) -> Tuple[str, List[FilePart], bytes]:
+    """Layout of `multipart/byteranges` body.
+
+    Returns content type of the whole body, file slices with part
+    headers preceding each of them and the closing delimiter.
+    """
+    boundary = uuid.uuid4().hex
+
+    parts = [
+        (
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: {content_range(byte_range, size)}\r\n"
+                f"\r\n"
+            ).encode("utf-8"),
+            byte_range[0],
+            byte_range[1] - byte_range[0] + 1,
+        )
+        for byte_range in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    return f"multipart/byteranges; boundary={boundary}", parts, closing
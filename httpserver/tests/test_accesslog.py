@@ -0,0 +1,115 @@
+import pathlib
+import re
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+from httpserver import accesslog
+from httpserver.accesslog import AccessLog, escape
+from httpserver.types import HTTPMethod, HTTPRequest, HTTPResponse, HTTPStatus
+
+
+# Quoted values may contain escaped quotes
+QUOTED = r'"((?:[^"\\]|\\.)*)"'
+LINE_RE = re.compile(
+    rf"(?P<host>\S+) - - \[(?P<time>[^\]]+)\] {QUOTED} "
+    rf"(?P<status>\d{{3}}) (?P<size>\d+|-) {QUOTED} {QUOTED}\n"
+)
+TIME_RE = r"\d\d/\w{3}/\d{4}:[\d:]{8} [+-]\d{4}"
+
+
+class TestAccessLog(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = pathlib.Path(tmp.name) / "access.log"
+
+    def response(self, status=HTTPStatus.OK, body=b"hello"):
+        return HTTPResponse(status, body, "text/plain", len(body))
+
+    def test_combined_format(self):
+        """Records are written in Combined Log Format
+        """
+        log = AccessLog(self.path)
+        log.start()
+        request = HTTPRequest(
+            HTTPMethod.GET,
+            "/index.html",
+            headers={"referer": "http://x/", "user-agent": 'A "quoted" UA'},
+        )
+        log.record(("10.0.0.1", 1234), request, self.response())
+        log.record(
+            ("10.0.0.2", 1234),
+            None,
+            HTTPResponse.error(HTTPStatus.BAD_REQUEST)._replace(body=b""),
+        )
+        log.stop()
+
+        first, second = self.path.read_text().splitlines(keepends=True)
+        match = LINE_RE.fullmatch(first)
+        self.assertIsNotNone(match, first)
+        self.assertEqual(match["host"], "10.0.0.1")
+        self.assertRegex(match["time"], TIME_RE)
+        self.assertEqual(match[3], "GET /index.html HTTP/1.1")
+        self.assertEqual(match["status"], "200")
+        self.assertEqual(match["size"], "5")
+        self.assertEqual(match[6], "http://x/")
+        self.assertEqual(match[7], r'A \"quoted\" UA')
+
+        self.assertTrue(second.startswith("10.0.0.2 - - ["), second)
+        self.assertTrue(second.endswith('"-" 400 - "-" "-"\n'), second)
+
+    def test_written_in_background(self):
+        """Records are written by the writer thread without stopping it
+        """
+        log = AccessLog(self.path)
+        with mock.patch.object(accesslog, "FLUSH_INTERVAL", 0.05):
+            log.start()
+            request = HTTPRequest(HTTPMethod.HEAD, "/")
+            log.record(("127.0.0.1", 1), request, self.response(body=b""))
+            deadline = time.monotonic() + 5
+            while True:
+                text = self.path.read_text()
+                if text or time.monotonic() > deadline:
+                    break
+                time.sleep(0.05)
+            self.assertIn('"HEAD / HTTP/1.1" 200 -', text)
+            log.stop()
+
+    def test_backpressure(self):
+        """Records are sampled and then dropped when the queue is busy
+        """
+        log = AccessLog(self.path, queue_size=20)
+        request = HTTPRequest(HTTPMethod.GET, "/")
+        for _ in range(10):
+            log.record(("127.0.0.1", 1), request, self.response())
+        self.assertEqual(len(log.records), 10)
+
+        # Half full: every SAMPLE_EVERY-th record is kept
+        for _ in range(accesslog.SAMPLE_EVERY * 5):
+            log.record(("127.0.0.1", 1), request, self.response())
+        self.assertEqual(len(log.records), 15)
+
+        # Full: everything is dropped
+        log.records.extend([log.records[0]] * 5)
+        skipped = log.n_skipped
+        for _ in range(accesslog.SAMPLE_EVERY * 2):
+            log.record(("127.0.0.1", 1), request, self.response())
+        self.assertEqual(len(log.records), 20)
+        self.assertEqual(log.n_skipped, skipped + accesslog.SAMPLE_EVERY * 2)
+
+        with self.assertLogs(level="WARNING") as cm:
+            log.start()
+            log.stop()
+        self.assertIn("records skipped", cm.output[0])
+        self.assertEqual(len(self.path.read_text().splitlines()), 20)
+
+    def test_escape(self):
+        """Quotes, backslashes and control characters are escaped
+        """
+        self.assertEqual(escape('a"b'), 'a\\"b')
+        self.assertEqual(escape("a\\b"), "a\\\\b")
+        self.assertEqual(escape("a\nb\\"), "a\\nb\\\\")
+        self.assertEqual(escape("/путь"), "/путь")
@@ -0,0 +1,139 @@
+import os
+import pathlib
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+from httpserver import autoindex
+from httpserver.autoindex import (
+    list_directory,
+    n_pages,
+    parse_page,
+    render_listing,
+)
+from httpserver.cache import FileCache
+from httpserver.httpd import handle_request
+from httpserver.types import HTTPMethod, HTTPRequest, HTTPStatus
+
+
+class TestAutoindex(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = pathlib.Path(tmp.name).resolve()
+
+        (self.root / "list").mkdir()
+        (self.root / "list" / "b.txt").write_text("bb")
+        (self.root / "list" / "a <&>.txt").write_text("a")
+        (self.root / "list" / ".hidden").write_text("")
+        (self.root / "list" / "zdir").mkdir()
+        self.age()
+
+    def age(self):
+        """Make mtimes of all files old enough to be trusted.
+        """
+        past = time.time() - 10
+        for path in (self.root, *self.root.rglob("*")):
+            os.utime(path, (past, past))
+
+    def get(self, target, listings=None, method=HTTPMethod.GET):
+        return handle_request(
+            HTTPRequest(method, target),
+            self.root,
+            autoindex=True,
+            listings=listings,
+        )
+
+    def test_list_directory(self):
+        """Subdirectories go first, hidden entries are skipped
+        """
+        entries = list_directory(self.root / "list")
+        self.assertEqual(
+            [(e.name, e.is_dir) for e in entries],
+            [("zdir", True), ("a <&>.txt", False), ("b.txt", False)],
+        )
+        self.assertEqual(entries[2].size, 2)
+
+    def test_render_listing(self):
+        """Names are escaped in text and quoted in links
+        """
+        entries = list_directory(self.root / "list")
+        body = render_listing("/my dir/", entries, 1).decode("utf-8")
+        self.assertIn("<title>Index of /my dir/</title>", body)
+        self.assertIn('<a href="/my%20dir/zdir/">zdir/</a>', body)
+        self.assertIn(
+            '<a href="/my%20dir/a%20%3C%26%3E.txt">a &lt;&amp;&gt;.txt</a>',
+            body,
+        )
+        self.assertIn('<a href="/">../</a>', body)
+        self.assertNotIn("Page 1", body)
+
+    def test_pages(self):
+        """Huge directories are split into pages
+        """
+        self.assertEqual(parse_page(""), 1)
+        self.assertEqual(parse_page("page=3"), 3)
+        self.assertIsNone(parse_page("page=0"))
+        self.assertIsNone(parse_page("page=x"))
+        self.assertEqual(n_pages(0), 1)
+
+        entries = list_directory(self.root / "list")
+        with mock.patch.object(autoindex, "PAGE_SIZE", 2):
+            self.assertEqual(n_pages(len(entries)), 2)
+            first = render_listing("/list/", entries, 1).decode("utf-8")
+            second = render_listing("/list/", entries, 2).decode("utf-8")
+
+        self.assertIn("zdir/", first)
+        self.assertNotIn("b.txt", first)
+        self.assertIn('Page 1 of 2 | <a href="/list/?page=2">Next</a>', first)
+        self.assertIn("b.txt", second)
+        self.assertNotIn("zdir/", second)
+        self.assertIn('<a href="/list/?page=1">Previous</a> | Page 2', second)
+
+    def test_listing_response(self):
+        """Directory without index file is listed
+        """
+        response = self.get("/list")
+        self.assertEqual(response.status, HTTPStatus.OK)
+        self.assertEqual(response.content_type, autoindex.CONTENT_TYPE)
+        self.assertIn(b'href="/list/b.txt"', response.body)
+
+        response = self.get("/list/", method=HTTPMethod.HEAD)
+        self.assertEqual(response.body, b"")
+        self.assertGreater(response.content_length, 0)
+
+        for target in ("/list/?page=2", "/list/?page=x", "/absent/"):
+            with self.subTest(target=target):
+                response = self.get(target)
+                self.assertEqual(response.status, HTTPStatus.NOT_FOUND)
+
+        # Index file is served as usual
+        (self.root / "list" / "index.html").write_text("index")
+        response = self.get("/list/")
+        response.close()
+        self.assertEqual(response.content_type, "text/html")
+        self.assertEqual(response.content_length, 5)
+
+    def test_disabled(self):
+        """Directories are not listed by default
+        """
+        request = HTTPRequest(HTTPMethod.GET, "/list/")
+        response = handle_request(request, self.root)
+        self.assertEqual(response.status, HTTPStatus.NOT_FOUND)
+
+    def test_cached_listing(self):
+        """Listing is rendered again once the directory changes
+        """
+        listings = FileCache(1024 * 1024, 1024 * 1024, 0)
+        first = self.get("/list/", listings)
+        self.assertEqual(len(listings), 1)
+        self.assertIs(self.get("/list/", listings).body, first.body)
+
+        (self.root / "list" / "c.txt").write_text("c")
+        response = self.get("/list/", listings)
+        self.assertIsNot(response.body, first.body)
+        self.assertIn(b"c.txt", response.body)
+        # Just changed directory is not cached
+        self.assertEqual(len(listings), 0)
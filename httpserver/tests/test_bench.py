@@ -0,0 +1,71 @@
+import pathlib
+import unittest
+
+from httpserver import bench
+
+from test_server import find_free_port, start_server
+
+
+class TestRunResult(unittest.TestCase):
+    def test_percentile(self):
+        result = bench.RunResult(
+            label="",
+            requests=100,
+            errors=0,
+            elapsed=2.0,
+            latencies=[n / 1000 for n in range(1, 101)],
+        )
+        self.assertEqual(result.rps, 50)
+        self.assertEqual(result.percentile(50), 0.05)
+        self.assertEqual(result.percentile(99), 0.099)
+        self.assertEqual(result.percentile(100), 0.1)
+
+    def test_no_latencies(self):
+        result = bench.RunResult("", 0, 0, 1.0, [])
+        self.assertNotEqual(result.percentile(50), result.percentile(50))
+
+
+class TestLoad(unittest.TestCase):
+    root = pathlib.Path(__file__).parent
+
+    @classmethod
+    def setUpClass(cls):
+        cls.port = find_free_port()
+        cls.server = start_server(
+            bench.HOST, cls.port, cls.root, 4, engine="epoll"
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.join()
+
+    def test_collect_targets(self):
+        targets = bench.collect_targets(self.root, "httptest")
+        self.assertIn("/httptest/space%20in%20name.txt", targets)
+        self.assertIn("/httptest/dir2/page.html", targets)
+
+    def test_run_load(self):
+        targets = ["/httptest/dir2/page.html", "/httptest/splash.css"]
+        for method in ("GET", "HEAD"):
+            for keep_alive in (True, False):
+                result = bench.run_load(
+                    self.port, targets, 2, 0.2, method, keep_alive
+                )
+                self.assertGreater(result.requests, 0)
+                self.assertEqual(result.errors, 0)
+                self.assertEqual(len(result.latencies), result.requests)
+
+    def test_client_processes(self):
+        targets = ["/httptest/dir2/page.html", "/httptest/splash.css"]
+        result = bench.run_load(
+            self.port, targets, 4, 0.2, "HEAD", n_processes=2
+        )
+        self.assertGreater(result.requests, 0)
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.latencies, sorted(result.latencies))
+
+    def test_errors(self):
+        result = bench.run_load(self.port, ["/httptest/missing"], 1, 0.1)
+        self.assertGreater(result.errors, 0)
+        self.assertEqual(result.errors, result.requests)
@@ -0,0 +1,216 @@
+import os
+import pathlib
+import tempfile
+import time
+import unittest
+
+from httpserver.cache import CacheEntry, FileCache, PathCache, stat_key
+from httpserver.httpd import resolve_target
+from httpserver.types import HTTPStatus
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = pathlib.Path(tmp.name)
+
+    def make_entry(self, name, body):
+        path = self.root / name
+        path.write_bytes(body)
+        return CacheEntry(
+            path=path,
+            index=False,
+            content_type="text/plain",
+            headers=b"",
+            body=body,
+            key=stat_key(path.stat()),
+        )
+
+    def test_get_put(self):
+        """Stored entry is returned
+        """
+        cache = FileCache(100, 100, 60)
+        entry = self.make_entry("a.txt", b"a" * 10)
+        self.assertIsNone(cache.get(entry.path))
+        self.assertTrue(cache.put(entry.path, entry))
+        self.assertIs(cache.get(entry.path), entry)
+        self.assertEqual(cache.size, 10)
+
+    def test_too_large(self):
+        """Files above the limit are not cached
+        """
+        cache = FileCache(100, 5, 60)
+        entry = self.make_entry("a.txt", b"a" * 10)
+        self.assertFalse(cache.put(entry.path, entry))
+        self.assertIsNone(cache.get(entry.path))
+
+    def test_lru_eviction(self):
+        """Least recently used entries are evicted first
+        """
+        cache = FileCache(30, 100, 60)
+        a = self.make_entry("a.txt", b"a" * 10)
+        b = self.make_entry("b.txt", b"b" * 10)
+        c = self.make_entry("c.txt", b"c" * 10)
+        d = self.make_entry("d.txt", b"d" * 10)
+        for entry in (a, b, c):
+            cache.put(entry.path, entry)
+
+        cache.get(a.path)
+        cache.put(d.path, d)
+
+        self.assertIsNone(cache.get(b.path))
+        for entry in (a, c, d):
+            self.assertIs(cache.get(entry.path), entry)
+        self.assertEqual(cache.size, 30)
+
+    def test_revalidation(self):
+        """Changed file is dropped after revalidation interval
+        """
+        cache = FileCache(100, 100, 0.05)
+        entry = self.make_entry("a.txt", b"a" * 10)
+        cache.put(entry.path, entry)
+
+        entry.path.write_bytes(b"b" * 20)
+        self.assertIs(cache.get(entry.path), entry)
+
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(entry.path))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_revalidation_unchanged(self):
+        """Unchanged file stays in cache
+        """
+        cache = FileCache(100, 100, 0.05)
+        entry = self.make_entry("a.txt", b"a" * 10)
+        cache.put(entry.path, entry)
+        time.sleep(0.1)
+        self.assertIs(cache.get(entry.path), entry)
+
+    def test_removed_file(self):
+        """Removed file is dropped after revalidation interval
+        """
+        cache = FileCache(100, 100, 0)
+        entry = self.make_entry("a.txt", b"a" * 10)
+        cache.put(entry.path, entry)
+        os.remove(entry.path)
+        self.assertIsNone(cache.get(entry.path))
+
+
+class TestPathCache(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = pathlib.Path(tmp.name).resolve()
+
+        (self.root / "dir").mkdir()
+        (self.root / "dir" / "a.html").write_text("a")
+        (self.root / "dir" / "index.html").write_text("index")
+        (self.root / "b.txt").write_text("b")
+        self.age()
+
+    def age(self):
+        """Make mtimes of all files old enough to be trusted.
+        """
+        past = time.time() - 10
+        for path in (self.root, *self.root.rglob("*")):
+            os.utime(path, (past, past), follow_symlinks=False)
+
+    def resolve(self, cache, target):
+        resolved = cache.get(target)
+        if resolved is None:
+            resolved = resolve_target(self.root, target)
+            cache.put(target, resolved)
+        return resolved
+
+    def test_resolve_target(self):
+        """Targets are resolved to files and checked
+        """
+        resolved = resolve_target(self.root, "dir/a.html")
+        self.assertEqual(resolved.status, HTTPStatus.OK)
+        self.assertEqual(resolved.path, self.root / "dir" / "a.html")
+        self.assertEqual(resolved.content_type, "text/html")
+        self.assertFalse(resolved.index)
+
+        resolved = resolve_target(self.root, "dir/")
+        self.assertEqual(resolved.status, HTTPStatus.OK)
+        self.assertEqual(resolved.path, self.root / "dir" / "index.html")
+        self.assertEqual(resolved.cache_key, self.root / "dir")
+        self.assertTrue(resolved.index)
+
+        for target, status in (
+            ("dir/a.html/", HTTPStatus.NOT_FOUND),
+            ("dir/absent.html", HTTPStatus.NOT_FOUND),
+            ("../b.txt", HTTPStatus.FORBIDDEN),
+            ("dir/../../etc/passwd", HTTPStatus.FORBIDDEN),
+            ("b.txt", HTTPStatus.OK),
+        ):
+            with self.subTest(target=target):
+                resolved = resolve_target(self.root, target)
+                self.assertEqual(resolved.status, status)
+
+    def test_hit(self):
+        """Unchanged targets are not resolved again
+        """
+        cache = PathCache(10)
+        resolved = self.resolve(cache, "dir/a.html")
+        self.assertIs(cache.get("dir/a.html"), resolved)
+        self.assertIs(self.resolve(cache, "dir/a.html"), resolved)
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidation(self):
+        """Entries are dropped once directories on their path change
+        """
+        cache = PathCache(10)
+        self.assertEqual(
+            self.resolve(cache, "dir/new.html").status, HTTPStatus.NOT_FOUND
+        )
+        self.assertEqual(self.resolve(cache, "dir/").status, HTTPStatus.OK)
+        self.assertEqual(len(cache), 2)
+
+        (self.root / "dir" / "new.html").write_text("new")
+        self.assertIsNone(cache.get("dir/new.html"))
+        self.assertIsNone(cache.get("dir/"))
+        self.assertEqual(len(cache), 0)
+
+        self.age()
+        (self.root / "dir" / "index.html").unlink()
+        self.assertEqual(
+            self.resolve(cache, "dir/").status, HTTPStatus.NOT_FOUND
+        )
+
+    def test_replaced_by_symlink(self):
+        """Symlink to a file out of the root is noticed at once
+        """
+        outside = tempfile.NamedTemporaryFile(suffix=".txt")
+        self.addCleanup(outside.close)
+
+        cache = PathCache(10)
+        self.assertEqual(self.resolve(cache, "b.txt").status, HTTPStatus.OK)
+        (self.root / "b.txt").unlink()
+        (self.root / "b.txt").symlink_to(outside.name)
+        self.assertEqual(
+            self.resolve(cache, "b.txt").status, HTTPStatus.FORBIDDEN
+        )
+
+    def test_recently_changed(self):
+        """Paths through just changed directories are not remembered
+        """
+        cache = PathCache(10)
+        (self.root / "dir" / "new.html").write_text("new")
+        resolved = resolve_target(self.root, "dir/new.html")
+        self.assertFalse(cache.put("dir/new.html", resolved))
+        self.assertIsNone(cache.get("dir/new.html"))
+
+    def test_lru_eviction(self):
+        """Least recently used entries are evicted first
+        """
+        cache = PathCache(2)
+        self.resolve(cache, "dir/a.html")
+        self.resolve(cache, "b.txt")
+        cache.get("dir/a.html")
+        self.resolve(cache, "dir/")
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get("dir/a.html"))
+        self.assertIsNone(cache.get("b.txt"))
@@ -0,0 +1,43 @@
+import unittest
+import zlib
+
+from unittest import mock
+
+from httpserver import encoding
+from httpserver.encoding import accepted_encodings, compress
+
+
+class TestAcceptedEncodings(unittest.TestCase):
+    def test_preferences(self):
+        """Encodings are ordered by client weights, then by server order
+        """
+        self.assertEqual(accepted_encodings("gzip"), ["gzip"])
+        self.assertEqual(accepted_encodings("gzip, br"), ["br", "gzip"])
+        self.assertEqual(
+            accepted_encodings("br;q=0.5, gzip;q=0.8"), ["gzip", "br"]
+        )
+        self.assertEqual(accepted_encodings("*"), ["br", "gzip"])
+        self.assertEqual(accepted_encodings("*;q=0.1, gzip"), ["gzip", "br"])
+
+    def test_not_acceptable(self):
+        """Encodings with zero weight are not acceptable
+        """
+        self.assertEqual(accepted_encodings("identity"), [])
+        self.assertEqual(accepted_encodings("gzip;q=0, deflate"), [])
+        self.assertEqual(accepted_encodings("*;q=0"), [])
+        self.assertEqual(accepted_encodings("gzip;q=x"), [])
+
+
+class TestCompress(unittest.TestCase):
+    def test_gzip(self):
+        """Gzip compression
+        """
+        data = b"a" * 1000
+        self.assertEqual(zlib.decompress(compress(data, "gzip"), 31), data)
+
+    def test_brotli_unavailable(self):
+        """Brotli can't be applied without `brotli` package
+        """
+        with mock.patch.object(encoding, "brotli", None):
+            self.assertFalse(encoding.can_compress("br"))
+            self.assertTrue(encoding.can_compress("gzip"))
@@ -0,0 +1,139 @@
+import multiprocessing as mp
+import sys
+import threading
+import unittest
+
+from httpserver.metrics import Metrics, serve_metrics
+from httpserver.types import HTTPMethod, HTTPRequest, HTTPResponse, HTTPStatus
+
+
+def samples(text):
+    """Parse exposition format into a dict of sample values.
+    """
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            result[name] = float(value)
+    return result
+
+
+class TestMetrics(unittest.TestCase):
+    def test_observe(self):
+        """Responses are counted by method and status
+        """
+        metrics = Metrics()
+        metrics.observe(HTTPMethod.GET, HTTPStatus.OK, 0.002, 100)
+        metrics.observe(HTTPMethod.GET, HTTPStatus.OK, 0.2, 50)
+        metrics.observe(None, HTTPStatus.BAD_REQUEST, 0.0001, 10)
+
+        values = samples(metrics.render())
+        ok = 'method="GET",code="200"'
+        self.assertEqual(values[f"httpserver_requests_total{{{ok}}}"], 2)
+        self.assertEqual(
+            values[f"httpserver_response_bytes_total{{{ok}}}"], 150
+        )
+        self.assertEqual(
+            values['httpserver_requests_total{method="unknown",code="400"}'],
+            1,
+        )
+        self.assertNotIn(
+            'httpserver_requests_total{method="HEAD",code="200"}', values
+        )
+
+        duration = "httpserver_request_duration_seconds"
+        self.assertEqual(values[f'{duration}_bucket{{{ok},le="0.001"}}'], 0)
+        self.assertEqual(values[f'{duration}_bucket{{{ok},le="0.0025"}}'], 1)
+        self.assertEqual(values[f'{duration}_bucket{{{ok},le="0.25"}}'], 2)
+        self.assertEqual(values[f'{duration}_bucket{{{ok},le="+Inf"}}'], 2)
+        self.assertAlmostEqual(values[f"{duration}_sum{{{ok}}}"], 0.202)
+        self.assertEqual(values[f"{duration}_count{{{ok}}}"], 2)
+
+    def test_connections(self):
+        """Accepted and open connections are counted
+        """
+        metrics = Metrics()
+        metrics.connection_opened()
+        metrics.connection_opened()
+        metrics.connection_closed()
+
+        values = samples(metrics.render())
+        self.assertEqual(values["httpserver_connections_total"], 2)
+        self.assertEqual(values["httpserver_open_connections"], 1)
+
+    def test_threads(self):
+        """Threads sharing a slot don't lose updates
+        """
+        metrics = Metrics()
+
+        def record():
+            for _ in range(20000):
+                metrics.connection_opened()
+                metrics.observe(HTTPMethod.GET, HTTPStatus.OK, 0.001, 1)
+
+        # Switch threads as often as possible
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        values = samples(metrics.render())
+        self.assertEqual(
+            values['httpserver_requests_total{method="GET",code="200"}'],
+            80000,
+        )
+        self.assertEqual(values["httpserver_connections_total"], 80000)
+
+    def test_slots(self):
+        """Values recorded by forked processes are summed
+        """
+        metrics = Metrics(n_slots=2)
+
+        def record(slot):
+            metrics.use_slot(slot)
+            metrics.connection_opened()
+            metrics.observe(HTTPMethod.HEAD, HTTPStatus.NOT_FOUND, 0.01, 5)
+
+        processes = [mp.Process(target=record, args=(n,)) for n in range(2)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        values = samples(metrics.render())
+        self.assertEqual(
+            values['httpserver_requests_total{method="HEAD",code="404"}'], 2
+        )
+        self.assertEqual(values["httpserver_open_connections"], 2)
+
+        # Open connections of a dead process are dropped with its slot
+        metrics.use_slot(1)
+        values = samples(metrics.render())
+        self.assertEqual(values["httpserver_open_connections"], 1)
+
+    def test_serve_metrics(self):
+        """Reserved path is answered with metrics
+        """
+        metrics = Metrics()
+        other = HTTPResponse.error(HTTPStatus.NOT_FOUND)
+
+        def handler(request):
+            return other
+
+        request = HTTPRequest(HTTPMethod.GET, "/metrics?x=1")
+        response = serve_metrics(request, handler, metrics, "/metrics")
+        self.assertEqual(response.status, HTTPStatus.OK)
+        self.assertIn(b"# TYPE httpserver_requests_total", response.body)
+        self.assertEqual(response.content_length, len(response.body))
+
+        request = HTTPRequest(HTTPMethod.HEAD, "/metrics")
+        response = serve_metrics(request, handler, metrics, "/metrics")
+        self.assertEqual(response.body, b"")
+        self.assertGreater(response.content_length, 0)
+
+        request = HTTPRequest(HTTPMethod.GET, "/metrics/x")
+        response = serve_metrics(request, handler, metrics, "/metrics")
+        self.assertIs(response, other)
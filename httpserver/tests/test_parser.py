@@ -0,0 +1,153 @@
+import unittest
+
+from httpserver import parser
+from httpserver.parser import RequestParser
+from httpserver.types import HTTPException, HTTPMethod, HTTPStatus
+
+
+class TestRequestParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = RequestParser()
+
+    def assertRejected(self, data, status):
+        self.parser.feed(data)
+        with self.assertRaises(HTTPException) as cm:
+            self.parser.parse()
+        self.assertEqual(cm.exception.args[0], status)
+
+    def test_request(self):
+        """Request line and headers are parsed
+        """
+        self.parser.feed(
+            b"GET /a%20b.html?x=1 HTTP/1.0\r\n"
+            b"Host: localhost\r\n"
+            b"Connection:keep-alive  \r\n\r\n"
+        )
+        request = self.parser.parse()
+        self.assertIs(request.method, HTTPMethod.GET)
+        self.assertEqual(request.target, "/a b.html?x=1")
+        self.assertEqual(request.version, "HTTP/1.0")
+        self.assertEqual(
+            request.headers,
+            {"host": "localhost", "connection": "keep-alive"},
+        )
+        self.assertFalse(self.parser.pending)
+
+    def test_byte_by_byte(self):
+        """Request received byte by byte is parsed once it is complete
+        """
+        data = b"HEAD / HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        for n in range(len(data) - 1):
+            self.parser.feed(data[n : n + 1])
+            self.assertIsNone(self.parser.parse())
+
+        self.parser.feed(data[-1:])
+        request = self.parser.parse()
+        self.assertIs(request.method, HTTPMethod.HEAD)
+        self.assertEqual(request.headers, {"host": "localhost"})
+
+    def test_pipelined(self):
+        """Pipelined requests are parsed one by one
+        """
+        self.parser.feed(
+            b"GET /1 HTTP/1.1\r\n\r\nGET /2 HTTP/1.1\r\n\r\nGET /3 HTTP"
+        )
+        self.assertEqual(self.parser.parse().target, "/1")
+        self.assertEqual(self.parser.parse().target, "/2")
+        self.assertIsNone(self.parser.parse())
+        self.assertTrue(self.parser.pending)
+
+        self.parser.feed(b"/1.1\r\n\r\n")
+        self.assertEqual(self.parser.parse().target, "/3")
+        self.assertFalse(self.parser.pending)
+
+    def test_bare_lf_and_leading_empty_lines(self):
+        """Lines may end with LF, empty lines before a request are ignored
+        """
+        self.parser.feed(b"\r\n\nGET / HTTP/1.1\nHost: localhost\n\n")
+        request = self.parser.parse()
+        self.assertEqual(request.target, "/")
+        self.assertEqual(request.headers, {"host": "localhost"})
+
+    def test_repeated_headers(self):
+        """Repeated header fields are combined
+        """
+        self.parser.feed(
+            b"GET / HTTP/1.1\r\nAccept: a\r\nACCEPT: b\r\n\r\n"
+        )
+        self.assertEqual(self.parser.parse().headers, {"accept": "a, b"})
+
+    def test_eof(self):
+        """Incomplete request is malformed when no more bytes come
+        """
+        self.assertIsNone(self.parser.parse(eof=True))
+
+        self.parser.feed(b"GET / HTTP/1.1\r\nHost: loc")
+        self.assertIsNone(self.parser.parse())
+        with self.assertRaises(HTTPException) as cm:
+            self.parser.parse(eof=True)
+        self.assertEqual(cm.exception.args[0], HTTPStatus.BAD_REQUEST)
+
+    def test_malformed(self):
+        """Malformed requests are rejected with 400
+        """
+        for data in (
+            b"GET /\r\n\r\n",
+            b"GET / HTTP/1.1 x\r\n\r\n",
+            b"GET / HTTX/1.1\r\n\r\n",
+            b"GET / HTTP/1.1\r\nNo colon\r\n\r\n",
+            b"GET / HTTP/1.1\r\nHost : localhost\r\n\r\n",
+            b"GET / HTTP/1.1\r\n: empty\r\n\r\n",
+            b"GET / HTTP/1.1\r\nA: b\r\n folded\r\n\r\n",
+        ):
+            with self.subTest(data=data):
+                self.parser = RequestParser()
+                self.assertRejected(data, HTTPStatus.BAD_REQUEST)
+
+    def test_method_and_version(self):
+        """Unknown methods and HTTP versions are rejected
+        """
+        self.assertRejected(
+            b"POST / HTTP/1.1\r\n\r\n", HTTPStatus.METHOD_NOT_ALLOWED
+        )
+        self.parser = RequestParser()
+        self.assertRejected(
+            b"GET / HTTP/2.0\r\n\r\n", HTTPStatus.HTTP_VERSION_NOT_SUPPORTED
+        )
+
+    def test_long_request_line(self):
+        """Too long request line is rejected before it is complete
+        """
+        target = b"/" + b"a" * parser.MAX_REQUEST_LINE_SIZE
+        self.assertRejected(b"GET " + target, HTTPStatus.URI_TOO_LONG)
+
+    def test_long_header(self):
+        """Too long header line is rejected before it is complete
+        """
+        value = b"a" * parser.MAX_HEADER_LINE_SIZE
+        self.assertRejected(
+            b"GET / HTTP/1.1\r\nCookie: " + value,
+            HTTPStatus.HEADER_FIELDS_TOO_LARGE,
+        )
+
+    def test_too_many_headers(self):
+        """Too many header lines are rejected
+        """
+        headers = b"".join(
+            b"X-%d: 1\r\n" % n for n in range(parser.MAX_HEADERS + 1)
+        )
+        self.assertRejected(
+            b"GET / HTTP/1.1\r\n" + headers,
+            HTTPStatus.HEADER_FIELDS_TOO_LARGE,
+        )
+
+    def test_large_head(self):
+        """Too large request head is rejected
+        """
+        n_lines = parser.MAX_HEAD_SIZE // 1000 + 1
+        headers = b"".join(
+            b"X-%d: %s\r\n" % (n, b"a" * 1000) for n in range(n_lines)
+        )
+        self.assertRejected(
+            b"GET / HTTP/1.1\r\n" + headers, HTTPStatus.ENTITY_TOO_LARGE
+        )
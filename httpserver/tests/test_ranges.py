@@ -0,0 +1,62 @@
+import unittest
+
+from httpserver.ranges import multipart, parse_ranges
+
+
+class TestParseRanges(unittest.TestCase):
+    def test_valid(self):
+        """Byte ranges are parsed
+        """
+        self.assertEqual(parse_ranges("bytes=0-9", 100), [(0, 9)])
+        self.assertEqual(parse_ranges("bytes=90-", 100), [(90, 99)])
+        self.assertEqual(parse_ranges("bytes=-10", 100), [(90, 99)])
+        self.assertEqual(parse_ranges("bytes=-1000", 100), [(0, 99)])
+        self.assertEqual(parse_ranges("bytes=95-1000", 100), [(95, 99)])
+        self.assertEqual(
+            parse_ranges("bytes= 0-1 , 5-6", 100), [(0, 1), (5, 6)]
+        )
+
+    def test_coalesced(self):
+        """Overlapping and adjacent ranges are coalesced
+        """
+        self.assertEqual(
+            parse_ranges("bytes=10-20,0-5,15-30,6-8", 100), [(0, 8), (10, 30)]
+        )
+        self.assertEqual(parse_ranges("bytes=0-9,10-19", 100), [(0, 19)])
+
+    def test_unsatisfiable(self):
+        """Ranges beyond the end of file are unsatisfiable
+        """
+        self.assertEqual(parse_ranges("bytes=100-", 100), [])
+        self.assertEqual(parse_ranges("bytes=-0", 100), [])
+        self.assertEqual(parse_ranges("bytes=0-", 0), [])
+        self.assertEqual(parse_ranges("bytes=200-300,0-0", 100), [(0, 0)])
+
+    def test_malformed(self):
+        """Malformed headers are ignored
+        """
+        for header in (
+            "items=0-1",
+            "bytes=",
+            "bytes=-",
+            "bytes=5-1",
+            "bytes=a-b",
+            "bytes=1",
+            "bytes=\u00b2-",
+            "bytes=0-\u00b2",
+            "bytes=" + ",".join(f"{i * 2}-{i * 2}" for i in range(20)),
+        ):
+            self.assertIsNone(parse_ranges(header, 100), header)
+
+
+class TestMultipart(unittest.TestCase):
+    def test_layout(self):
+        """Multipart body layout
+        """
+        ctype, parts, closing = multipart([(0, 1), (5, 9)], 10, "text/plain")
+        boundary = ctype.partition("boundary=")[-1]
+        self.assertTrue(ctype.startswith("multipart/byteranges;"))
+        self.assertEqual([part[1:] for part in parts], [(0, 2), (5, 5)])
+        self.assertIn(b"Content-Range: bytes 5-9/10\r\n", parts[1][0])
+        self.assertTrue(parts[0][0].startswith(f"\r\n--{boundary}".encode()))
+        self.assertEqual(closing, f"\r\n--{boundary}--\r\n".encode())
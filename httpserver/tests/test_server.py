@@ -1,14 +1,22 @@
 #!/usr/bin/env python
 import logging
 import multiprocessing as mp
+import os
 import pathlib
 import re
+import signal
 import socket
+import tempfile
+import time
+import zlib
 import unittest
 
 from http.client import HTTPConnection
+from unittest import mock
 
-from httpserver import httpd
+from httpserver import evloop, httpd
+from httpserver.accesslog import AccessLog
+from httpserver.cache import FileCache, PathCache
 
 
 HERE = pathlib.Path(__file__).parent
@@ -21,23 +29,74 @@ def find_free_port():
         return s.getsockname()[1]
 
 
+def read_until_closed(s):
+    data = bytearray()
+    while True:
+        buf = s.recv(1024)
+        if not buf:
+            break
+        data += buf
+    return bytes(data)
+
+
+def wait_for_port(host, port, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+
+def start_server(host, port, document_root, n_workers, **kwargs):
+    server = mp.Process(
+        target=httpd.serve_forever,
+        args=(host, port, document_root, n_workers),
+        kwargs=kwargs,
+    )
+    # Daemonic processes are not allowed to have children
+    server.daemon = kwargs.get("n_processes", 1) == 1
+    server.start()
+    wait_for_port(host, port)
+    return server
+
+
 class HttpServer(unittest.TestCase):
     host = "localhost"
     document_root = HERE
     n_workers = 4
+    engine = "threads"
+    cache_size = 0
+    path_cache_size = 0
+    n_processes = 1
+    reuse_port = False
 
     @classmethod
     def setUpClass(cls):
         logger = logging.getLogger()
         logger.disabled = True
 
+        cache = None
+        if cls.cache_size:
+            cache = FileCache(cls.cache_size, 512 * 1024, 1)
+
+        paths = None
+        if cls.path_cache_size:
+            paths = PathCache(cls.path_cache_size)
+
         cls.port = find_free_port()
-        cls.server = mp.Process(
-            target=httpd.serve_forever,
-            args=(cls.host, cls.port, cls.document_root, cls.n_workers),
+        cls.server = start_server(
+            cls.host,
+            cls.port,
+            cls.document_root,
+            cls.n_workers,
+            engine=cls.engine,
+            cache=cache,
+            paths=paths,
+            n_processes=cls.n_processes,
+            reuse_port=cls.reuse_port,
         )
-        cls.server.daemon = True
-        cls.server.start()
 
     @classmethod
     def tearDownClass(cls):
@@ -339,3 +398,1092 @@ class HttpServer(unittest.TestCase):
         self.assertEqual(int(length), 35344)
         self.assertEqual(len(data), 35344)
         self.assertEqual(ctype, "application/x-shockwave-flash")
+
+    def test_keep_alive(self):
+        """HTTP/1.1 connection is persistent by default
+        """
+        self.conn.request("GET", "/httptest/dir2/page.html")
+        r = self.conn.getresponse()
+        r.read()
+        self.assertEqual(r.getheader("Connection"), "keep-alive")
+        sock = self.conn.sock
+        self.assertIsNotNone(sock)
+
+        self.conn.request("GET", "/httptest/text..txt")
+        r = self.conn.getresponse()
+        data = r.read()
+        self.assertIs(self.conn.sock, sock)
+        self.assertEqual(int(r.status), 200)
+        self.assertEqual(data, b"hello")
+
+    def test_connection_close(self):
+        """Connection: close header is honored
+        """
+        self.conn.request(
+            "GET", "/httptest/dir2/page.html", headers={"Connection": "close"}
+        )
+        r = self.conn.getresponse()
+        r.read()
+        self.assertEqual(int(r.status), 200)
+        self.assertEqual(r.getheader("Connection"), "close")
+
+    def test_http10_keep_alive(self):
+        """HTTP/1.0 connection is persistent only on demand
+        """
+        with socket.create_connection((self.host, self.port)) as s:
+            s.sendall(
+                b"HEAD /httptest/dir2/page.html HTTP/1.0\r\n"
+                b"Connection: keep-alive\r\n\r\n"
+                b"HEAD /httptest/dir2/page.html HTTP/1.0\r\n\r\n"
+            )
+            data = read_until_closed(s)
+
+        self.assertEqual(data.count(b"HTTP/1.1 200 OK"), 2)
+        self.assertEqual(data.count(b"Connection: keep-alive"), 1)
+        self.assertEqual(data.count(b"Connection: close"), 1)
+
+    def test_pipelining(self):
+        """Pipelined requests are answered in order
+        """
+        with socket.create_connection((self.host, self.port)) as s:
+            s.sendall(
+                b"GET /httptest/dir2/page.html HTTP/1.1\r\n"
+                b"Host: localhost\r\n\r\n"
+                b"GET /httptest/absent.txt HTTP/1.1\r\n"
+                b"Host: localhost\r\n\r\n"
+                b"GET /httptest/text..txt HTTP/1.1\r\n"
+                b"Host: localhost\r\nConnection: close\r\n\r\n"
+            )
+            data = read_until_closed(s)
+
+        responses = data.split(b"HTTP/1.1 ")[1:]
+        self.assertEqual(len(responses), 3)
+        self.assertTrue(responses[0].startswith(b"200 OK"))
+        self.assertTrue(responses[0].endswith(b"Page Sample</body></html>\n"))
+        self.assertTrue(responses[1].startswith(b"404 Not Found"))
+        self.assertTrue(responses[2].startswith(b"200 OK"))
+        self.assertTrue(responses[2].endswith(b"\r\n\r\nhello"))
+
+    def test_request_split_into_chunks(self):
+        """Request sent in small pieces is answered
+        """
+        data = b"GET /httptest/dir2/page.html HTTP/1.1\r\nHost: localhost\r\n"
+        with socket.create_connection((self.host, self.port)) as s:
+            for n in range(0, len(data), 7):
+                s.sendall(data[n : n + 7])
+                time.sleep(0.01)
+            s.sendall(b"Connection: close\r\n\r\n")
+            response = read_until_closed(s)
+
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK\r\n"))
+
+    def test_request_limits(self):
+        """Oversized requests are rejected
+        """
+        line = b"a" * 5000
+        header = b"X: " + b"a" * 3000 + b"\r\n"
+        cases = (
+            (b"GET /" + line + b" HTTP/1.1\r\n\r\n", b"414"),
+            (b"GET / HTTP/1.1\r\nX: " + line + b"\r\n\r\n", b"431"),
+            (b"GET / HTTP/1.1\r\n" + b"X: 1\r\n" * 100 + b"\r\n", b"431"),
+            (b"GET / HTTP/1.1\r\n" + header * 3 + b"\r\n", b"413"),
+            (b"GET / HTTP/1.1\r\nBad header\r\n\r\n", b"400"),
+        )
+        for request, code in cases:
+            with self.subTest(code=code):
+                with socket.create_connection((self.host, self.port)) as s:
+                    s.sendall(request)
+                    data = read_until_closed(s)
+                self.assertTrue(data.startswith(b"HTTP/1.1 " + code))
+
+    def test_error_closes_connection(self):
+        """Connection is closed after a malformed request
+        """
+        with socket.create_connection((self.host, self.port)) as s:
+            s.sendall(
+                b"POST /httptest/dir2/page.html HTTP/1.1\r\n\r\n"
+                b"GET /httptest/dir2/page.html HTTP/1.1\r\n\r\n"
+            )
+            data = read_until_closed(s)
+
+        self.assertEqual(data.count(b"HTTP/1.1 "), 1)
+        self.assertIn(b"Connection: close", data)
+
+    def test_chunked_body_closes_connection(self):
+        """Body of a chunked request isn't parsed as the next request
+        """
+        with socket.create_connection((self.host, self.port)) as s:
+            s.sendall(
+                b"GET /httptest/dir2/page.html HTTP/1.1\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n"
+                b"2b\r\nGET /httptest/dir2/page.html HTTP/1.1\r\n\r\n\r\n"
+                b"0\r\n\r\n"
+            )
+            data = read_until_closed(s)
+
+        self.assertEqual(data.count(b"HTTP/1.1 "), 1)
+        self.assertIn(b"Connection: close", data)
+
+    def test_validators(self):
+        """ETag and Last-Modified headers exist
+        """
+        self.conn.request("GET", "/httptest/dir2/page.html")
+        r = self.conn.getresponse()
+        r.read()
+        self.assertTrue(r.getheader("ETag").startswith('W/"'))
+        self.assertTrue(r.getheader("Last-Modified").endswith(" GMT"))
+
+    def test_if_none_match(self):
+        """Matching If-None-Match returns 304
+        """
+        self.conn.request("GET", "/httptest/splash.css")
+        r = self.conn.getresponse()
+        r.read()
+        etag = r.getheader("ETag")
+
+        for method in ("GET", "HEAD"):
+            self.conn.request(
+                method,
+                "/httptest/splash.css",
+                headers={"If-None-Match": f'"other", {etag}'},
+            )
+            r = self.conn.getresponse()
+            data = r.read()
+            self.assertEqual(int(r.status), 304)
+            self.assertEqual(data, b"")
+            self.assertEqual(r.getheader("ETag"), etag)
+
+        self.conn.request(
+            "GET", "/httptest/splash.css", headers={"If-None-Match": '"x"'}
+        )
+        r = self.conn.getresponse()
+        data = r.read()
+        self.assertEqual(int(r.status), 200)
+        self.assertEqual(len(data), 98620)
+
+    def test_if_modified_since(self):
+        """If-Modified-Since returns 304 for unchanged file
+        """
+        self.conn.request("GET", "/httptest/dir2/page.html")
+        r = self.conn.getresponse()
+        r.read()
+        last_modified = r.getheader("Last-Modified")
+
+        self.conn.request(
+            "GET",
+            "/httptest/dir2/page.html",
+            headers={"If-Modified-Since": last_modified},
+        )
+        r = self.conn.getresponse()
+        self.assertEqual(r.read(), b"")
+        self.assertEqual(int(r.status), 304)
+
+        for since in (
+            "Thu, 01 Jan 1970 00:00:00 GMT",
+            "Fri, 01 Jan 2100 00:00:00 GMT",
+            "garbage",
+        ):
+            self.conn.request(
+                "GET",
+                "/httptest/dir2/page.html",
+                headers={"If-Modified-Since": since},
+            )
+            r = self.conn.getresponse()
+            data = r.read()
+            self.assertEqual(int(r.status), 200)
+            self.assertEqual(len(data), 38)
+
+    def test_accept_ranges(self):
+        """Accept-Ranges header exists
+        """
+        self.conn.request("GET", "/httptest/dir2/page.html")
+        r = self.conn.getresponse()
+        r.read()
+        self.assertEqual(r.getheader("Accept-Ranges"), "bytes")
+
+    def test_single_range(self):
+        """Single byte range is sent
+        """
+        path = HERE / "httptest" / "jquery-1.9.1.js"
+        content = path.read_bytes()
+
+        for header, expected in (
+            ("bytes=0-99", content[:100]),
+            ("bytes=268300-", content[268300:]),
+            ("bytes=-81", content[-81:]),
+            ("bytes=268300-999999", content[268300:]),
+        ):
+            self.conn.request(
+                "GET", "/httptest/jquery-1.9.1.js", headers={"Range": header}
+            )
+            r = self.conn.getresponse()
+            data = r.read()
+            self.assertEqual(int(r.status), 206)
+            self.assertEqual(data, expected)
+            self.assertEqual(int(r.getheader("Content-Length")), len(data))
+            self.assertTrue(
+                r.getheader("Content-Range").endswith(f"/{len(content)}")
+            )
+
+    def test_multiple_ranges(self):
+        """Several byte ranges are sent as multipart/byteranges
+        """
+        content = (HERE / "httptest" / "splash.css").read_bytes()
+        self.conn.request(
+            "GET",
+            "/httptest/splash.css",
+            headers={"Range": "bytes=0-9, 50-59, -10"},
+        )
+        r = self.conn.getresponse()
+        data = r.read()
+        self.assertEqual(int(r.status), 206)
+        self.assertEqual(int(r.getheader("Content-Length")), len(data))
+        self.assertEqual(r.getheader("Vary"), "Accept-Encoding")
+
+        ctype = r.getheader("Content-Type")
+        self.assertTrue(ctype.startswith("multipart/byteranges; boundary="))
+        boundary = ctype.partition("boundary=")[-1].encode()
+
+        parts = data.split(b"--" + boundary)
+        self.assertEqual(parts[-1], b"--\r\n")
+        bodies = [part.partition(b"\r\n\r\n")[-1] for part in parts[1:-1]]
+        self.assertEqual(
+            bodies,
+            [
+                content[:10] + b"\r\n",
+                content[50:60] + b"\r\n",
+                content[-10:] + b"\r\n",
+            ],
+        )
+        self.assertIn(
+            f"Content-Range: bytes 50-59/{len(content)}".encode(), parts[2]
+        )
+
+    def test_range_not_satisfiable(self):
+        """Unsatisfiable range returns 416
+        """
+        self.conn.request(
+            "GET", "/httptest/dir2/page.html", headers={"Range": "bytes=38-"}
+        )
+        r = self.conn.getresponse()
+        r.read()
+        self.assertEqual(int(r.status), 416)
+        self.assertEqual(r.getheader("Content-Range"), "bytes */38")
+
+    def test_range_ignored(self):
+        """Malformed or outdated ranges are ignored
+        """
+        for headers in (
+            {"Range": "bytes=10-5"},
+            {"Range": "lines=1-2"},
+            {
+                "Range": "bytes=0-1",
+                "If-Range": "Thu, 01 Jan 1970 00:00:00 GMT",
+            },
+        ):
+            self.conn.request(
+                "GET", "/httptest/dir2/page.html", headers=headers
+            )
+            r = self.conn.getresponse()
+            data = r.read()
+            self.assertEqual(int(r.status), 200)
+            self.assertEqual(len(data), 38)
+
+
+class EpollHttpServer(HttpServer):
+    engine = "epoll"
+
+    def test_concurrent_connections(self):
+        """Many simultaneous slow connections are served
+        """
+        clients = []
+        for _ in range(50):
+            s = socket.create_connection((self.host, self.port))
+            s.sendall(b"GET /httptest/dir2/page.html HTTP/1.1\r\n")
+            clients.append(s)
+
+        for s in clients:
+            s.sendall(b"Connection: close\r\n\r\n")
+
+        for s in clients:
+            with s:
+                data = read_until_closed(s)
+                self.assertTrue(data.startswith(b"HTTP/1.1 200 OK"))
+                self.assertTrue(data.endswith(b"Page Sample</body></html>\n"))
+
+
+
+class CachedHttpServer(HttpServer):
+    cache_size = 1024 * 1024
+
+    def test_repeated_requests(self):
+        """Cached files are served repeatedly
+        """
+        for _ in range(3):
+            for path, length in (
+                ("/httptest/dir2/", 34),
+                ("/httptest/splash.css", 98620),
+                ("/httptest/wikipedia_russia.html", 954824),
+            ):
+                self.conn.request("GET", path)
+                r = self.conn.getresponse()
+                data = r.read()
+                self.assertEqual(int(r.status), 200)
+                self.assertEqual(int(r.getheader("Content-Length")), length)
+                self.assertEqual(len(data), length)
+
+        self.conn.request("GET", "/httptest/dir2/page.html/")
+        r = self.conn.getresponse()
+        r.read()
+        self.assertEqual(int(r.status), 404)
+
+
+class EpollCachedHttpServer(CachedHttpServer):
+    engine = "epoll"
+
+
+class PathCachedHttpServer(HttpServer):
+    path_cache_size = 100
+
+
+class EpollPathCachedHttpServer(PathCachedHttpServer):
+    engine = "epoll"
+
+
+class PreforkHttpServer(HttpServer):
+    n_processes = 2
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.join(10)
+
+    def request_page(self):
+        conn = HTTPConnection(self.host, self.port, timeout=10)
+        try:
+            conn.request("GET", "/httptest/dir2/page.html")
+            r = conn.getresponse()
+            r.read()
+            return int(r.status)
+        finally:
+            conn.close()
+
+    def test_reload(self):
+        """Server keeps serving after SIGHUP
+        """
+        os.kill(self.server.pid, signal.SIGHUP)
+        for _ in range(20):
+            self.assertEqual(self.request_page(), 200)
+            time.sleep(0.05)
+
+
+class EpollPreforkHttpServer(PreforkHttpServer):
+    engine = "epoll"
+
+
+class ReusePortHttpServer(HttpServer):
+    n_processes = 2
+    reuse_port = True
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.join(10)
+
+
+class Shutdown(unittest.TestCase):
+    host = "localhost"
+    engine = "threads"
+    n_processes = 1
+
+    def test_sigterm(self):
+        """Server stops on SIGTERM
+        """
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        port = find_free_port()
+        server = start_server(
+            self.host,
+            port,
+            HERE,
+            1,
+            engine=self.engine,
+            n_processes=self.n_processes,
+        )
+        conn = HTTPConnection(self.host, port, timeout=10)
+        conn.request("GET", "/httptest/dir2/page.html")
+        self.assertEqual(conn.getresponse().status, 200)
+        conn.close()
+
+        server.terminate()
+        server.join(10)
+        self.assertEqual(server.exitcode, 0)
+        with self.assertRaises(OSError):
+            socket.create_connection((self.host, port), timeout=1).close()
+
+    def test_sigterm_in_flight(self):
+        """Request in progress is finished after SIGTERM
+        """
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        port = find_free_port()
+        server = start_server(
+            self.host,
+            port,
+            HERE,
+            1,
+            engine=self.engine,
+            n_processes=self.n_processes,
+        )
+        with socket.create_connection((self.host, port), timeout=10) as s:
+            s.sendall(b"GET /httptest/dir2/page.html HTTP/1.1\r\n")
+            time.sleep(0.2)
+            server.terminate()
+            # The supervisor stops workers within its supervise interval
+            time.sleep(1)
+            s.sendall(b"Host: localhost\r\n\r\n")
+            data = read_until_closed(s)
+
+        server.join(10)
+        self.assertEqual(server.exitcode, 0)
+        self.assertTrue(data.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertIn(b"Connection: close\r\n", data)
+
+
+class EpollShutdown(Shutdown):
+    engine = "epoll"
+
+
+class PreforkShutdown(Shutdown):
+    n_processes = 2
+
+
+class EpollPreforkShutdown(PreforkShutdown):
+    engine = "epoll"
+
+
+class NotModified(unittest.TestCase):
+    def setUp(self):
+        # Local time is 5 hours ahead of UTC
+        patch = mock.patch.dict(os.environ, {"TZ": "XXT-05"})
+        patch.start()
+        time.tzset()
+        self.addCleanup(time.tzset)
+        self.addCleanup(patch.stop)
+
+    def is_not_modified(self, since):
+        request = httpd.HTTPRequest(
+            httpd.HTTPMethod.GET, "/", headers={"if-modified-since": since}
+        )
+        # Modified at 2000-01-01 00:00:00 UTC
+        return httpd.is_not_modified(request, (1, 1, 946684800 * 10 ** 9))
+
+    def test_utc_without_zone(self):
+        """Date with -0000 zone is in UTC, not in local time
+        """
+        self.assertTrue(
+            self.is_not_modified("Sat, 01 Jan 2000 00:00:00 -0000")
+        )
+        self.assertFalse(
+            self.is_not_modified("Fri, 31 Dec 1999 23:59:59 -0000")
+        )
+
+
+class SendFile(unittest.TestCase):
+    def setUp(self):
+        self.server_side, self.client_side = socket.socketpair()
+        self.addCleanup(self.server_side.close)
+        self.addCleanup(self.client_side.close)
+
+    def receive(self):
+        self.server_side.shutdown(socket.SHUT_WR)
+        return read_until_closed(self.client_side)
+
+    def test_regular_file(self):
+        """Regular file is sent with sendfile
+        """
+        path = HERE / "httptest" / "dir2" / "page.html"
+        with path.open("rb") as file:
+            self.assertTrue(httpd.can_sendfile(file))
+            httpd.send_file(self.server_side, file, 0, 38)
+        self.assertEqual(self.receive(), path.read_bytes())
+
+    def test_non_regular_file(self):
+        """Non-regular file is sent chunk by chunk
+        """
+        r, w = os.pipe()
+        os.write(w, b"x" * 100)
+        os.close(w)
+        with os.fdopen(r, "rb") as file:
+            self.assertFalse(httpd.can_sendfile(file))
+            httpd.send_file(self.server_side, file, 0, 100)
+        self.assertEqual(self.receive(), b"x" * 100)
+
+    def test_file_slice(self):
+        """Slice of a file is sent
+        """
+        path = HERE / "httptest" / "dir2" / "page.html"
+        with path.open("rb") as file:
+            httpd.send_file(self.server_side, file, 12, 11)
+        self.assertEqual(self.receive(), b"Page Sample")
+
+    def test_truncated_file(self):
+        """File shorter than expected is an error
+        """
+        path = HERE / "httptest" / "text..txt"
+        with path.open("rb") as file:
+            with self.assertRaises(OSError):
+                httpd.send_file(self.server_side, file, 0, 10)
+
+    def test_send_buffers(self):
+        """Buffers are sent in order despite partial writes
+        """
+        conn = mock.Mock()
+        conn.sendmsg.side_effect = [3, 4, 100]
+        httpd.send_buffers(conn, [b"ab", b"", b"cdef", b"ghi"], more=True)
+
+        calls = [
+            [bytes(view) for view in call.args[0]]
+            for call in conn.sendmsg.call_args_list
+        ]
+        self.assertEqual(
+            calls, [[b"ab", b"cdef", b"ghi"], [b"def", b"ghi"], [b"hi"]]
+        )
+        self.assertEqual(conn.sendmsg.call_args.args[2], httpd.MSG_MORE)
+
+    def test_send_response(self):
+        """Head and body of a response are sent with a single call
+        """
+        response = httpd.HTTPResponse(
+            httpd.HTTPStatus.OK, b"body", "text/plain", 4
+        )
+        conn = mock.Mock()
+        conn.sendmsg.side_effect = lambda buffers, *_: sum(map(len, buffers))
+        n_bytes = httpd.send_response(conn, response, True)
+
+        conn.sendmsg.assert_called_once()
+        data = b"".join(conn.sendmsg.call_args.args[0])
+        self.assertEqual(n_bytes, len(data))
+        self.assertTrue(data.startswith(b"HTTP/1.1 200 OK\r\nDate: "))
+        self.assertIn(b"Connection: keep-alive\r\n", data)
+        self.assertIn(b"Content-Type: text/plain\r\n", data)
+        self.assertTrue(data.endswith(b"Content-Length: 4\r\n\r\nbody"))
+
+    def test_date_header(self):
+        """Date header is rendered once per second
+        """
+        first = httpd.date_header(784111777)
+        self.assertEqual(first, b"Date: Sun, 06 Nov 1994 08:49:37 GMT\r\n")
+        self.assertIs(httpd.date_header(784111777), first)
+
+
+class ContentEncoding(unittest.TestCase):
+    host = "localhost"
+    engine = "threads"
+
+    @classmethod
+    def setUpClass(cls):
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        cls.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(cls.tmp.name)
+
+        cls.style = b"body { color: red; }\n" * 500
+        (root / "style.css").write_bytes(cls.style)
+
+        cls.page = b"<html>" + b"Lorem ipsum " * 500 + b"</html>"
+        (root / "page.html").write_bytes(cls.page)
+        (root / "page.html.gz").write_bytes(b"precompressed")
+
+        (root / "stale.txt").write_bytes(b"stale" * 100)
+        (root / "stale.txt.gz").write_bytes(b"precompressed")
+        os.utime(root / "stale.txt.gz", (0, 0))
+
+        (root / "image.png").write_bytes(b"\x89PNG" * 100)
+
+        cls.port = find_free_port()
+        cls.server = start_server(
+            cls.host,
+            cls.port,
+            root.resolve(),
+            2,
+            engine=cls.engine,
+            compression_cache=FileCache(1024 * 1024, 64 * 1024, 1),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.conn = HTTPConnection(self.host, self.port, timeout=10)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def get(self, path, accept_encoding):
+        self.conn.request(
+            "GET", path, headers={"Accept-Encoding": accept_encoding}
+        )
+        r = self.conn.getresponse()
+        data = r.read()
+        self.assertEqual(int(r.status), 200)
+        self.assertEqual(int(r.getheader("Content-Length")), len(data))
+        return r, data
+
+    def test_compressed_on_the_fly(self):
+        """File is gzipped on the fly
+        """
+        for _ in range(2):
+            r, data = self.get("/style.css", "deflate, gzip")
+            self.assertEqual(r.getheader("Content-Encoding"), "gzip")
+            self.assertEqual(r.getheader("Vary"), "Accept-Encoding")
+            self.assertEqual(zlib.decompress(data, 31), self.style)
+            self.assertLess(len(data), len(self.style))
+
+    def test_precompressed(self):
+        """Precompressed copy of a file is served
+        """
+        r, data = self.get("/page.html", "gzip")
+        self.assertEqual(r.getheader("Content-Encoding"), "gzip")
+        self.assertEqual(r.getheader("Content-Type"), "text/html")
+        self.assertEqual(data, b"precompressed")
+
+    def test_stale_precompressed(self):
+        """Outdated precompressed copy is ignored
+        """
+        r, data = self.get("/stale.txt", "gzip")
+        self.assertEqual(r.getheader("Content-Encoding"), "gzip")
+        self.assertEqual(zlib.decompress(data, 31), b"stale" * 100)
+
+    def test_identity(self):
+        """Identity encoding if gzip is not acceptable
+        """
+        for accept_encoding in ("identity", "gzip;q=0", "compress"):
+            r, data = self.get("/page.html", accept_encoding)
+            self.assertIsNone(r.getheader("Content-Encoding"))
+            self.assertEqual(r.getheader("Vary"), "Accept-Encoding")
+            self.assertEqual(data, self.page)
+
+    def test_not_compressible(self):
+        """Images are not compressed
+        """
+        r, data = self.get("/image.png", "gzip")
+        self.assertIsNone(r.getheader("Content-Encoding"))
+        self.assertIsNone(r.getheader("Vary"))
+        self.assertEqual(data, b"\x89PNG" * 100)
+
+
+class EpollContentEncoding(ContentEncoding):
+    engine = "epoll"
+
+
+class KeepAliveLimits(unittest.TestCase):
+    host = "localhost"
+    document_root = HERE
+    engine = "threads"
+
+    @classmethod
+    def setUpClass(cls):
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        # Patched before the server process is forked
+        cls.patches = [
+            mock.patch.object(module, name, value)
+            for module in (httpd, evloop)
+            for name, value in (
+                ("KEEP_ALIVE_TIMEOUT", 0.5),
+                ("KEEP_ALIVE_MAX_REQUESTS", 2),
+            )
+        ]
+        for patch in cls.patches:
+            patch.start()
+
+        cls.port = find_free_port()
+        cls.server = start_server(
+            cls.host, cls.port, cls.document_root, 1, engine=cls.engine
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        for patch in cls.patches:
+            patch.stop()
+
+    def test_max_requests(self):
+        """Connection is closed after max number of requests
+        """
+        with socket.create_connection((self.host, self.port)) as s:
+            s.sendall(b"HEAD /httptest/text..txt HTTP/1.1\r\n\r\n" * 3)
+            data = read_until_closed(s)
+
+        self.assertEqual(data.count(b"HTTP/1.1 200 OK"), 2)
+        self.assertEqual(data.count(b"Connection: keep-alive"), 1)
+        self.assertEqual(data.count(b"Connection: close"), 1)
+
+    def test_idle_timeout(self):
+        """Idle persistent connection is closed
+        """
+        with socket.create_connection((self.host, self.port)) as s:
+            s.settimeout(5)
+            s.sendall(b"HEAD /httptest/text..txt HTTP/1.1\r\n\r\n")
+            started = time.monotonic()
+            data = read_until_closed(s)
+
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertEqual(data.count(b"HTTP/1.1 200 OK"), 1)
+
+
+class EpollKeepAliveLimits(KeepAliveLimits):
+    engine = "epoll"
+
+
+class IdleKeepAlive(unittest.TestCase):
+    host = "localhost"
+    document_root = HERE
+    engine = "threads"
+
+    @classmethod
+    def setUpClass(cls):
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        cls.port = find_free_port()
+        cls.server = start_server(
+            cls.host, cls.port, cls.document_root, 1, engine=cls.engine
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+
+    def test_new_connection_not_starved(self):
+        """Idle persistent connection doesn't hold up a new one
+        """
+        request = b"HEAD /httptest/text..txt HTTP/1.1\r\n\r\n"
+        with socket.create_connection((self.host, self.port)) as idle:
+            idle.settimeout(5)
+            idle.sendall(request)
+            self.assertIn(b"HTTP/1.1 200 OK", idle.recv(1024))
+
+            with socket.create_connection((self.host, self.port)) as s:
+                s.settimeout(10)
+                started = time.monotonic()
+                s.sendall(request)
+                data = s.recv(1024)
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertIn(b"HTTP/1.1 200 OK", data)
+
+
+class EpollIdleKeepAlive(IdleKeepAlive):
+    engine = "epoll"
+
+
+class SlowClients(unittest.TestCase):
+    host = "localhost"
+    document_root = HERE
+    engine = "threads"
+
+    @classmethod
+    def setUpClass(cls):
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        # Patched before the server process is forked
+        cls.patches = [
+            mock.patch.object(module, "HEADER_TIMEOUT", 1)
+            for module in (httpd, evloop)
+        ]
+        for patch in cls.patches:
+            patch.start()
+
+        cls.port = find_free_port()
+        cls.server = start_server(
+            cls.host,
+            cls.port,
+            cls.document_root,
+            1,
+            engine=cls.engine,
+            max_connections=2,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        for patch in cls.patches:
+            patch.stop()
+
+    def request(self):
+        conn = HTTPConnection(self.host, self.port, timeout=10)
+        try:
+            conn.request("HEAD", "/httptest/text..txt")
+            return conn.getresponse().status
+        finally:
+            conn.close()
+
+    def wait_served(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.request() == 200:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def test_header_deadline(self):
+        """Request head trickling in is cut off by the deadline
+        """
+        with socket.create_connection((self.host, self.port)) as s:
+            s.settimeout(5)
+            started = time.monotonic()
+            data = b""
+            # A byte every 0.1 seconds until the server responds
+            for byte in b"GET / HTTP/1.1\r\nHost: localhost\r\n":
+                try:
+                    data = s.recv(1024, socket.MSG_DONTWAIT)
+                    break
+                except BlockingIOError:
+                    s.sendall(bytes([byte]))
+                    time.sleep(0.1)
+            data += read_until_closed(s)
+
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertTrue(data.startswith(b"HTTP/1.1 408 "), data)
+
+    def test_max_connections(self):
+        """Connections over the limit are answered with 503 at once
+        """
+        held = [socket.create_connection((self.host, self.port))]
+        try:
+            time.sleep(0.1)
+            held.append(socket.create_connection((self.host, self.port)))
+            time.sleep(0.1)
+            with socket.create_connection((self.host, self.port)) as s:
+                s.settimeout(0.5)
+                data = read_until_closed(s)
+            self.assertTrue(data.startswith(b"HTTP/1.1 503 "), data)
+            self.assertIn(b"Connection: close\r\n", data)
+        finally:
+            for s in held:
+                s.close()
+
+        # Slots are freed when connections are closed
+        self.assertTrue(self.wait_served())
+
+
+class EpollSlowClients(SlowClients):
+    engine = "epoll"
+
+
+class MetricsEndpoint(unittest.TestCase):
+    host = "localhost"
+    engine = "threads"
+    n_processes = 1
+
+    @classmethod
+    def setUpClass(cls):
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        cls.port = find_free_port()
+        cls.server = start_server(
+            cls.host,
+            cls.port,
+            HERE,
+            2,
+            engine=cls.engine,
+            n_processes=cls.n_processes,
+            metrics_path="/metrics",
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.join(10)
+
+    def request(self, method, target):
+        conn = HTTPConnection(self.host, self.port, timeout=10)
+        try:
+            conn.request(method, target)
+            r = conn.getresponse()
+            return r, r.read()
+        finally:
+            conn.close()
+
+    def test_metrics(self):
+        """Requests are reported on the metrics path
+        """
+        # Requests of the metrics path are counted as GET 200 as well
+        for _ in range(3):
+            self.request("HEAD", "/httptest/dir2/page.html")
+        self.request("HEAD", "/httptest/absent.txt")
+        with socket.create_connection((self.host, self.port)) as s:
+            s.sendall(b"BAD\r\n\r\n")
+            read_until_closed(s)
+
+        expected = [
+            'httpserver_requests_total{method="HEAD",code="200"} 3\n',
+            'httpserver_requests_total{method="HEAD",code="404"} 1\n',
+            'httpserver_requests_total{method="unknown",code="400"} 1\n',
+            "httpserver_request_duration_seconds_count"
+            '{method="HEAD",code="200"} 3\n',
+        ]
+        # Responses are counted after they have been sent, by any worker
+        deadline = time.monotonic() + 5
+        while True:
+            r, data = self.request("GET", "/metrics")
+            text = data.decode("utf-8")
+            done = all(series in text for series in expected)
+            if done or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+
+        self.assertEqual(int(r.status), 200)
+        self.assertTrue(r.getheader("Content-Type").startswith("text/plain"))
+        for series in expected:
+            self.assertIn(series, text)
+        # The connection of the metrics request itself is open
+        open_connections = re.search(
+            r"^httpserver_open_connections (\d+)$", text, re.M
+        )
+        self.assertGreaterEqual(int(open_connections.group(1)), 1)
+
+
+class EpollMetricsEndpoint(MetricsEndpoint):
+    engine = "epoll"
+
+
+class PreforkMetricsEndpoint(MetricsEndpoint):
+    n_processes = 2
+
+
+class AccessLogFile(unittest.TestCase):
+    host = "localhost"
+    engine = "threads"
+    n_processes = 1
+
+    def setUp(self):
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = pathlib.Path(tmp.name) / "access.log"
+
+        self.port = find_free_port()
+        self.server = start_server(
+            self.host,
+            self.port,
+            HERE,
+            2,
+            engine=self.engine,
+            n_processes=self.n_processes,
+            access_log=AccessLog(self.path),
+        )
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.join(10)
+
+    def wait_lines(self, n_lines, timeout=5):
+        deadline = time.monotonic() + timeout
+        lines = []
+        while time.monotonic() < deadline:
+            if self.path.exists():
+                lines = self.path.read_text().splitlines()
+                if len(lines) >= n_lines:
+                    break
+            time.sleep(0.1)
+        return lines
+
+    def test_access_log(self):
+        """Responses are written to the access log file
+        """
+        conn = HTTPConnection(self.host, self.port, timeout=10)
+        conn.request(
+            "GET", "/httptest/dir2/page.html", headers={"User-Agent": "test"}
+        )
+        conn.getresponse().read()
+        conn.request("HEAD", "/httptest/absent.txt")
+        conn.getresponse().read()
+        conn.close()
+        with socket.create_connection((self.host, self.port)) as s:
+            s.sendall(b"BAD\r\n\r\n")
+            read_until_closed(s)
+
+        text = "\n".join(self.wait_lines(3))
+        self.assertEqual(len(text.splitlines()), 3, text)
+        self.assertRegex(text, r'(?m)^127\.0\.0\.1 - - \[.+\] "-" 400 ')
+        self.assertIn(
+            '"GET /httptest/dir2/page.html HTTP/1.1" 200 38 "-" "test"', text
+        )
+        self.assertIn('"HEAD /httptest/absent.txt HTTP/1.1" 404 ', text)
+
+class EpollAccessLogFile(AccessLogFile):
+    engine = "epoll"
+
+
+class PreforkAccessLogFile(AccessLogFile):
+    n_processes = 2
+
+
+class Autoindex(unittest.TestCase):
+    host = "localhost"
+    engine = "threads"
+
+    @classmethod
+    def setUpClass(cls):
+        logger = logging.getLogger()
+        logger.disabled = True
+
+        cls.port = find_free_port()
+        cls.server = start_server(
+            cls.host,
+            cls.port,
+            HERE,
+            2,
+            engine=cls.engine,
+            autoindex=True,
+            listings=FileCache(1024 * 1024, 1024 * 1024, 0),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.join(10)
+
+    def request(self, target):
+        conn = HTTPConnection(self.host, self.port, timeout=10)
+        try:
+            conn.request("GET", target)
+            r = conn.getresponse()
+            return r, r.read()
+        finally:
+            conn.close()
+
+    def test_listing(self):
+        """Directories without index file are listed
+        """
+        for _ in range(2):
+            r, data = self.request("/httptest/dir1/dir12")
+            self.assertEqual(int(r.status), 200)
+            content_type = r.getheader("Content-Type")
+            self.assertTrue(content_type.startswith("text/html"))
+            self.assertIn(b"<h1>Index of /httptest/dir1/dir12/</h1>", data)
+            self.assertIn(b'<a href="/httptest/dir1/">../</a>', data)
+            self.assertIn(b'<a href="/httptest/dir1/dir12/dir123/">', data)
+
+        r, data = self.request("/httptest/dir1/dir12/dir123/")
+        self.assertIn(b'<a href="/httptest/dir1/dir12/dir123/deep.txt">', data)
+
+        r, data = self.request("/httptest/dir2/")
+        self.assertEqual(data, b"<html>Directory index file</html>\n")
+
+
+class EpollAutoindex(Autoindex):
+    engine = "epoll"
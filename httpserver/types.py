@@ -1,6 +1,7 @@
 import enum
 
-from typing import NamedTuple
+from types import MappingProxyType
+from typing import BinaryIO, Mapping, NamedTuple, Optional, Tuple
 
 
 class HTTPMethod(enum.Enum):
@@ -13,15 +14,21 @@ class HTTPMethod(enum.Enum):
 
 class HTTPStatus(enum.Enum):
     OK = 200, "OK"
+    PARTIAL_CONTENT = 206, "Partial Content"
+    NOT_MODIFIED = 304, "Not Modified"
     BAD_REQUEST = 400, "Bad Request"
     FORBIDDEN = 403, "Forbidden"
     NOT_FOUND = 404, "Not Found"
     METHOD_NOT_ALLOWED = 405, "Method Not Allowed"
     REQUEST_TIMEOUT = 408, "Request Timeout"
     ENTITY_TOO_LARGE = 413, "Entity Too Large"
+    URI_TOO_LONG = 414, "URI Too Long"
     UNSUPPORTED_MEDIA_TYPE = 415, "Unsupported Media Type"
+    RANGE_NOT_SATISFIABLE = 416, "Range Not Satisfiable"
+    HEADER_FIELDS_TOO_LARGE = 431, "Request Header Fields Too Large"
     INTERNAL_SERVER_ERROR = 500, "Internal Server Error"
     NOT_IMPLEMENTED = 501, "Not Implemented"
+    SERVICE_UNAVAILABLE = 503, "Service Unavailable"
     HTTP_VERSION_NOT_SUPPORTED = 505, "HTTP Version Not Supported"
 
     def __str__(self):
@@ -29,19 +36,53 @@ class HTTPStatus(enum.Enum):
         return f"{code} {message}"
 
 
+class HTTPException(Exception):
+    pass
+
+
 class HTTPRequest(NamedTuple):
     method: HTTPMethod
     target: str
+    version: str = "HTTP/1.1"
+    # Read-only default shared by requests without headers
+    headers: Mapping[str, str] = MappingProxyType({})
 
     def clean_target(self):
         return self.target.partition("/")[-1].partition("?")[0]
 
+    @property
+    def keep_alive(self) -> bool:
+        """Whether the client wants to keep the connection open.
+        """
+        if (
+            self.headers.get("content-length", "0") != "0"
+            or "transfer-encoding" in self.headers
+        ):
+            # Request bodies are not supported, so the rest of the stream
+            # can't be parsed as the next request
+            return False
+
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
 
 class HTTPResponse(NamedTuple):
     status: HTTPStatus
     body: bytes
     content_type: str
     content_length: int
+    # If set, slices of the file are sent after `body`, each one is
+    # preceded by its own bytes: ((prefix, offset, length), ...)
+    file: Optional[BinaryIO] = None
+    file_parts: Tuple[Tuple[bytes, int, int], ...] = ()
+    # Pre-rendered entity headers, built from the fields above if empty
+    headers: bytes = b""
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
 
     @classmethod
     def error(cls, status: HTTPStatus):
@@ -3,25 +3,49 @@ import gzip
 import logging
 import multiprocessing as mp
 import os
+import queue
 import sys
 import time
 
-from collections import Counter
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future
+from contextlib import ExitStack
 from functools import partial
 from optparse import OptionParser
 from pathlib import Path
-from typing import List
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from typing import Union
 
-import memcache
-
-from . import appsinstalled_pb2
-from .types import AppsInstalled, ProcessingStatus
+from . import aiomemcache, appsinstalled_pb2, checkpoint, parser
+from .fakememcache import FakeMemcache, NullClient
+from .pipeline import DONE, run_pipeline
+from .stats import Reporter, Snapshot, Stats, combine, write_report
+from .types import Batch, Position, ProcessingStatus, Record
 
 
 NORMAL_ERR_RATE = 0.01
 MEMCACHE_RETRY_NUMBER = 3
+# Backoff before the first retry, doubled for every next one
 MEMCACHE_RETRY_TIMEOUT_SECONDS = 1
 MEMCACHE_SOCKET_TIMEOUT_SECONDS = 3
+# Connections to every node
+MEMCACHE_POOL_SIZE = 4
+# Records of a device type are written in one go
+# once there are so many of them or their values are so large
+MEMCACHE_BATCH_SIZE = 1000
+MEMCACHE_BATCH_BYTES = 1024 * 1024
+# Batches being written at once
+MEMCACHE_IN_FLIGHT = 16
+# Bytes of a file decompressed at once, lines are split by batches of it
+CHUNK_SIZE = 256 * 1024
+# Chunks of a file queued for every worker process loading it
+WORKER_QUEUE_SIZE = 2
+# Seconds to wait for results of worker processes before checking them
+WORKER_POLL_INTERVAL = 1
+# Records are written to Memcached nodes, nowhere or to fake servers
+# started by the loader, files are only checkpointed and renamed
+# with the first one
+SINKS = ("memcached", "null", "fake")
 
 
 def dot_rename(path):
@@ -30,73 +54,430 @@ def dot_rename(path):
     os.rename(path, os.path.join(head, "." + fn))
 
 
-def insert_appsinstalled(
-    memcache_client: memcache.Client,
-    appsinstalled: AppsInstalled,
-    dry_run: bool = False,
-) -> bool:
-    ua = appsinstalled_pb2.UserApps()
-    ua.lat = appsinstalled.lat
-    ua.lon = appsinstalled.lon
-    key = "%s:%s" % (appsinstalled.dev_type, appsinstalled.dev_id)
-    ua.apps.extend(appsinstalled.apps)
-    packed = ua.SerializeToString()
+def connect(
+    memcache_addresses: List[str], sink: str = "memcached"
+) -> Union[aiomemcache.Client, NullClient]:
+    if sink == "null":
+        return NullClient()
+    return aiomemcache.Client(
+        memcache_addresses,
+        pool_size=MEMCACHE_POOL_SIZE,
+        timeout=MEMCACHE_SOCKET_TIMEOUT_SECONDS,
+        retries=MEMCACHE_RETRY_NUMBER,
+        backoff=MEMCACHE_RETRY_TIMEOUT_SECONDS,
+    )
 
-    if dry_run:
-        logging.debug("%s -> %s" % (key, str(ua).replace("\n", " ")))
-        return True
 
-    for _ in range(MEMCACHE_RETRY_NUMBER):
-        try:
-            # Use a tuple as key to write to specific Memcached server
-            # https://github.com/linsomniac/python-memcached/blob/bad41222379102e3f18f6f2f7be3ee608de6fbff/memcache.py#L698
-            success: bool = memcache_client.set(
-                (appsinstalled.dev_type.value, key), packed
-            )
-        except Exception as e:
-            logging.exception(f"Cannot write to Memcache: {e}")
-            return False
-        if success:
-            return True
-        time.sleep(MEMCACHE_RETRY_TIMEOUT_SECONDS)
+def read_chunks(
+    fn: str,
+    chunk_size: int = CHUNK_SIZE,
+    start: Position = Position(0, 0),
+    stats: Optional[Stats] = None,
+) -> Iterator[Tuple[bytes, Position]]:
+    """Decompress a file from a position, yield chunks of whole lines
+    and positions after them.
+    """
+    stats = stats or Stats()
+    n_lines, offset = start
+    with open(fn, "rb") as raw, gzip.GzipFile(fileobj=raw) as fd:
+        with stats.timed("decompress"):
+            # Gzip has no index, skipped data is decompressed anyway
+            fd.seek(offset)
+        tail = b""
+        # Bytes skipped on resume are not loaded, only the rest is counted
+        compressed = raw.tell()
+        stats.add(resumed=compressed)
+        while True:
+            with stats.timed("decompress"):
+                chunk = fd.read(chunk_size)
+            stats.add(compressed=raw.tell() - compressed)
+            compressed = raw.tell()
+            if not chunk:
+                break
+            data = tail + chunk
+            end = data.rfind(b"\n") + 1
+            if not end:
+                # Line is longer than a chunk
+                tail = data
+                continue
+
+            tail = data[end:]
+            n_lines += data.count(b"\n")
+            offset += end
+            yield data[:end], Position(n_lines, offset)
+
+    if tail:
+        yield tail, Position(n_lines + 1, offset + len(tail))
+
+
+def log_record(record: Record) -> None:
+    (_, key), packed = record
+    ua = appsinstalled_pb2.UserApps()
+    ua.ParseFromString(packed)
+    logging.debug("%s -> %s" % (key, str(ua).replace("\n", " ")))
 
-    logging.error("Cannot write to Memcache. Server is down")
-    return False
 
+def pack_lines(
+    chunks: Iterator[Tuple[bytes, Position]],
+    dry: bool,
+    stats: Optional[Stats] = None,
+) -> Iterator[Batch]:
+    """Parse and serialize chunks of lines, count skipped and invalid ones.
+    """
+    stats = stats or Stats()
+    for data, position in chunks:
+        lines = parser.split_lines(data)
+        with stats.timed("parse"):
+            parsed = parser.parse_lines(lines)
+        with stats.timed("serialize"):
+            records = parser.pack_parsed(parsed)
+        stats.add(lines=len(lines), bytes=len(data))
+        if dry and logging.getLogger().isEnabledFor(logging.DEBUG):
+            for record in records:
+                log_record(record)
+        yield Batch(records, parsed.statuses, position)
+
+
+class Writer:
+    """Records buffered by device type to be written to Memcache.
+
+    A buffer of a device type is flushed once it has `batch_size` records
+    or `batch_bytes` of values, up to `max_in_flight` buffers are being
+    stored at once. Every record is counted to statuses of its batch
+    once it is stored or failed, stored records and retries are counted
+    to `stats`.
+    """
 
-def process_line(
-    raw_line: bytes, memcache_client: memcache.Client, dry: bool
-) -> ProcessingStatus:
+    def __init__(
+        self,
+        memcache_client: aiomemcache.Client,
+        dry: bool,
+        batch_size: int = MEMCACHE_BATCH_SIZE,
+        batch_bytes: int = MEMCACHE_BATCH_BYTES,
+        max_in_flight: int = MEMCACHE_IN_FLIGHT,
+        stats: Optional[Stats] = None,
+    ):
+        self.memcache_client = memcache_client
+        self.dry = dry
+        self.stats = stats or Stats()
+        self.n_retries = memcache_client.n_retries
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.max_in_flight = max_in_flight
+        self.buffers: Dict[int, List[Tuple[Record, Counter]]] = defaultdict(
+            list
+        )
+        self.sizes: Counter = Counter()
+        self.in_flight: Deque[
+            Tuple[List[Tuple[Record, Counter]], Future]
+        ] = deque()
+
+    def add(self, record: Record, statuses: Counter) -> None:
+        (cluster, _), packed = record
+        self.buffers[cluster].append((record, statuses))
+        self.sizes[cluster] += len(packed)
+        if (
+            len(self.buffers[cluster]) >= self.batch_size
+            or self.sizes[cluster] >= self.batch_bytes
+        ):
+            self.flush(cluster)
+
+    def flush(self, cluster: int) -> None:
+        entries = self.buffers.pop(cluster)
+        del self.sizes[cluster]
+        if self.dry:
+            for _, statuses in entries:
+                statuses[ProcessingStatus.OK] += 1
+            return None
+
+        future = self.memcache_client.submit(
+            dict(record for record, _ in entries)
+        )
+        self.in_flight.append((entries, future))
+        self.wait(self.max_in_flight)
+
+    def wait(self, max_in_flight: int) -> None:
+        """Count stored records until so many buffers are in flight.
+        """
+        while len(self.in_flight) > max_in_flight:
+            entries, future = self.in_flight.popleft()
+            failed = set(future.result())
+            n_stored = 0
+            # Every record is counted even if its key repeats in the batch
+            for (key, _), statuses in entries:
+                if key in failed:
+                    statuses[ProcessingStatus.ERROR] += 1
+                else:
+                    statuses[ProcessingStatus.OK] += 1
+                    n_stored += 1
+
+            n_retries = self.memcache_client.n_retries
+            self.stats.add(sets=n_stored, retries=n_retries - self.n_retries)
+            self.n_retries = n_retries
+
+    def drain(self) -> None:
+        """Write all buffered records and wait for them to be stored.
+        """
+        for cluster in list(self.buffers):
+            self.flush(cluster)
+        self.wait(0)
+
+
+def write_records(
+    batches: Iterator[Batch],
+    memcache_client: aiomemcache.Client,
+    dry: bool,
+    commit: Callable[[List[Tuple[Position, Counter]]], None],
+    batch_size: int = MEMCACHE_BATCH_SIZE,
+    batch_bytes: int = MEMCACHE_BATCH_BYTES,
+    max_in_flight: int = MEMCACHE_IN_FLIGHT,
+    stats: Optional[Stats] = None,
+) -> None:
+    """Write records to Memcache, count them to statuses of batches.
+
+    Every `checkpoint.INTERVAL` and at the end all buffered records are
+    written and `commit` is called with positions and statuses of the
+    batches written since the previous call.
+    """
+    stats = stats or Stats()
+    writer = Writer(
+        memcache_client, dry, batch_size, batch_bytes, max_in_flight, stats
+    )
+    written: List[Tuple[Position, Counter]] = []
+    committed_at = time.monotonic()
+    for batch in batches:
+        with stats.timed("write"):
+            for record in batch.records:
+                writer.add(record, batch.statuses)
+        written.append((batch.position, batch.statuses))
+
+        if time.monotonic() - committed_at >= checkpoint.INTERVAL:
+            with stats.timed("write"):
+                writer.drain()
+            commit(written)
+            written = []
+            committed_at = time.monotonic()
+
+    with stats.timed("write"):
+        writer.drain()
+    commit(written)
+
+
+def load_chunks(
+    tasks: mp.Queue,
+    results: mp.Queue,
+    memcache_addresses: List[str],
+    dry: bool,
+    batch_size: int = MEMCACHE_BATCH_SIZE,
+    batch_bytes: int = MEMCACHE_BATCH_BYTES,
+    sink: str = "memcached",
+) -> None:
+    """Worker process parsing and writing chunks of a file.
+
+    Names of the process with lists of positions and statuses of written
+    batches and snapshots of its stats are put to `results`, followed
+    by DONE or a description of an error.
+    """
+    name = mp.current_process().name
+    stats = Stats()
 
-    line = raw_line.decode("utf-8").strip()
-    if not line:
-        return ProcessingStatus.SKIP
+    def commit(written: List[Tuple[Position, Counter]]) -> None:
+        results.put((name, written, stats.snapshot()))
 
     try:
-        appsinstalled = AppsInstalled.from_raw(line)
-    except ValueError as e:
-        logging.error(f"Cannot parse line: {e}")
-        return ProcessingStatus.ERROR
+        with connect(memcache_addresses, sink) as memcache_client:
+            run_pipeline(
+                partial(iter, tasks.get, DONE),
+                partial(pack_lines, dry=dry, stats=stats),
+                partial(
+                    write_records,
+                    memcache_client=memcache_client,
+                    dry=dry,
+                    commit=commit,
+                    batch_size=batch_size,
+                    batch_bytes=batch_bytes,
+                    stats=stats,
+                ),
+            )
+            stats.add_nodes(memcache_client.node_counts())
+    except Exception as e:
+        logging.exception(f"Cannot load chunks: {e}")
+        results.put(repr(e))
+    else:
+        results.put((name, [], stats.snapshot()))
+        results.put(DONE)
 
-    ok: bool = insert_appsinstalled(memcache_client, appsinstalled, dry)
-    if not ok:
-        return ProcessingStatus.ERROR
 
-    return ProcessingStatus.OK
+class Workers:
+    """Processes loading chunks of a file sent to them.
 
+    Batches written by the processes are reported to `progress`, the
+    latest snapshots of their stats are kept by names of the processes.
+    """
 
-def process_file(fn: str, memcache_addresses: List[str], dry: bool) -> None:
+    def __init__(
+        self, n_workers: int, progress: checkpoint.Progress, **load_options
+    ):
+        self.progress = progress
+        self.tasks: mp.Queue = mp.Queue(n_workers * WORKER_QUEUE_SIZE)
+        self.results: mp.Queue = mp.Queue()
+        self.processes = [
+            mp.Process(
+                target=load_chunks,
+                args=(self.tasks, self.results),
+                kwargs=load_options,
+                daemon=True,
+            )
+            for _ in range(n_workers)
+        ]
+        self.snapshots: Dict[str, Snapshot] = {}
+        self.n_finished = 0
+
+    def __enter__(self) -> "Workers":
+        for process in self.processes:
+            process.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        # Chunks left in the queue are dropped on error
+        self.tasks.cancel_join_thread()
+
+    def send(self, item) -> None:
+        """Queue an item for the processes, collect their results while
+        the queue is full.
+        """
+        while True:
+            self.collect(0)
+            try:
+                self.tasks.put(item, timeout=WORKER_POLL_INTERVAL)
+                return None
+            except queue.Full:
+                pass
+
+    def collect(self, timeout: float) -> None:
+        """Report results of the processes, wait for the first one
+        `timeout` seconds.
+        """
+        try:
+            message = self.results.get(timeout=timeout)
+            while True:
+                if message is DONE:
+                    self.n_finished += 1
+                elif isinstance(message, str):
+                    raise RuntimeError(f"Worker failed: {message}")
+                else:
+                    name, written, snapshot = message
+                    self.snapshots[name] = snapshot
+                    self.progress.complete(written)
+                message = self.results.get_nowait()
+        except queue.Empty:
+            pass
+
+        for process in self.processes:
+            if process.exitcode:
+                raise RuntimeError(
+                    f"Worker {process.name} exited with {process.exitcode}"
+                )
+
+    def finish(self) -> None:
+        """Wait for the processes to load all chunks sent to them.
+        """
+        for _ in self.processes:
+            self.send(DONE)
+        while self.n_finished < len(self.processes):
+            self.collect(WORKER_POLL_INTERVAL)
+
+
+def process_file(
+    fn: str,
+    memcache_addresses: List[str],
+    dry: bool,
+    batch_size: int = MEMCACHE_BATCH_SIZE,
+    batch_bytes: int = MEMCACHE_BATCH_BYTES,
+    resume: bool = True,
+    n_workers: int = 1,
+    stats: Optional[Stats] = None,
+    sink: str = "memcached",
+) -> str:
+    """Load a file to Memcache.
+
+    Decompression, parsing with serialization and writes to Memcache
+    run as stages of a pipeline, each one in its own thread. The stages
+    overlap, but parsing holds the GIL and takes a single core. If there
+    are more than one `n_workers`, the file is decompressed by this
+    process and chunks of it are parsed and written by so many worker
+    processes.
+
+    Progress is saved to a checkpoint of the file, a load is resumed
+    from it unless `resume` is off. Dry runs and loads to sinks other
+    than Memcached don't touch checkpoints. Rates of the load are logged
+    periodically, counters and timings of all processes are summed up
+    to `stats`.
+    """
+    stats = stats or Stats()
     worker = mp.current_process()
     logging.info(f"[{worker.name}] Processing {fn}")
 
-    memcache_client = memcache.Client(
-        memcache_addresses,
-        socket_timeout=3,
-        dead_retry=MEMCACHE_RETRY_TIMEOUT_SECONDS,
+    saving = not dry and sink == "memcached"
+    saved = None
+    if resume and saving:
+        saved = checkpoint.load(fn)
+        if saved is not None:
+            logging.info(
+                f"[{worker.name}] Resuming {fn} "
+                f"from line {saved.position.n_lines}"
+            )
+
+    progress = checkpoint.Progress(fn, saved, save=saving)
+    chunks = progress.track(
+        read_chunks(fn, CHUNK_SIZE, progress.position, stats)
+    )
+    load_options = dict(
+        memcache_addresses=memcache_addresses,
+        dry=dry,
+        batch_size=batch_size,
+        batch_bytes=batch_bytes,
+        sink=sink,
     )
-    with gzip.open(fn) as fd:
-        job = partial(process_line, memcache_client=memcache_client, dry=dry)
-        statuses = Counter(map(job, fd))
+    if n_workers > 1:
+        with Workers(n_workers, progress, **load_options) as workers:
+            with Reporter(fn, stats, lambda: dict(workers.snapshots)):
+                for chunk in chunks:
+                    workers.send(chunk)
+                workers.finish()
+        for snapshot in workers.snapshots.values():
+            stats.merge(snapshot)
+    else:
+        with connect(memcache_addresses, sink) as memcache_client:
+            with Reporter(fn, stats):
+                run_pipeline(
+                    partial(iter, chunks),
+                    partial(pack_lines, dry=dry, stats=stats),
+                    partial(
+                        write_records,
+                        memcache_client=memcache_client,
+                        dry=dry,
+                        commit=progress.complete,
+                        batch_size=batch_size,
+                        batch_bytes=batch_bytes,
+                        stats=stats,
+                    ),
+                )
+            stats.add_nodes(memcache_client.node_counts())
+    statuses = progress.statuses
+    stats.add(
+        **{status.name.lower(): statuses[status] for status in statuses}
+    )
+    for address, counts in sorted(stats.snapshot().nodes.items()):
+        if counts["failed"]:
+            logging.warning(
+                f"[{worker.name}] [{fn}] {counts['failed']} of "
+                f"{counts['sets']} writes failed on Memcache {address}"
+            )
 
     ok = statuses[ProcessingStatus.OK]
     errors = statuses[ProcessingStatus.ERROR]
@@ -118,6 +499,35 @@ def process_file(fn: str, memcache_addresses: List[str], dry: bool) -> None:
     return fn
 
 
+def load_file(fn: str, **options) -> Tuple[str, Snapshot]:
+    """Load a file, return its name and stats of the load.
+    """
+    stats = Stats()
+    process_file(fn, stats=stats, **options)
+    return fn, stats.snapshot()
+
+
+def rename_processed(fn: str) -> None:
+    worker = mp.current_process()
+    logging.info(f"[{worker.name}] Renaming {fn}")
+    dot_rename(fn)
+    checkpoint.remove(fn)
+
+
+def start_fake_servers(
+    memcache_addresses: List[str], stack: ExitStack
+) -> List[str]:
+    """Start a fake server for every node, return their addresses.
+    """
+    clusters = []
+    for cluster in memcache_addresses:
+        servers = [
+            stack.enter_context(FakeMemcache()) for _ in cluster.split(",")
+        ]
+        clusters.append(",".join(server.address for server in servers))
+    return clusters
+
+
 def main(options):
     """ Entry point
     """
@@ -128,19 +538,56 @@ def main(options):
         options.dvid,
     ]
 
+    with ExitStack() as stack:
+        if options.sink == "fake":
+            memcache_addresses = start_fake_servers(memcache_addresses, stack)
+        load_files(options, memcache_addresses)
+
+
+def load_files(options, memcache_addresses: List[str]) -> None:
     job = partial(
-        process_file, memcache_addresses=memcache_addresses, dry=options.dry
+        load_file,
+        memcache_addresses=memcache_addresses,
+        dry=options.dry,
+        batch_size=options.batch_size,
+        batch_bytes=options.batch_bytes,
+        resume=options.resume,
+        n_workers=options.file_workers,
+        sink=options.sink,
     )
 
     files = sorted(
         glob.glob(options.pattern), key=lambda file: Path(file).name
     )
+    # Loads of the same file are replayed one after another
+    jobs = [fn for fn in files for _ in range(options.replay)]
+
+    started = time.monotonic()
+    loads: Dict[str, List[Snapshot]] = defaultdict(list)
 
-    with mp.Pool() as pool:
-        for processed_file in pool.imap(job, files):
-            worker = mp.current_process()
-            logging.info(f"[{worker.name}] Renaming {processed_file}")
-            dot_rename(processed_file)
+    def finish(fn: str, snapshot: Snapshot) -> None:
+        loads[fn].append(snapshot)
+        if options.sink == "memcached":
+            rename_processed(fn)
+
+    if options.file_workers > 1:
+        # Files are loaded one by one, each one by all worker processes
+        for fn in jobs:
+            finish(*job(fn))
+    else:
+        with mp.Pool() as pool:
+            for processed_file, snapshot in pool.imap(job, jobs):
+                finish(processed_file, snapshot)
+
+    elapsed = time.monotonic() - started
+    snapshots = {fn: combine(snapshots) for fn, snapshots in loads.items()}
+    lines = sum(snapshot.counts["lines"] for snapshot in snapshots.values())
+    logging.info(
+        f"Loaded {lines} lines of {len(jobs)} files in {elapsed:.2f} s, "
+        f"{lines / elapsed if elapsed else 0:.0f} lines/s"
+    )
+    if options.report:
+        write_report(options.report, snapshots, elapsed)
 
 
 if __name__ == "__main__":
@@ -152,12 +599,103 @@ if __name__ == "__main__":
     op.add_option(
         "--pattern", action="store", default="/data/appsinstalled/*.tsv.gz"
     )
-    op.add_option("--idfa", action="store", default="127.0.0.1:33013")
-    op.add_option("--gaid", action="store", default="127.0.0.1:33014")
-    op.add_option("--adid", action="store", default="127.0.0.1:33015")
-    op.add_option("--dvid", action="store", default="127.0.0.1:33016")
+    op.add_option(
+        "--batch-size",
+        action="store",
+        type="int",
+        default=MEMCACHE_BATCH_SIZE,
+        help="Max number of records written to Memcache at once.",
+    )
+    op.add_option(
+        "--batch-bytes",
+        action="store",
+        type="int",
+        default=MEMCACHE_BATCH_BYTES,
+        help="Max size of values written to Memcache at once.",
+    )
+    op.add_option(
+        "--file-workers",
+        action="store",
+        type="int",
+        default=1,
+        help=(
+            "Number of processes parsing and writing chunks of a file "
+            "decompressed by the main one, files are loaded one by one "
+            "then [Default: 1, a process per file]."
+        ),
+    )
+    op.add_option(
+        "--sink",
+        action="store",
+        type="choice",
+        choices=SINKS,
+        default="memcached",
+        help=(
+            "Where records are written: Memcached nodes [Default], null "
+            "to drop them or fake to write to fake servers started by "
+            "the loader over local sockets. Files are not checkpointed "
+            "nor renamed with null and fake sinks."
+        ),
+    )
+    op.add_option(
+        "--replay",
+        action="store",
+        type="int",
+        default=1,
+        help=(
+            "Load every file so many times, only with null and fake "
+            "sinks [Default: 1]."
+        ),
+    )
+    op.add_option(
+        "--resume",
+        action="store_true",
+        default=True,
+        help="Resume loads of files from their checkpoints [Default].",
+    )
+    op.add_option(
+        "--no-resume",
+        action="store_false",
+        dest="resume",
+        help="Load files from the start ignoring their checkpoints.",
+    )
+    op.add_option(
+        "--report",
+        action="store",
+        default=None,
+        help=(
+            "Write a JSON report with counters and time spent by stages "
+            "of loads of all files to a file."
+        ),
+    )
+    op.add_option(
+        "--idfa",
+        action="store",
+        default="127.0.0.1:33013",
+        help="Comma-separated Memcached nodes of IDFA devices.",
+    )
+    op.add_option(
+        "--gaid",
+        action="store",
+        default="127.0.0.1:33014",
+        help="Comma-separated Memcached nodes of GAID devices.",
+    )
+    op.add_option(
+        "--adid",
+        action="store",
+        default="127.0.0.1:33015",
+        help="Comma-separated Memcached nodes of ADID devices.",
+    )
+    op.add_option(
+        "--dvid",
+        action="store",
+        default="127.0.0.1:33016",
+        help="Comma-separated Memcached nodes of DVID devices.",
+    )
 
     (opts, args) = op.parse_args()
+    if opts.replay > 1 and opts.sink == "memcached":
+        op.error("--replay needs a null or fake sink")
 
     logging.basicConfig(
         filename=opts.log,
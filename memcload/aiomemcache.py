@@ -0,0 +1,259 @@
+"""
+Asyncio Memcached client writing values with pools of connections.
+
+Keys go to clusters of nodes, a key is stored on a node of its cluster
+picked by consistent hashing, so adding a node moves few keys. Every
+node has a pool of up to `POOL_SIZE` connections. Commands of a batch
+are pipelined on one connection, so batches sent concurrently are in
+flight on different connections and a slow node only delays its own
+batches. Failed keys are retried after a backoff which doubles every
+attempt and doesn't block other writes.
+
+The client runs its event loop in a background thread, so it is used
+from synchronous code: `set` and `set_multi` block until values are
+stored as with python-memcached, `submit` returns a future at once.
+
+"""
+import asyncio
+import concurrent.futures
+import logging
+import re
+import threading
+
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from .ketama import Ring
+from .types import MemcacheKey
+
+
+POOL_SIZE = 4
+TIMEOUT = 3
+RETRY_NUMBER = 3
+# Seconds before the first retry, doubled for every next one
+RETRY_BACKOFF = 1
+# Printable ASCII without spaces, the limit of Memcached
+KEY_RE = re.compile(rb"[\x21-\x7e]{1,250}")
+
+
+class MemcacheError(Exception):
+    pass
+
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class Pool:
+    """Connections to a node, `size` of them are used at most.
+
+    Keys sent to the node, keys not stored and failed exchanges
+    are counted to `counts`. Must be created in the thread of the event
+    loop.
+    """
+
+    def __init__(self, address: str, size: int, timeout: float):
+        host, _, port = address.rpartition(":")
+        self.address = address
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(size)
+        self.idle: List[Connection] = []
+        self.counts: Counter = Counter()
+
+    async def set_multi(self, values: Dict[bytes, bytes]) -> List[bytes]:
+        """Store values pipelined on one connection, return keys
+        not stored.
+        """
+        self.counts["sets"] += len(values)
+        async with self.slots:
+            connection = self.idle.pop() if self.idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port),
+                        self.timeout,
+                    )
+                replies = await asyncio.wait_for(
+                    self.exchange(connection, values), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError, MemcacheError) as e:
+                logging.warning(
+                    f"Cannot write to Memcache {self.address}: {e!r}"
+                )
+                if connection is not None:
+                    # State of the connection is unknown
+                    connection[1].close()
+                self.counts["errors"] += 1
+                self.counts["failed"] += len(values)
+                return list(values)
+
+            self.idle.append(connection)
+
+        failed = [
+            key for key, reply in zip(values, replies) if reply != b"STORED"
+        ]
+        self.counts["failed"] += len(failed)
+        return failed
+
+    async def exchange(
+        self, connection: Connection, values: Dict[bytes, bytes]
+    ) -> List[bytes]:
+        reader, writer = connection
+        writer.write(
+            b"".join(
+                b"set %s 0 0 %d\r\n%s\r\n" % (key, len(value), value)
+                for key, value in values.items()
+            )
+        )
+        await writer.drain()
+
+        replies = []
+        for _ in values:
+            reply = await reader.readline()
+            if not reply.endswith(b"\r\n"):
+                raise MemcacheError("Connection closed by server")
+            replies.append(reply[:-2])
+        return replies
+
+    async def close(self) -> None:
+        for _, writer in self.idle:
+            writer.close()
+            await writer.wait_closed()
+        self.idle.clear()
+
+
+class Client:
+    """Client of clusters of Memcached nodes with an event loop of its
+    own.
+
+    Every item of `addresses` is a cluster: comma-separated addresses
+    of its nodes. Keys are tuples of an index of a cluster and a key
+    itself, as python-memcached uses them to pick a specific server.
+    """
+
+    def __init__(
+        self,
+        addresses: List[str],
+        pool_size: int = POOL_SIZE,
+        timeout: float = TIMEOUT,
+        retries: int = RETRY_NUMBER,
+        backoff: float = RETRY_BACKOFF,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        # Writes of keys repeated after failures
+        self.n_retries = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, daemon=True
+        )
+        self.thread.start()
+        self.rings = [Ring(cluster.split(",")) for cluster in addresses]
+        self.pools: Dict[str, Pool] = self.call(
+            self.create_pools(
+                [node for ring in self.rings for node in ring.nodes],
+                pool_size,
+                timeout,
+            )
+        )
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    async def create_pools(
+        self, addresses: List[str], size: int, timeout: float
+    ) -> Dict[str, Pool]:
+        return {address: Pool(address, size, timeout) for address in addresses}
+
+    def node_counts(self) -> Dict[str, Counter]:
+        """Keys sent, keys not stored and failed exchanges by nodes.
+        """
+        return {
+            address: Counter(pool.counts)
+            for address, pool in self.pools.items()
+        }
+
+    def call(self, coro):
+        """Run a coroutine in the event loop, wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def store(
+        self, mapping: Dict[MemcacheKey, bytes]
+    ) -> List[MemcacheKey]:
+        """Store values on their nodes concurrently, retry failed keys
+        only. Return keys failed to be stored after all retries.
+        """
+        invalid = []
+        names: Dict[MemcacheKey, bytes] = {}
+        for key in mapping:
+            name = key[1].encode("utf-8")
+            if KEY_RE.fullmatch(name):
+                names[key] = name
+            else:
+                logging.error(f"Invalid Memcache key: {key[1]!r}")
+                invalid.append(key)
+
+        nodes = {
+            key: self.rings[key[0] % len(self.rings)].node(name)
+            for key, name in names.items()
+        }
+        pending = [key for key in mapping if key in names]
+        for attempt in range(self.retries):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                self.n_retries += len(pending)
+
+            by_node: Dict[str, Dict[bytes, bytes]] = defaultdict(dict)
+            keys: Dict[bytes, MemcacheKey] = {}
+            for key in pending:
+                by_node[nodes[key]][names[key]] = mapping[key]
+                keys[names[key]] = key
+
+            results = await asyncio.gather(
+                *(
+                    self.pools[node].set_multi(values)
+                    for node, values in by_node.items()
+                )
+            )
+            pending = [keys[name] for failed in results for name in failed]
+            if not pending:
+                break
+
+        if pending:
+            logging.error(
+                f"Cannot write {len(pending)} keys to Memcache. "
+                "Server is down"
+            )
+        return invalid + pending
+
+    def submit(
+        self, mapping: Dict[MemcacheKey, bytes]
+    ) -> concurrent.futures.Future:
+        """Start storing values, the future results in failed keys.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.store(mapping), self.loop
+        )
+
+    def set_multi(
+        self, mapping: Dict[MemcacheKey, bytes]
+    ) -> List[MemcacheKey]:
+        return self.submit(mapping).result()
+
+    def set(self, key: MemcacheKey, value: bytes) -> bool:
+        return not self.set_multi({key: value})
+
+    def close(self) -> None:
+        if not self.loop.is_running():
+            return None
+
+        for pool in self.pools.values():
+            self.call(pool.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
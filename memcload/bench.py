@@ -0,0 +1,165 @@
+"""
+Microbenchmarks of parsing and serialization of lines.
+
+Compares the per-line path, `AppsInstalled.from_raw` with protobuf
+serialization, with the bytes-level batch parser on the same lines,
+either generated at random or read from a gzipped file, and reports
+the best time of a few runs of every step.
+
+"""
+import gzip
+import random
+import time
+
+from argparse import ArgumentParser
+from typing import Callable, List, NamedTuple
+
+from . import parser
+from .types import AppsInstalled, DeviceType
+
+
+DEFAULT_LINES = 20000
+DEFAULT_REPEAT = 3
+MAX_APPS = 100
+MAX_APP_ID = 10000
+
+
+class StepResult(NamedTuple):
+    label: str
+    # Best time of a run in seconds
+    elapsed: float
+    n_lines: int
+
+    @property
+    def us_per_line(self) -> float:
+        return self.elapsed / self.n_lines * 1e6 if self.n_lines else 0.0
+
+
+def generate_lines(n_lines: int, seed: int = 0) -> List[bytes]:
+    """Random valid lines of a log.
+    """
+    rnd = random.Random(seed)
+    dev_types = [str(dev_type) for dev_type in DeviceType]
+    lines = []
+    for _ in range(n_lines):
+        apps = ",".join(
+            str(rnd.randint(1, MAX_APP_ID))
+            for _ in range(rnd.randint(1, MAX_APPS))
+        )
+        lines.append(
+            (
+                f"{rnd.choice(dev_types)}\t{rnd.getrandbits(64):016x}\t"
+                f"{rnd.uniform(-90, 90):.6f}\t{rnd.uniform(-180, 180):.6f}\t"
+                f"{apps}"
+            ).encode()
+        )
+    return lines
+
+
+def read_lines(fn: str, n_lines: int) -> List[bytes]:
+    with gzip.open(fn) as fd:
+        return parser.split_lines(fd.read())[:n_lines]
+
+
+def parse_from_raw(lines: List[bytes]) -> List[AppsInstalled]:
+    parsed = []
+    for raw_line in lines:
+        line = raw_line.decode("utf-8").strip()
+        if not line:
+            continue
+        try:
+            parsed.append(AppsInstalled.from_raw(line))
+        except ValueError:
+            pass
+    return parsed
+
+
+def pack_from_raw(parsed: List[AppsInstalled]) -> list:
+    return [
+        parser.pack_appsinstalled(appsinstalled) for appsinstalled in parsed
+    ]
+
+
+def best_time(func: Callable, arg, repeat: int) -> float:
+    elapsed = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(arg)
+        elapsed = min(elapsed, time.perf_counter() - started)
+    return elapsed
+
+
+def run_steps(lines: List[bytes], repeat: int) -> List[StepResult]:
+    """Time parsing, serialization and both of them on both paths.
+    """
+    from_raw = parse_from_raw(lines)
+    parsed = parser.parse_lines(lines)
+    steps = [
+        ("parse       from_raw", parse_from_raw, lines),
+        ("parse       bytes", parser.parse_lines, lines),
+        ("serialize   protobuf", pack_from_raw, from_raw),
+        ("serialize   wire", parser.pack_parsed, parsed),
+        (
+            "total       from_raw",
+            lambda lines: pack_from_raw(parse_from_raw(lines)),
+            lines,
+        ),
+        (
+            "total       bytes",
+            lambda lines: parser.pack_parsed(parser.parse_lines(lines)),
+            lines,
+        ),
+    ]
+    return [
+        StepResult(label, best_time(func, arg, repeat), len(lines))
+        for label, func, arg in steps
+    ]
+
+
+def print_results(results: List[StepResult]) -> None:
+    print(f"{'step':<24}{'lines':>10}{'best, s':>10}{'us/line':>10}")
+    for result in results:
+        print(
+            f"{result.label:<24}{result.n_lines:>10}"
+            f"{result.elapsed:>10.3f}{result.us_per_line:>10.2f}"
+        )
+
+
+def parse_args():
+    """Parse command line arguments.
+    """
+    arg_parser = ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "-f",
+        "--file",
+        help="Gzipped log to take lines from [Default: random lines].",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "-n",
+        "--lines",
+        help=f"Number of lines [Default: {DEFAULT_LINES}].",
+        default=DEFAULT_LINES,
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--repeat",
+        help=f"Runs of every step [Default: {DEFAULT_REPEAT}].",
+        default=DEFAULT_REPEAT,
+        type=int,
+    )
+    return arg_parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.file is None:
+        lines = generate_lines(args.lines)
+    else:
+        lines = read_lines(args.file, args.lines)
+
+    print_results(run_steps(lines, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
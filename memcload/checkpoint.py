@@ -0,0 +1,136 @@
+"""
+Progress of loaded files saved to sidecar files.
+
+A checkpoint of a file tells how many of its lines and uncompressed
+bytes are written to Memcache, with statuses of the lines, so a load
+stopped halfway is resumed from that position with the right error
+rate. The sidecar is bound to the size and mtime of the file, it is
+ignored once the file changes.
+
+Batches of a file may be written out of order by several processes,
+`Progress` keeps the position up to which all of them are written.
+
+"""
+import json
+import logging
+import os
+import threading
+
+from collections import Counter, deque
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple
+from typing import Optional, Tuple
+
+from .types import Position, ProcessingStatus
+
+
+SUFFIX = ".checkpoint"
+# Seconds between checkpoints of a file being loaded
+INTERVAL = 10
+
+
+class Checkpoint(NamedTuple):
+    position: Position
+    statuses: Counter
+
+
+def sidecar(fn: str) -> str:
+    return fn + SUFFIX
+
+
+def identity(fn: str) -> dict:
+    stat = os.stat(fn)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def save(fn: str, position: Position, statuses: Counter) -> None:
+    """Replace a checkpoint of a file atomically.
+    """
+    data = {
+        "file": identity(fn),
+        "n_lines": position.n_lines,
+        "offset": position.offset,
+        "statuses": {status.name: statuses[status] for status in statuses},
+    }
+    tmp = sidecar(fn) + ".tmp"
+    with open(tmp, "w") as fd:
+        json.dump(data, fd)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(tmp, sidecar(fn))
+
+
+def load(fn: str) -> Optional[Checkpoint]:
+    """Checkpoint of a file, None if there is no valid one.
+    """
+    try:
+        with open(sidecar(fn)) as fd:
+            data = json.load(fd)
+        if data["file"] != identity(fn):
+            logging.warning(f"{fn} changed since checkpoint, starting over")
+            return None
+        return Checkpoint(
+            Position(data["n_lines"], data["offset"]),
+            Counter(
+                {
+                    ProcessingStatus[name]: count
+                    for name, count in data["statuses"].items()
+                }
+            ),
+        )
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Invalid checkpoint of {fn}: {e!r}")
+        return None
+
+
+def remove(fn: str) -> None:
+    try:
+        os.remove(sidecar(fn))
+    except FileNotFoundError:
+        pass
+
+
+class Progress:
+    """Position and statuses of lines of a file written so far.
+
+    Positions of batches are registered in the order of the file by
+    `track`, batches are reported by `complete` in any order once they
+    are written. The file is loaded up to the first batch which is not
+    complete yet, its checkpoint is saved then if `save` is on.
+    """
+
+    def __init__(self, fn: str, saved: Optional[Checkpoint], save: bool):
+        self.fn = fn
+        self.saving = save
+        self.position = Position(0, 0)
+        self.statuses: Counter = Counter()
+        if saved is not None:
+            self.position = saved.position
+            self.statuses.update(saved.statuses)
+        self.sent: Deque[Position] = deque()
+        self.done: Dict[Position, Counter] = {}
+        # Batches are tracked and completed by different threads
+        self.lock = threading.Lock()
+
+    def track(self, chunks: Iterable[Tuple]) -> Iterator[Tuple]:
+        """Register positions of chunks, the last item of each one.
+        """
+        for chunk in chunks:
+            with self.lock:
+                self.sent.append(chunk[-1])
+            yield chunk
+
+    def complete(self, batches: List[Tuple[Position, Counter]]) -> None:
+        """Add statuses of written batches, save a checkpoint if the
+        loaded part of the file has grown.
+        """
+        with self.lock:
+            self.done.update(batches)
+            position = self.position
+            while self.sent and self.sent[0] in self.done:
+                self.position = self.sent.popleft()
+                self.statuses.update(self.done.pop(self.position))
+
+            if self.saving and self.position != position:
+                save(self.fn, self.position, self.statuses)
@@ -0,0 +1,151 @@
+"""
+In-process stand-ins of Memcached for tests and benchmarks.
+
+`FakeMemcache` understands `set` and `get` commands of the text protocol
+and keeps values in a dict. The server runs its own event loop in
+a background thread and listens on a local TCP port. `NullClient` drops
+values without any I/O.
+
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from .types import MemcacheKey
+
+
+class FakeMemcache:
+    """Fake Memcached server.
+
+    `failures` tells how many times a set of a key is answered with
+    NOT_STORED before the value is stored, every command is answered
+    after `delay` seconds.
+    """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.values: Dict[bytes, bytes] = {}
+        self.failures: Counter = Counter()
+        self.n_sets = 0
+        self.n_connections = 0
+        self.writers: Set[asyncio.StreamWriter] = set()
+        self.handlers: Set[asyncio.Task] = set()
+        self.loop = asyncio.new_event_loop()
+        self.thread: Optional[threading.Thread] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.address = ""
+
+    def __enter__(self) -> "FakeMemcache":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, daemon=True
+        )
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0),
+            self.loop,
+        ).result()
+        host, port = self.server.sockets[0].getsockname()[:2]
+        self.address = f"{host}:{port}"
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def shutdown(self) -> None:
+        self.server.close()
+        for writer in self.writers:
+            writer.close()
+        await asyncio.gather(*self.handlers)
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.n_connections += 1
+        self.writers.add(writer)
+        self.handlers.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+                command, *args = line.split() or [b""]
+                if command == b"set":
+                    key, _, _, size = args[:4]
+                    value = await reader.readexactly(int(size) + 2)
+                    writer.write(self.set(key, value[:-2]))
+                elif command == b"get":
+                    for key in args:
+                        if key in self.values:
+                            value = self.values[key]
+                            writer.write(
+                                b"VALUE %s 0 %d\r\n%s\r\n"
+                                % (key, len(value), value)
+                            )
+                    writer.write(b"END\r\n")
+                else:
+                    writer.write(b"ERROR\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def set(self, key: bytes, value: bytes) -> bytes:
+        self.n_sets += 1
+        if self.failures[key] > 0:
+            self.failures[key] -= 1
+            return b"NOT_STORED\r\n"
+        self.values[key] = value
+        return b"STORED\r\n"
+
+
+class NullClient:
+    """Client of `aiomemcache` interface which stores nothing and never
+    fails.
+    """
+
+    n_retries = 0
+
+    def __enter__(self) -> "NullClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(
+        self, mapping: Dict[MemcacheKey, bytes]
+    ) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        future.set_result([])
+        return future
+
+    def set_multi(
+        self, mapping: Dict[MemcacheKey, bytes]
+    ) -> List[MemcacheKey]:
+        return []
+
+    def set(self, key: MemcacheKey, value: bytes) -> bool:
+        return True
+
+    def node_counts(self) -> Dict[str, Counter]:
+        return {}
+
+    def close(self) -> None:
+        pass
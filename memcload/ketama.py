@@ -0,0 +1,54 @@
+"""
+Consistent hashing of keys over nodes compatible with libketama.
+
+Every node takes `POINTS` points of a circle of 32-bit hashes, made of
+MD5 digests of its name with a number, and a key belongs to the node of
+the first point at or after the hash of the key. A new node takes over
+only keys which fall just before its own points, about 1/n of them.
+
+"""
+import hashlib
+
+from bisect import bisect_left
+from typing import List
+
+
+# Points of every node on the circle, 4 per MD5 digest
+POINTS = 160
+
+
+def hashes(data: bytes) -> List[int]:
+    """Four little-endian 32-bit hashes made of an MD5 digest.
+    """
+    digest = hashlib.md5(data).digest()
+    return [
+        int.from_bytes(digest[n : n + 4], "little") for n in range(0, 16, 4)
+    ]
+
+
+class Ring:
+    """Nodes on a circle of hashes.
+    """
+
+    def __init__(self, nodes: List[str]):
+        if not nodes:
+            raise ValueError("No nodes to hash keys to.")
+
+        self.nodes = list(nodes)
+        points = sorted(
+            (point, node)
+            for node in self.nodes
+            for n in range(POINTS // 4)
+            for point in hashes(f"{node}-{n}".encode())
+        )
+        self.points = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def node(self, key: bytes) -> str:
+        """Node of a key.
+        """
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        point = int.from_bytes(hashlib.md5(key).digest()[:4], "little")
+        n = bisect_left(self.points, point)
+        return self.owners[n % len(self.owners)]
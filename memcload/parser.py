@@ -0,0 +1,167 @@
+"""
+Parser of batches of lines working on bytes.
+
+Lines of the usual form, a known device type in lower case, a device ID
+of printable ASCII, decimal coordinates and app IDs separated by commas,
+are split by a regular expression without being decoded. App IDs of all
+lines of a batch are kept in one `array('I')` and values are serialized
+straight to the wire format of `UserApps`, the same bytes as protobuf
+makes. Any other line goes through `AppsInstalled.from_raw`, so empty
+and invalid lines are handled exactly as before.
+
+"""
+import logging
+import re
+import struct
+
+from array import array
+from collections import Counter
+from typing import Iterable, List, NamedTuple
+
+from . import appsinstalled_pb2
+from .types import AppsInstalled, DeviceType, MemcacheKey, ProcessingStatus
+from .types import Record
+
+
+LINE_RE = re.compile(
+    rb"(idfa|gaid|adid|dvid)\t([\x21-\x7e]+)"
+    rb"\t([-+.0-9eE]+)\t([-+.0-9eE]+)\t([0-9]+(?:,[0-9]+)*)"
+)
+# Index of a server and a prefix of keys by a raw device type
+DEVICE_TYPES = {
+    str(dev_type).encode(): (dev_type.value, f"{dev_type}:")
+    for dev_type in DeviceType
+}
+
+# Fields of `UserApps`: repeated uint32 apps = 1, double lat = 2, lon = 3
+APP_TAG = 0x08
+LAT_TAG = 0x11
+LON_TAG = 0x19
+COORDS = struct.Struct("<BdBd")
+# Encoded fields of so many distinct app IDs are cached
+APP_CACHE_SIZE = 65536
+
+
+class ParsedLines(NamedTuple):
+    # Keys of valid lines
+    keys: List[MemcacheKey]
+    # Latitude and longitude of every valid line in turn
+    coords: array
+    # App IDs of all valid lines, those of the n-th one end at ends[n]
+    apps: array
+    ends: array
+    # Statuses of skipped and invalid lines
+    statuses: Counter
+
+
+def varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+class AppFields(dict):
+    """Encoded app fields by app IDs, computed on first use.
+    """
+
+    def __missing__(self, app: int) -> bytes:
+        field = bytes([APP_TAG]) + varint(app)
+        if len(self) < APP_CACHE_SIZE:
+            self[app] = field
+        return field
+
+
+APP_FIELDS = AppFields()
+
+
+def split_lines(data: bytes) -> List[bytes]:
+    lines = data.split(b"\n")
+    if data.endswith(b"\n"):
+        lines.pop()
+    return lines
+
+
+def parse_lines(lines: Iterable[bytes]) -> ParsedLines:
+    """Parse raw lines without line breaks, count skipped and invalid
+    ones.
+    """
+    parsed = ParsedLines([], array("d"), array("I"), array("Q"), Counter())
+    keys, coords, apps, ends = parsed[:4]
+    for raw_line in lines:
+        match = LINE_RE.fullmatch(raw_line)
+        if match is None:
+            parse_line(raw_line, parsed)
+            continue
+
+        raw_dev_type, dev_id, raw_lat, raw_lon, raw_apps = match.groups()
+        n_apps = len(apps)
+        try:
+            lat, lon = float(raw_lat), float(raw_lon)
+            apps.extend(map(int, raw_apps.split(b",")))
+        except (ValueError, OverflowError):
+            # Let `from_raw` deal with it
+            del apps[n_apps:]
+            parse_line(raw_line, parsed)
+            continue
+
+        server, prefix = DEVICE_TYPES[raw_dev_type]
+        keys.append((server, prefix + dev_id.decode("ascii")))
+        coords.append(lat)
+        coords.append(lon)
+        ends.append(len(apps))
+    return parsed
+
+
+def parse_line(raw_line: bytes, parsed: ParsedLines) -> None:
+    """Parse a line of any other form with `AppsInstalled.from_raw`.
+    """
+    line = raw_line.decode("utf-8").strip()
+    if not line:
+        parsed.statuses[ProcessingStatus.SKIP] += 1
+        return None
+
+    try:
+        appsinstalled = AppsInstalled.from_raw(line)
+        # IDs beyond uint32 can't be serialized
+        apps = array("I", appsinstalled.apps)
+    except (ValueError, OverflowError) as e:
+        logging.error(f"Cannot parse line: {e}")
+        parsed.statuses[ProcessingStatus.ERROR] += 1
+        return None
+
+    key = "%s:%s" % (appsinstalled.dev_type, appsinstalled.dev_id)
+    parsed.keys.append((appsinstalled.dev_type.value, key))
+    parsed.coords.append(appsinstalled.lat)
+    parsed.coords.append(appsinstalled.lon)
+    parsed.apps.extend(apps)
+    parsed.ends.append(len(parsed.apps))
+
+
+def pack_parsed(parsed: ParsedLines) -> List[Record]:
+    """Memcache keys and serialized values of parsed lines.
+    """
+    records = []
+    coords, apps = parsed.coords, parsed.apps
+    start = 0
+    for n, (key, end) in enumerate(zip(parsed.keys, parsed.ends)):
+        packed = b"".join(
+            map(APP_FIELDS.__getitem__, apps[start:end])
+        ) + COORDS.pack(LAT_TAG, coords[2 * n], LON_TAG, coords[2 * n + 1])
+        records.append((key, packed))
+        start = end
+    return records
+
+
+def pack_appsinstalled(appsinstalled: AppsInstalled) -> Record:
+    """Memcache key and value of a line serialized by protobuf.
+    """
+    ua = appsinstalled_pb2.UserApps()
+    ua.lat = appsinstalled.lat
+    ua.lon = appsinstalled.lon
+    key = "%s:%s" % (appsinstalled.dev_type, appsinstalled.dev_id)
+    ua.apps.extend(appsinstalled.apps)
+    # Use a tuple as key to write to the nodes of the device type
+    return (appsinstalled.dev_type.value, key), ua.SerializeToString()
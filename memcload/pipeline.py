@@ -0,0 +1,109 @@
+"""
+Stages of a pipeline run in threads connected by bounded queues.
+
+The first stage produces items, every next one consumes items of the
+previous stage and yields its own ones. Bounded queues keep memory
+constant whatever the size of the input: a fast stage waits for a slow
+one. Stages overlap, and those that spend their time out of the GIL
+(decompression, socket I/O) run on other cores. Stages holding the GIL
+share a single core, they need processes to scale.
+
+If a stage fails the others are cancelled, and the error is raised
+from `run_pipeline` once all of them have stopped.
+
+"""
+import threading
+
+from queue import Queue
+from typing import Callable, Iterable, Iterator, List, Optional
+
+
+# Batches of items buffered between two stages
+QUEUE_SIZE = 8
+# End of a stream of items
+DONE = None
+
+
+class Stage(threading.Thread):
+    """Thread running a function of a pipeline stage.
+
+    `func` is called without arguments if the stage has no inbox,
+    otherwise with an iterator over the inbox items. Items it returns
+    are put to the outbox, the returned value of the last stage
+    is ignored.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        inbox: Optional[Queue],
+        outbox: Optional[Queue],
+        cancelled: threading.Event,
+        name: Optional[str] = None,
+    ):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.cancelled = cancelled
+        self.error: Optional[Exception] = None
+        self.exhausted = inbox is None
+
+    def receive(self) -> Iterator:
+        while not self.cancelled.is_set():
+            item = self.inbox.get()
+            if item is DONE:
+                self.exhausted = True
+                return None
+            yield item
+
+    def run(self) -> None:
+        try:
+            if self.inbox is None:
+                results = self.func()
+            else:
+                results = self.func(self.receive())
+
+            if self.outbox is not None:
+                for result in results:
+                    if self.cancelled.is_set():
+                        break
+                    self.outbox.put(result)
+        except Exception as e:
+            self.error = e
+            self.cancelled.set()
+        finally:
+            if self.outbox is not None:
+                self.outbox.put(DONE)
+            # Unblock the previous stage if this one stopped early
+            while not self.exhausted:
+                self.exhausted = self.inbox.get() is DONE
+
+
+def run_pipeline(
+    source: Callable[[], Iterable],
+    *stages: Callable[[Iterator], Optional[Iterable]],
+    queue_size: int = QUEUE_SIZE,
+) -> None:
+    """Run `source` and `stages` each in its own thread until all items
+    pass through, raise the first error of a failed stage.
+    """
+    cancelled = threading.Event()
+    threads: List[Stage] = []
+    inbox: Optional[Queue] = None
+    funcs = (source, *stages)
+    for n, func in enumerate(funcs):
+        outbox = Queue(queue_size) if n < len(funcs) - 1 else None
+        # Stages are usually partials of functions
+        name = getattr(getattr(func, "func", func), "__name__", None)
+        threads.append(Stage(func, inbox, outbox, cancelled, name=name))
+        inbox = outbox
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for thread in threads:
+        if thread.error is not None:
+            raise thread.error
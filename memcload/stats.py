@@ -0,0 +1,209 @@
+"""
+Counters and timings of stages of file loads.
+
+Stages of a pipeline add counts of what they handle (compressed and
+uncompressed bytes, lines, records stored, retries) and seconds they
+spend on their work (decompress, parse, serialize, write) to `Stats` of
+a file, Memcache clients add counters of their nodes. `Reporter` logs
+rates of the counters of every process loading the file with the
+estimated time remaining, `write_report` saves stats of all files of
+a run as JSON.
+
+"""
+import json
+import logging
+import multiprocessing as mp
+import os
+import threading
+import time
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple
+from typing import Optional, Tuple
+
+
+STAGES = ("decompress", "parse", "serialize", "write")
+# Seconds between progress lines
+INTERVAL = 10
+
+
+class Snapshot(NamedTuple):
+    # Seconds since the stats were created
+    elapsed: float
+    counts: Counter
+    # Seconds spent by stages
+    timings: Counter
+    # Counters of Memcached nodes by addresses
+    nodes: Dict[str, Counter]
+
+
+class Stats:
+    """Counters and stage timings updated by threads of a process.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counts: Counter = Counter()
+        self.timings: Counter = Counter()
+        self.nodes: Dict[str, Counter] = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self.lock:
+            self.counts.update(counts)
+
+    def add_nodes(self, nodes: Dict[str, Counter]) -> None:
+        with self.lock:
+            for address, counts in nodes.items():
+                self.nodes[address].update(counts)
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield None
+        finally:
+            with self.lock:
+                self.timings[stage] += time.perf_counter() - started
+
+    def merge(self, snapshot: Snapshot) -> None:
+        """Add counters and timings of another process.
+        """
+        self.add_nodes(snapshot.nodes)
+        with self.lock:
+            self.counts.update(snapshot.counts)
+            self.timings.update(snapshot.timings)
+
+    def snapshot(self) -> Snapshot:
+        with self.lock:
+            return Snapshot(
+                time.monotonic() - self.started,
+                Counter(self.counts),
+                Counter(self.timings),
+                {
+                    address: Counter(counts)
+                    for address, counts in self.nodes.items()
+                },
+            )
+
+
+Rates = Dict[str, float]
+
+
+def rates(current: Snapshot, previous: Optional[Snapshot]) -> Rates:
+    """Counters per second between two snapshots of the same stats.
+    """
+    if previous is None:
+        previous = Snapshot(0.0, Counter(), Counter(), {})
+    elapsed = current.elapsed - previous.elapsed
+    if elapsed <= 0:
+        return {}
+    return {
+        name: (count - previous.counts[name]) / elapsed
+        for name, count in current.counts.items()
+    }
+
+
+class Reporter(threading.Thread):
+    """Thread logging progress of a file load every `INTERVAL` seconds.
+
+    A line is logged for every source of snapshots, the process itself
+    by default. The time remaining is estimated by compressed bytes of
+    the file counted to `stats`, those skipped on resume are left out.
+    """
+
+    def __init__(
+        self,
+        fn: str,
+        stats: Stats,
+        sources: Optional[Callable[[], Dict[str, Snapshot]]] = None,
+    ):
+        super().__init__(daemon=True)
+        self.fn = fn
+        self.size = os.path.getsize(fn)
+        self.stats = stats
+        self.sources = sources or self.own_snapshot
+        self.latest: Dict[str, Tuple[Snapshot, Rates]] = {}
+        self.stopped = threading.Event()
+
+    def __enter__(self) -> "Reporter":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+        self.join()
+
+    def own_snapshot(self) -> Dict[str, Snapshot]:
+        return {mp.current_process().name: self.stats.snapshot()}
+
+    def run(self) -> None:
+        while not self.stopped.wait(INTERVAL):
+            self.report()
+
+    def report(self) -> None:
+        eta = self.eta()
+        for name, snapshot in sorted(self.sources().items()):
+            previous, last_rates = self.latest.get(name, (None, {}))
+            # Rates stay the same until a source sends a newer snapshot
+            if previous is None or snapshot.elapsed > previous.elapsed:
+                last_rates = rates(snapshot, previous)
+                self.latest[name] = snapshot, last_rates
+
+            logging.info(
+                f"[{name}] [{self.fn}] "
+                f"{last_rates.get('lines', 0):.0f} lines/s, "
+                f"{last_rates.get('bytes', 0) / 2 ** 20:.2f} MB/s, "
+                f"{last_rates.get('sets', 0):.0f} sets/s, "
+                f"{snapshot.counts['retries']} retries, ETA {eta}"
+            )
+
+    def eta(self) -> str:
+        snapshot = self.stats.snapshot()
+        done = snapshot.counts["compressed"]
+        if not done or not snapshot.elapsed:
+            return "unknown"
+        size = self.size - snapshot.counts["resumed"]
+        left = max(size - done, 0) * snapshot.elapsed / done
+        return str(timedelta(seconds=round(left)))
+
+
+def combine(snapshots: Iterable[Snapshot]) -> Snapshot:
+    """Sum of snapshots of loads, elapsed time included.
+    """
+    total = Stats()
+    elapsed = 0.0
+    for snapshot in snapshots:
+        total.merge(snapshot)
+        elapsed += snapshot.elapsed
+    return total.snapshot()._replace(elapsed=elapsed)
+
+
+def summary(snapshot: Snapshot) -> dict:
+    return {
+        "elapsed": round(snapshot.elapsed, 3),
+        "counts": dict(sorted(snapshot.counts.items())),
+        "stages": {
+            stage: round(snapshot.timings[stage], 3) for stage in STAGES
+        },
+        "nodes": {
+            address: dict(sorted(counts.items()))
+            for address, counts in sorted(snapshot.nodes.items())
+        },
+    }
+
+
+def write_report(
+    path: str, snapshots: Dict[str, Snapshot], elapsed: float
+) -> None:
+    """Save stats of files loaded by a run and their totals as JSON.
+    """
+    total = combine(snapshots.values())._replace(elapsed=elapsed)
+    report = {
+        "files": {fn: summary(snapshot) for fn, snapshot in snapshots.items()},
+        "total": summary(total),
+    }
+    with open(path, "w") as fd:
+        json.dump(report, fd, indent=2)
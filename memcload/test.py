@@ -1,8 +1,27 @@
+import gzip
+import json
 import math
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import types
 import unittest
 
-from . import appsinstalled_pb2
-from .types import AppsInstalled, DeviceType
+from collections import Counter
+from unittest import mock
+
+from . import aiomemcache, appsinstalled_pb2, checkpoint, ketama, parser
+from .__main__ import main, process_file, read_chunks
+from .fakememcache import FakeMemcache
+from .pipeline import run_pipeline
+from .stats import Reporter, Stats, write_report
+from .types import AppsInstalled, DeviceType, Position, ProcessingStatus
+
+
+SAMPLE = pathlib.Path(__file__).parent / "sample.tsv.gz"
 
 
 class TestMemcLoad(unittest.TestCase):
@@ -54,5 +73,592 @@ class TestMemcLoad(unittest.TestCase):
             AppsInstalled.from_raw("gaid\t\t0\t0\t1,2,3")
 
 
+class TestParser(unittest.TestCase):
+    LINES = [
+        b"idfa\t1rfw452y52g2gq4g\t55.55\t42.42\t1423,43,567,3,7,23",
+        b"gaid\tx\t-1e2\t+0.5\t0,127,128,16384,4294967295",
+        b"  ADID\t1\t0\t0\t1423,   ",
+        b"dvid\t1\ta\tb\t      1,  2,  aaa, 42   ",
+        b"dvid\t2\tnan\t1\t5,,6",
+        b"idfa\t\xd0\xb8\xd0\xb4\t1\t2\t3",
+        b"",
+        b" \t ",
+        b"idfa\t1\t0\t0",
+        b"xxxx\t1\t0\t0\t1,2,3",
+        b"gaid\t\t0\t0\t1,2,3",
+        b"idfa\t1\t0\t0\t1\t2",
+    ]
+
+    def test_same_as_from_raw(self):
+        """Lines are parsed and serialized as with protobuf
+        """
+        expected = []
+        for raw_line in self.LINES:
+            try:
+                appsinstalled = AppsInstalled.from_raw(raw_line.decode())
+            except ValueError:
+                continue
+            expected.append(parser.pack_appsinstalled(appsinstalled))
+
+        with self.assertLogs(level="INFO"):
+            parsed = parser.parse_lines(self.LINES)
+        self.assertEqual(parser.pack_parsed(parsed), expected)
+        self.assertEqual(
+            parsed.statuses,
+            Counter({ProcessingStatus.SKIP: 2, ProcessingStatus.ERROR: 4}),
+        )
+
+    def test_apps_out_of_range(self):
+        """Lines with apps beyond uint32 are invalid
+        """
+        lines = [b"idfa\t1\t0\t0\t1,4294967296", b"gaid\t2\t0\t0\t-1,1"]
+        with self.assertLogs(level="ERROR") as cm:
+            parsed = parser.parse_lines(lines + [b"dvid\t3\t0\t0\t1"])
+        self.assertEqual(len(cm.output), 2)
+        self.assertEqual(parsed.statuses[ProcessingStatus.ERROR], 2)
+        self.assertEqual(parsed.keys, [(3, "dvid:3")])
+        self.assertEqual(list(parsed.apps), [1])
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stages(self):
+        """Items pass through all stages in order
+        """
+        received = []
+        run_pipeline(
+            lambda: iter(range(100)),
+            lambda items: (item * 2 for item in items),
+            lambda items: received.extend(items),
+            queue_size=1,
+        )
+        self.assertEqual(received, [item * 2 for item in range(100)])
+
+    def test_failed_stage(self):
+        """Error of a stage is raised once the others are stopped
+        """
+        produced = []
+
+        def source():
+            for item in range(10000):
+                produced.append(item)
+                yield item
+
+        def sink(items):
+            for item in items:
+                if item == 10:
+                    raise RuntimeError("Sink failed")
+
+        with self.assertRaisesRegex(RuntimeError, "Sink failed"):
+            run_pipeline(source, lambda items: items, sink, queue_size=1)
+        self.assertLess(len(produced), 10000)
+        self.assertEqual(threading.active_count(), 1)
+
+
+class TestAsyncMemcache(unittest.TestCase):
+    def setUp(self):
+        self.servers = [FakeMemcache(), FakeMemcache(delay=0.2)]
+        for server in self.servers:
+            server.start()
+            self.addCleanup(server.stop)
+        addresses = [server.address for server in self.servers]
+        self.client = aiomemcache.Client(addresses, pool_size=4)
+        self.addCleanup(self.client.close)
+
+    def test_set(self):
+        """Values are written to servers picked by keys
+        """
+        self.assertTrue(self.client.set((0, "a:1"), b"one"))
+        self.assertEqual(
+            self.client.set_multi({(2, "a:2"): b"two", (1, "a:3"): b""}), []
+        )
+        self.assertEqual(
+            self.servers[0].values, {b"a:1": b"one", b"a:2": b"two"}
+        )
+        self.assertEqual(self.servers[1].values, {b"a:3": b""})
+
+        # Connection is reused
+        self.client.set((0, "a:4"), b"four")
+        self.assertEqual(self.servers[0].n_connections, 1)
+
+    def test_invalid_key(self):
+        """Keys which would break the protocol are not sent
+        """
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(
+                self.client.set_multi({(0, "a b"): b"1", (0, "a:b"): b"2"}),
+                [(0, "a b")],
+            )
+        self.assertEqual(self.servers[0].values, {b"a:b": b"2"})
+
+    def test_cluster(self):
+        """Keys of a cluster are spread over its nodes
+        """
+        servers = [FakeMemcache() for _ in range(3)]
+        for server in servers:
+            server.start()
+            self.addCleanup(server.stop)
+        nodes = [server.address for server in servers]
+        ring = ketama.Ring(nodes)
+        names = [f"idfa:{n}".encode() for n in range(100)]
+        servers[2].failures.update(dict.fromkeys(names, 1))
+
+        keys = {(0, name.decode()): b"1" for name in names}
+        with aiomemcache.Client([",".join(nodes)], backoff=0) as client:
+            self.assertEqual(client.set_multi(keys), [])
+            node_counts = client.node_counts()
+
+        for node, server in zip(nodes, servers):
+            stored = {name for name in names if ring.node(name) == node}
+            self.assertTrue(stored)
+            self.assertEqual(set(server.values), stored)
+        # Keys failed once are written again to the same node
+        self.assertEqual(node_counts[nodes[0]]["failed"], 0)
+        n_keys = len(servers[2].values)
+        self.assertEqual(
+            node_counts[nodes[2]], Counter(sets=2 * n_keys, failed=n_keys)
+        )
+
+    def test_slow_server(self):
+        """Slow server delays only its own writes, with many in flight
+        """
+        started = time.monotonic()
+        slow = [
+            self.client.submit({(1, f"slow:{n}"): b"1"}) for n in range(8)
+        ]
+        self.assertTrue(self.client.set((0, "fast"), b"1"))
+        self.assertLess(time.monotonic() - started, 0.2)
+
+        for future in slow:
+            self.assertEqual(future.result(), [])
+        # Batches are written over 4 connections at once
+        self.assertLess(time.monotonic() - started, 8 * 0.2)
+        self.assertEqual(self.servers[1].n_connections, 4)
+
+    def test_server_down(self):
+        """Keys are retried with backoff and returned if not stored
+        """
+        self.servers[0].failures[b"a:1"] = 2
+        self.servers[0].failures[b"a:2"] = 3
+        client = aiomemcache.Client(
+            [self.servers[0].address], backoff=0.01, retries=3
+        )
+        with client, self.assertLogs(level="ERROR") as cm:
+            self.assertEqual(
+                client.set_multi({(0, "a:1"): b"1", (0, "a:2"): b"2"}),
+                [(0, "a:2")],
+            )
+        self.assertEqual(self.servers[0].values, {b"a:1": b"1"})
+        self.assertEqual(client.n_retries, 4)
+        self.assertIn("Cannot write 1 keys", cm.output[0])
+
+        # Nothing listens on the port of a stopped server
+        down = FakeMemcache()
+        down.start()
+        down.stop()
+        client = aiomemcache.Client([down.address], backoff=0)
+        with client, self.assertLogs(level="WARNING") as cm:
+            self.assertFalse(client.set((0, "a:3"), b"3"))
+        self.assertIn("Cannot write to Memcache", cm.output[0])
+
+
+class TestKetama(unittest.TestCase):
+    KEYS = [f"idfa:{n}".encode() for n in range(10000)]
+
+    def test_balance(self):
+        """Keys are spread over nodes evenly
+        """
+        ring = ketama.Ring(["a:1", "b:1", "c:1"])
+        counts = Counter(map(ring.node, self.KEYS))
+        self.assertEqual(set(counts), {"a:1", "b:1", "c:1"})
+        for count in counts.values():
+            self.assertGreater(count, len(self.KEYS) / 3 * 0.75)
+
+    def test_new_node(self):
+        """A new node takes keys of other nodes, the rest stay in place
+        """
+        old = ketama.Ring(["a:1", "b:1", "c:1"])
+        new = ketama.Ring(["a:1", "b:1", "c:1", "d:1"])
+        moved = [key for key in self.KEYS if old.node(key) != new.node(key)]
+        self.assertEqual({new.node(key) for key in moved}, {"d:1"})
+        self.assertLess(len(moved), len(self.KEYS) / 4 * 1.25)
+        self.assertEqual(ketama.Ring(["a:1"]).node(b"idfa:1"), "a:1")
+
+
+class TestProcessFile(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = str(pathlib.Path(tmp.name) / "input.tsv.gz")
+
+        self.servers = [FakeMemcache() for _ in DeviceType]
+        for server in self.servers:
+            server.start()
+            self.addCleanup(server.stop)
+        self.addresses = [server.address for server in self.servers]
+
+    def write(self, data):
+        with gzip.open(self.path, "wb") as fd:
+            fd.write(data)
+
+    def test_read_chunks(self):
+        """Chunks consist of whole lines
+        """
+        self.write(b"first\nsecond\n\nlast")
+        chunks = list(read_chunks(self.path, chunk_size=4))
+        self.assertEqual(
+            [data for data, _ in chunks],
+            [b"first\n", b"second\n\n", b"last"],
+        )
+        self.assertEqual(chunks[-1][1], Position(4, 18))
+        self.assertEqual(
+            [line for data, _ in chunks for line in parser.split_lines(data)],
+            [b"first", b"second", b"", b"last"],
+        )
+
+        # Reading is resumed from positions of chunks, compressed bytes
+        # skipped to get there are counted apart
+        size = os.path.getsize(self.path)
+        for n, (_, position) in enumerate(chunks):
+            stats = Stats()
+            rest = read_chunks(
+                self.path, chunk_size=4, start=position, stats=stats
+            )
+            self.assertEqual(list(rest), chunks[n + 1 :])
+            counts = stats.snapshot().counts
+            self.assertEqual(counts["resumed"] + counts["compressed"], size)
+            self.assertGreater(counts["resumed"], 0)
+
+    def test_memcache_writes(self):
+        """Every valid line is written to a server of its device type
+        """
+        shutil.copy(SAMPLE, self.path)
+        with gzip.open(self.path) as fd:
+            n_lines = len(fd.read().splitlines())
+
+        with self.assertLogs(level="INFO") as cm:
+            self.assertEqual(
+                process_file(self.path, self.addresses, False), self.path
+            )
+
+        self.assertEqual(
+            sum(len(server.values) for server in self.servers), n_lines
+        )
+        for dev_type, server in zip(DeviceType, self.servers):
+            for key in server.values:
+                self.assertTrue(key.startswith(f"{dev_type}:".encode()))
+
+        packed = self.servers[0].values[b"idfa:1rfw452y52g2gq4g"]
+        ua = appsinstalled_pb2.UserApps()
+        ua.ParseFromString(packed)
+        self.assertEqual(list(ua.apps), [1423, 43, 567, 3, 7, 23])
+        self.assertIn("Acceptable error rate: 0.0", cm.output[-1])
+
+    def test_batches(self):
+        """Batch is flushed once it's large enough
+        """
+        lines = b"".join(
+            b"gaid\t%d\t0\t0\t%s\n" % (n, b",".join([b"100000"] * 50))
+            for n in range(10)
+        )
+        self.write(lines)
+        submit = aiomemcache.Client.submit
+        for limits, sizes in (
+            ({"batch_bytes": 600}, [3, 3, 3, 1]),
+            ({"batch_size": 4}, [4, 4, 2]),
+        ):
+            with mock.patch.object(
+                aiomemcache.Client, "submit", autospec=True, side_effect=submit
+            ) as patched, self.assertLogs(level="INFO"):
+                process_file(
+                    self.path, self.addresses, False, resume=False, **limits
+                )
+
+            # Every value is 218 bytes
+            self.assertEqual(
+                [len(args[1]) for args, _ in patched.call_args_list], sizes
+            )
+            self.assertEqual(len(self.servers[1].values), 10)
+
+    @mock.patch("memcload.__main__.MEMCACHE_RETRY_TIMEOUT_SECONDS", 0)
+    def test_selective_retry(self):
+        """Only failed keys are written again, failures are counted
+        """
+        lines = b"".join(b"adid\t%d\t0\t0\t1\n" % n for n in range(200))
+        self.write(lines)
+        server = self.servers[DeviceType.ADID.value]
+        # The first key is never stored, the second one on retry
+        server.failures[b"adid:0"] = 10
+        server.failures[b"adid:1"] = 1
+
+        with self.assertLogs(level="INFO") as cm:
+            process_file(self.path, self.addresses, False)
+
+        self.assertEqual(server.n_sets, 200 + 2 + 1)
+        self.assertEqual(len(server.values), 199)
+        self.assertIn("Cannot write 1 keys to Memcache", cm.output[1])
+        self.assertIn("Acceptable error rate: 0.005", cm.output[-1])
+
+    @mock.patch("memcload.__main__.MEMCACHE_RETRY_TIMEOUT_SECONDS", 0)
+    def test_error_rate(self):
+        """Invalid lines and failed writes are errors
+        """
+        self.write(b"idfa\t1\t0\t0\t1\nxxxx\t1\t0\t0\t1\n\n")
+        self.servers[0].failures[b"idfa:1"] = 10
+        with self.assertLogs(level="INFO") as cm:
+            process_file(self.path, self.addresses, False)
+        self.assertIn("High error rate: 1.0", cm.output[-1])
+
+        with self.assertLogs(level="INFO") as cm:
+            process_file(self.path, self.addresses, True)
+        self.assertIn("High error rate: 0.5", cm.output[-1])
+        self.assertEqual(self.servers[0].n_sets, 3)
+
+    @mock.patch("memcload.checkpoint.INTERVAL", 0)
+    @mock.patch("memcload.__main__.CHUNK_SIZE", 100)
+    def test_resume(self):
+        """Load stopped halfway is resumed from its checkpoint
+        """
+        lines = [b"idfa\t%d\t0\t0\t1" % n for n in range(100)]
+        lines[10] = b"xxxx\t1\t0\t0\t1"
+        self.write(b"\n".join(lines))
+        server = self.servers[0]
+
+        # Worker dies right after the third checkpoint
+        save = checkpoint.save
+        commits = []
+
+        def save_and_crash(fn, position, statuses):
+            save(fn, position, statuses)
+            commits.append(position)
+            if len(commits) == 3:
+                raise RuntimeError("Crash")
+
+        with mock.patch("memcload.checkpoint.save", save_and_crash):
+            with self.assertRaisesRegex(RuntimeError, "Crash"):
+                with self.assertLogs():
+                    process_file(self.path, self.addresses, False)
+
+        # Lines of the batches written before the crash are committed
+        saved = checkpoint.load(self.path)
+        self.assertEqual(saved.position, commits[-1])
+        n_lines = saved.position.n_lines
+        self.assertGreater(n_lines, 10)
+        self.assertLess(n_lines, 100)
+        self.assertEqual(sum(saved.statuses.values()), n_lines)
+        self.assertEqual(saved.statuses[ProcessingStatus.ERROR], 1)
+        for n in range(n_lines):
+            if n != 10:
+                self.assertIn(b"idfa:%d" % n, server.values)
+
+        n_sets = server.n_sets
+        with self.assertLogs(level="INFO") as cm:
+            process_file(self.path, self.addresses, False)
+        self.assertIn(f"from line {n_lines}", cm.output[1])
+        self.assertEqual(server.n_sets - n_sets, 100 - n_lines)
+        self.assertEqual(len(server.values), 99)
+        # Error rate counts lines loaded before the restart
+        self.assertIn("High error rate: 0.01", cm.output[-1])
+        self.assertEqual(
+            checkpoint.load(self.path).statuses,
+            Counter({ProcessingStatus.OK: 99, ProcessingStatus.ERROR: 1}),
+        )
+
+        n_sets = server.n_sets
+        with self.assertLogs(level="INFO"):
+            process_file(self.path, self.addresses, False, resume=False)
+        self.assertEqual(server.n_sets - n_sets, 99)
+
+    @mock.patch("memcload.__main__.CHUNK_SIZE", 1000)
+    def test_file_workers(self):
+        """Chunks of a file are loaded by worker processes
+        """
+        lines = [
+            b"%s\t%d\t0\t0\t1,2" % (dev_type, n)
+            for n in range(2000)
+            for dev_type in (b"idfa", b"gaid")
+        ]
+        lines[100] = b"xxxx\t1\t0\t0\t1"
+        lines[200] = b""
+        self.write(b"\n".join(lines) + b"\n")
+
+        with self.assertLogs(level="INFO") as cm:
+            process_file(self.path, self.addresses, False, n_workers=3)
+
+        self.assertEqual(len(self.servers[0].values), 1998)
+        self.assertEqual(len(self.servers[1].values), 2000)
+        self.assertIn("Acceptable error rate: 0.00025", cm.output[-1])
+        saved = checkpoint.load(self.path)
+        self.assertEqual(saved.position.n_lines, 4000)
+        self.assertEqual(
+            saved.statuses,
+            Counter(
+                {
+                    ProcessingStatus.OK: 3998,
+                    ProcessingStatus.ERROR: 1,
+                    ProcessingStatus.SKIP: 1,
+                }
+            ),
+        )
+
+        # Finished load is resumed from the end
+        with self.assertLogs(level="INFO") as cm:
+            process_file(self.path, self.addresses, False, n_workers=3)
+        self.assertEqual(self.servers[0].n_sets, 1998)
+        self.assertIn("Acceptable error rate: 0.00025", cm.output[-1])
+
+    def test_failed_file_worker(self):
+        """Error of a worker process is raised
+        """
+        self.write(b"idfa\t1\t0\t0\t1\n" * 100)
+        failing = mock.patch(
+            "memcload.parser.pack_parsed",
+            side_effect=ValueError("Broken"),
+        )
+        with failing, self.assertLogs(level="INFO"):
+            with self.assertRaisesRegex(RuntimeError, "Broken"):
+                process_file(self.path, self.addresses, False, n_workers=2)
+        self.assertEqual(self.servers[0].n_sets, 0)
+
+    def test_stats(self):
+        """Counters and timings of all processes are summed up
+        """
+        data = b"idfa\t1\t0\t0\t1\n\ngaid\t2\t0\t0\t1\n" * 1000
+        self.write(data)
+        self.servers[1].failures[b"gaid:2"] = 1
+        for n_workers in (1, 2):
+            stats = Stats()
+            with self.assertLogs(level="INFO"):
+                process_file(
+                    self.path,
+                    self.addresses,
+                    False,
+                    resume=False,
+                    n_workers=n_workers,
+                    stats=stats,
+                )
+            snapshot = stats.snapshot()
+            self.assertEqual(snapshot.counts["lines"], 3000)
+            self.assertEqual(snapshot.counts["bytes"], len(data))
+            self.assertEqual(
+                snapshot.counts["compressed"], os.path.getsize(self.path)
+            )
+            self.assertEqual(snapshot.counts["sets"], 2000)
+            self.assertEqual(snapshot.counts["skip"], 1000)
+            self.assertEqual(
+                set(snapshot.timings),
+                {"decompress", "parse", "serialize", "write"},
+            )
+            # Only the first load has to retry
+            self.assertEqual(
+                snapshot.counts["retries"], 1 if n_workers == 1 else 0
+            )
+            # The same key is written once by a batch
+            gaid = snapshot.nodes[self.addresses[1]]
+            self.assertEqual(gaid["sets"], 2 if n_workers == 1 else 1)
+            self.assertEqual(gaid["failed"], 1 if n_workers == 1 else 0)
+
+    def test_reporter(self):
+        """Progress lines and report tell rates and stage timings
+        """
+        self.write(b"dvid\t1\t0\t0\t1\n" * 10)
+        stats = Stats()
+        stats.add(lines=100, compressed=os.path.getsize(self.path) // 2)
+        with stats.timed("parse"):
+            time.sleep(0.01)
+        with self.assertLogs(level="INFO") as cm:
+            Reporter(self.path, stats).report()
+        self.assertRegex(
+            cm.output[0],
+            r"\[MainProcess\] .* \d+ lines/s, 0.00 MB/s, 0 sets/s, "
+            r"0 retries, ETA 0:00:00",
+        )
+
+        report = pathlib.Path(self.path).with_suffix(".json")
+        write_report(str(report), {self.path: stats.snapshot()}, 1.0)
+        total = json.loads(report.read_text())["total"]
+        self.assertEqual(total["elapsed"], 1.0)
+        self.assertEqual(total["counts"]["lines"], 100)
+        self.assertGreaterEqual(total["stages"]["parse"], 0.01)
+        self.assertEqual(total["stages"]["write"], 0)
+
+    def test_checkpoint(self):
+        """Checkpoint of a changed file is ignored
+        """
+        self.write(b"dvid\t1\t0\t0\t1")
+        statuses = Counter({ProcessingStatus.OK: 1})
+        checkpoint.save(self.path, Position(1, 15), statuses)
+        self.assertEqual(
+            checkpoint.load(self.path), (Position(1, 15), statuses)
+        )
+
+        self.write(b"dvid\t1\t0\t0\t1\n")
+        with self.assertLogs(level="WARNING") as cm:
+            self.assertIsNone(checkpoint.load(self.path))
+        self.assertIn("changed since checkpoint", cm.output[0])
+
+        with open(checkpoint.sidecar(self.path), "w") as fd:
+            fd.write("{")
+        with self.assertLogs(level="WARNING") as cm:
+            self.assertIsNone(checkpoint.load(self.path))
+        self.assertIn("Invalid checkpoint", cm.output[0])
+
+        checkpoint.remove(self.path)
+        checkpoint.remove(self.path)
+        self.assertIsNone(checkpoint.load(self.path))
+
+    def test_dry_run(self):
+        """Dry run doesn't write anything
+        """
+        self.write(b"dvid\t1\t0\t0\t1")
+        with self.assertLogs(level="INFO"):
+            process_file(self.path, self.addresses, True)
+        self.assertEqual(self.servers[3].n_sets, 0)
+        self.assertFalse(os.path.exists(checkpoint.sidecar(self.path)))
+
+    def test_null_sink(self):
+        """Records are dropped by the null sink as if they were stored
+        """
+        self.write(b"dvid\t1\t0\t0\t1\n" * 10)
+        stats = Stats()
+        with self.assertLogs(level="INFO") as cm:
+            process_file(
+                self.path, self.addresses, False, stats=stats, sink="null"
+            )
+        self.assertEqual(self.servers[3].n_sets, 0)
+        self.assertEqual(stats.snapshot().counts["sets"], 10)
+        self.assertIn("Acceptable error rate: 0.0", cm.output[-1])
+        self.assertFalse(os.path.exists(checkpoint.sidecar(self.path)))
+
+    def test_fake_sink(self):
+        """Files are replayed to fake servers and left in place
+        """
+        shutil.copy(SAMPLE, self.path)
+        report = pathlib.Path(self.path).with_suffix(".json")
+        options = types.SimpleNamespace(
+            pattern=self.path,
+            dry=False,
+            batch_size=5,
+            batch_bytes=1024,
+            resume=True,
+            file_workers=2,
+            sink="fake",
+            replay=3,
+            report=str(report),
+            idfa="127.0.0.1:1,127.0.0.1:2",
+            gaid="127.0.0.1:3",
+            adid="127.0.0.1:4",
+            dvid="127.0.0.1:5",
+        )
+        with self.assertLogs(level="INFO") as cm:
+            main(options)
+        self.assertIn("Loaded 60 lines of 3 files", cm.output[-1])
+
+        total = json.loads(report.read_text())["total"]
+        self.assertEqual(total["counts"]["sets"], 60)
+        self.assertEqual(len(total["nodes"]), 5)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(checkpoint.sidecar(self.path)))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,8 @@
 import logging
 
+from collections import Counter
 from enum import Enum
-from typing import List, NamedTuple
+from typing import List, NamedTuple, Tuple
 
 
 class DeviceType(Enum):
@@ -20,6 +21,27 @@ class ProcessingStatus(Enum):
     SKIP = 0
 
 
+# Index of a cluster of Memcached nodes and a key
+MemcacheKey = Tuple[int, str]
+# Key and serialized value
+Record = Tuple[MemcacheKey, bytes]
+
+
+class Position(NamedTuple):
+    # Lines of a file read so far
+    n_lines: int
+    # Uncompressed bytes of the lines
+    offset: int
+
+
+class Batch(NamedTuple):
+    records: List[Record]
+    # Statuses of lines without records
+    statuses: Counter
+    # Lines of a file up to the position are in the batch
+    position: Position
+
+
 class AppsInstalled(NamedTuple):
     dev_type: DeviceType
     dev_id: str